@@ -0,0 +1,60 @@
+"""
+Crea la tabella chat_non_letti e la popola dai messaggi non letti esistenti
+Uso: python add_chat_non_letti_table.py
+
+Per ogni richiesta con messaggi non letti, ogni partecipante (creatore,
+supervisore, autori della chat) riceve come contatore il numero di messaggi
+non letti scritti da altri. Rieseguibile: i contatori vengono ricalcolati.
+"""
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import delete, select
+
+from app.database import Base, SessionLocal, engine
+from app.models import ChatNonLetti, MessaggioChat, Richiesta
+
+
+def migrate():
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    Base.metadata.create_all(bind=engine, tables=[ChatNonLetti.__table__])
+
+    db = SessionLocal()
+    try:
+        richieste = {r.id: r for r in db.execute(select(Richiesta)).scalars()}
+        autori = {}
+        for richiesta_id, autore_id in db.execute(select(MessaggioChat.richiesta_id, MessaggioChat.autore_id)):
+            autori.setdefault(richiesta_id, set()).add(autore_id)
+
+        contatori = Counter()
+        non_letti = db.execute(
+            select(MessaggioChat.richiesta_id, MessaggioChat.autore_id).where(MessaggioChat.letto == False)
+        )
+        for richiesta_id, autore_id in non_letti:
+            richiesta = richieste.get(richiesta_id)
+            if richiesta is None:
+                continue
+            partecipanti = autori.get(richiesta_id, set()) | {richiesta.creato_da_id, richiesta.supervisore_id}
+            for utente_id in partecipanti - {None, autore_id}:
+                contatori[(utente_id, richiesta_id)] += 1
+
+        db.execute(delete(ChatNonLetti))
+        db.add_all([
+            ChatNonLetti(utente_id=utente_id, richiesta_id=richiesta_id, non_letti=n)
+            for (utente_id, richiesta_id), n in contatori.items()
+        ])
+        db.commit()
+        print(f"✅ Contatori creati: {len(contatori)}")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        db.rollback()
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
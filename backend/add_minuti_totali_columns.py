@@ -0,0 +1,40 @@
+"""
+Aggiunge minuti_totali ad attivita e richieste e li calcola dai time entry
+Uso: python add_minuti_totali_columns.py
+
+Rieseguibile: se le colonne esistono già i totali vengono solo ricalcolati
+(utile anche per riallineare dati modificati a mano).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+
+from app.database import engine
+from app.services.tempi import ricalcolo_minuti_totali
+
+
+def migrate():
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    try:
+        with engine.begin() as conn:
+            inspector = inspect(conn)
+            for tabella in ("attivita", "richieste"):
+                colonne = [c["name"] for c in inspector.get_columns(tabella)]
+                if "minuti_totali" in colonne:
+                    print(f"INFO: Column '{tabella}.minuti_totali' already exists. Skipping.")
+                else:
+                    print(f"Adding column '{tabella}.minuti_totali'...")
+                    conn.execute(text(f"ALTER TABLE {tabella} ADD COLUMN minuti_totali INTEGER NOT NULL DEFAULT 0"))
+            for stmt in ricalcolo_minuti_totali():
+                conn.execute(stmt)
+        print("✅ Migration successful: minuti_totali ricalcolati.")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,43 @@
+"""
+Crea gli indici definiti nei modelli mancanti su un database esistente.
+create_all() crea gli indici solo insieme alle tabelle nuove: questo script
+li aggiunge alle tabelle già presenti (SQLite e PostgreSQL).
+Uso: python add_missing_indexes.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect
+
+from app.database import Base, engine
+from app.models import models  # noqa: F401  (registra i modelli)
+
+
+def migrate():
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    inspector = inspect(engine)
+    tabelle = set(inspector.get_table_names())
+    creati = 0
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tabelle:
+            continue
+        esistenti = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in esistenti:
+                continue
+            # Le varianti per altri dialetti (ddl_if) vengono ignorate da create()
+            with engine.begin() as conn:
+                index.create(bind=conn)
+            if index.name in {ix["name"] for ix in inspect(engine).get_indexes(table.name)}:
+                print(f"Creato indice {index.name} su {table.name}")
+                esistenti.add(index.name)
+                creati += 1
+
+    print(f"✅ Indici creati: {creati}")
+
+
+if __name__ == "__main__":
+    migrate()
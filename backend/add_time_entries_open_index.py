@@ -0,0 +1,62 @@
+"""
+Crea l'indice unico parziale uq_time_entries_aperti su un database esistente
+Uso: python add_time_entries_open_index.py
+
+Prima di creare l'indice chiude i timer aperti duplicati per la stessa
+coppia (tecnico, attività), tipicamente doppi check-in dall'app: resta
+aperto il più vecchio, gli altri vengono chiusi con durata 0.
+Rieseguibile.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, select, update
+
+from app.database import engine
+from app.models import TimeEntry
+from app.models.models import TIME_ENTRY_APERTO
+
+INDEX_NAME = "uq_time_entries_aperti"
+
+
+def migrate():
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    if INDEX_NAME in {ix["name"] for ix in inspect(engine).get_indexes("time_entries")}:
+        print(f"INFO: Index '{INDEX_NAME}' already exists. Skipping.")
+        return
+
+    try:
+        with engine.begin() as conn:
+            aperti = conn.execute(
+                select(TimeEntry.id, TimeEntry.tecnico_id, TimeEntry.attivita_id, TimeEntry.inizio)
+                .where(TIME_ENTRY_APERTO)
+                .order_by(TimeEntry.tecnico_id, TimeEntry.attivita_id, TimeEntry.inizio, TimeEntry.id)
+            ).all()
+            visti = set()
+            duplicati = []
+            for entry in aperti:
+                chiave = (entry.tecnico_id, entry.attivita_id)
+                if chiave in visti:
+                    duplicati.append(entry)
+                visti.add(chiave)
+            for entry in duplicati:
+                conn.execute(
+                    update(TimeEntry)
+                    .where(TimeEntry.id == entry.id)
+                    .values(fine=entry.inizio, durata_minuti=0)
+                )
+            if duplicati:
+                print(f"Chiusi {len(duplicati)} timer aperti duplicati")
+
+            index = next(ix for ix in TimeEntry.__table__.indexes if ix.name == INDEX_NAME)
+            index.create(bind=conn)
+        print(f"✅ Migration successful: Index '{INDEX_NAME}' created.")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    migrate()
@@ -4,6 +4,7 @@ Configurazione database SQLAlchemy
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from .config import get_settings
 
 settings = get_settings()
@@ -26,6 +27,45 @@ else:
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def get_async_database_url(url: str) -> str:
+    """
+    Converte l'URL sync nel driver async equivalente:
+    sqlite -> aiosqlite, postgresql -> asyncpg
+    """
+    if url.startswith("sqlite+aiosqlite:") or url.startswith("postgresql+asyncpg:"):
+        return url
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg:", 1)
+    return url
+
+
+# Engine async (stesso database, driver non bloccante)
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or get_async_database_url(settings.DATABASE_URL)
+
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=10,
+        max_overflow=20
+    )
+
+# Session factory async
+# expire_on_commit=False: dopo il commit gli oggetti restano leggibili
+# senza lazy load (non permesso fuori dal contesto async)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Base per i modelli
 Base = declarative_base()
 
@@ -40,3 +80,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """
+    Dependency che fornisce una sessione database async.
+    Usare con: db: AsyncSession = Depends(get_async_db)
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
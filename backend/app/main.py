@@ -3,10 +3,17 @@ Entry point FastAPI - Piattaforma Gestione Ticket
 """
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .config import get_settings
 from .database import engine, Base
-from .routers import auth, clienti, ambiti, richieste, attivita, contratti, schedules, chat
+from .routers import auth, clienti, ambiti, richieste, attivita, contratti, schedules, chat, search, fatturazione, calendario, brogliaccio
+from .services.scheduler import get_scheduler
+from .services.validazione import get_validazione_automatica
+from .services.mail_queue import get_mail_queue
+from .services.email_templates import get_email_templates
+from .services.chat_hub import get_chat_hub
+from .utils import CompressionMiddleware
 # Import models per registrarli con Base
 from .models import models  # noqa
 
@@ -15,10 +22,25 @@ settings = get_settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Lifecycle: crea tabelle all'avvio"""
+    """Lifecycle: crea tabelle all'avvio, compila template, avvia scheduler, validazione automatica, coda email e push chat"""
     Base.metadata.create_all(bind=engine)
     print("[OK] Database tables created/verified")
+    templates = get_email_templates()
+    print(f"[OK] Template email compilati ({len(templates.templates)})")
+    get_mail_queue().start()
+    await get_chat_hub().start()
+    if settings.SCHEDULER_ENABLED:
+        await get_scheduler().start()
+    if settings.VALIDAZIONE_AUTOMATICA_ENABLED:
+        await get_validazione_automatica().start()
     yield
+    if settings.VALIDAZIONE_AUTOMATICA_ENABLED:
+        await get_validazione_automatica().stop()
+    if settings.SCHEDULER_ENABLED:
+        await get_scheduler().stop()
+    await get_chat_hub().stop()
+    # Invia le email ancora in coda prima di uscire
+    await get_mail_queue().stop(timeout=settings.SMTP_TIMEOUT_SECONDS)
 
 
 # Crea app FastAPI
@@ -28,6 +50,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    # orjson per tutte le risposte JSON (più veloce del json della stdlib sulle liste lunghe)
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -38,8 +62,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Disposition"],
 )
 
+# Compressione risposte (brotli/gzip) sopra COMPRESSION_MINIMUM_SIZE
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+        brotli_enabled=settings.COMPRESSION_BROTLI_ENABLED,
+    )
+
 
 # Health check endpoint
 @app.get("/health")
@@ -57,6 +92,10 @@ app.include_router(attivita, prefix="/api/attivita", tags=["Attività"])
 app.include_router(contratti, prefix="/api/contratti", tags=["Contratti"])
 app.include_router(schedules, prefix="/api/schedules", tags=["Schedulatore"])
 app.include_router(chat, prefix="/api/chat", tags=["Chat"])
+app.include_router(search, prefix="/api/search", tags=["Ricerca"])
+app.include_router(fatturazione, prefix="/api/fatturazione", tags=["Fatturazione"])
+app.include_router(calendario, prefix="/api/calendario", tags=["Calendario"])
+app.include_router(brogliaccio, prefix="/api/brogliaccio", tags=["Brogliaccio"])
 
 
 if __name__ == "__main__":
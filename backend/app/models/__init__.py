@@ -26,7 +26,14 @@ from .models import (
     UtilizzoContratto,
     Schedule,
     MessaggioChat,
+    ChatNonLetti,
+    Brogliaccio,
+    BrogliaccioEliminato,
+    BrogliaccioVersione,
+    BrogliaccioIdempotenza,
+    CalendarioEliminato,
 )
+from . import search_index  # noqa: F401  (indici full-text)
 
 __all__ = [
     "UserRole",
@@ -54,4 +61,10 @@ __all__ = [
     "UtilizzoContratto",
     "Schedule",
     "MessaggioChat",
+    "ChatNonLetti",
+    "Brogliaccio",
+    "BrogliaccioEliminato",
+    "BrogliaccioVersione",
+    "BrogliaccioIdempotenza",
+    "CalendarioEliminato",
 ]
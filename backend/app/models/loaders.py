@@ -0,0 +1,24 @@
+"""
+Strategie di caricamento delle relazioni per ciascun response model.
+Ogni tupla carica esattamente le relazioni serializzate dallo schema
+corrispondente, senza lazy load durante la validazione Pydantic.
+"""
+from sqlalchemy.orm import joinedload, selectinload
+
+from .models import Richiesta, Cliente, Contratto
+
+# RichiestaDetailResponse: cliente (many-to-one) + attivita (one-to-many)
+RICHIESTA_DETAIL_LOAD = (
+    joinedload(Richiesta.cliente),
+    selectinload(Richiesta.attivita),
+)
+
+# ClienteResponse: sedi
+CLIENTE_DETAIL_LOAD = (
+    selectinload(Cliente.sedi),
+)
+
+# ContrattoResponse: voci
+CONTRATTO_DETAIL_LOAD = (
+    selectinload(Contratto.voci),
+)
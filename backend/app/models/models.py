@@ -6,7 +6,7 @@ from datetime import datetime, date
 from typing import List, Optional
 from sqlalchemy import (
     Column, String, Boolean, Text, Integer, Numeric, 
-    DateTime, Date, ForeignKey, Enum as SQLEnum, JSON
+    DateTime, Date, ForeignKey, Enum as SQLEnum, JSON, Index
 )
 # Usiamo String per ID per compatibilità SQLite
 # In produzione con PostgreSQL, usare UUID
@@ -142,6 +142,8 @@ class Cliente(Base):
     ragione_sociale = Column(String(255), nullable=False)
     partita_iva = Column(String(20))
     codice_fiscale = Column(String(20))
+    nome_alternativo = Column(String(255), index=True)  # Alias / nome commerciale
+    codice_gestionale_esterno = Column(String(50), index=True)  # Codice nel gestionale contabile
     email_principale = Column(String(255), nullable=False)
     email_secondarie = Column(JSON)  # Lista di email come JSON
     telefoni = Column(JSON)  # Lista di telefoni come JSON
@@ -247,6 +249,8 @@ class Richiesta(Base):
     validata_da_id = Column(String(36), ForeignKey("utenti.id"))
     validata_il = Column(DateTime)
     scadenza_validazione = Column(Date)
+    # Tempo lavorato: somma dei minuti delle attività, aggiornata al checkout
+    minuti_totali = Column(Integer, nullable=False, default=0, server_default="0")
     # Riapertura
     riaperta_il = Column(DateTime)
     motivazione_riapertura = Column(Text)
@@ -258,6 +262,7 @@ class Richiesta(Base):
     cliente = relationship("Cliente", back_populates="richieste")
     attivita = relationship("Attivita", back_populates="richiesta", cascade="all, delete-orphan")
     messaggi = relationship("MessaggioChat", back_populates="richiesta", cascade="all, delete-orphan")
+    contatori_non_letti = relationship("ChatNonLetti", cascade="all, delete-orphan")
 
 
 # =============================================
@@ -282,6 +287,8 @@ class Attivita(Base):
     voce_contratto_id = Column(String(36))
     ore_addebitate = Column(Numeric(5, 2))
     allegati = Column(JSON)  # Lista allegati come JSON
+    # Tempo lavorato: somma di time_entries.durata_minuti, aggiornata al checkout
+    minuti_totali = Column(Integer, nullable=False, default=0, server_default="0")
     # Metadata
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -454,3 +461,154 @@ class MessaggioChat(Base):
     
     # Relationships
     richiesta = relationship("Richiesta", back_populates="messaggi")
+
+
+# =============================================
+# MODEL: Contatori messaggi non letti
+# =============================================
+class ChatNonLetti(Base):
+    """Messaggi chat non letti per utente e richiesta (aggiornato da send/mark-read)"""
+    __tablename__ = "chat_non_letti"
+    
+    utente_id = Column(String(36), ForeignKey("utenti.id", ondelete="CASCADE"), primary_key=True)
+    richiesta_id = Column(String(36), ForeignKey("richieste.id", ondelete="CASCADE"), primary_key=True)
+    non_letti = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# =============================================
+# MODEL: Brogliaccio (note rapide dell'utente)
+# =============================================
+class Brogliaccio(Base):
+    __tablename__ = "brogliaccio"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    utente_id = Column(String(36), ForeignKey("utenti.id", ondelete="CASCADE"), nullable=False)
+    contenuto = Column(Text, nullable=False)
+    tipo = Column(String(20), default="text")  # text | gps | ...
+    media_url = Column(String(500))
+    metadata_json = Column(JSON)
+    stato = Column(String(20), default="draft")
+    # Versione dell'utente all'ultima modifica (delta sync)
+    versione = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BrogliaccioEliminato(Base):
+    """Tombstone delle voci eliminate, per propagare le cancellazioni nel delta sync"""
+    __tablename__ = "brogliaccio_eliminati"
+    
+    id = Column(String(36), primary_key=True)  # id della voce eliminata
+    utente_id = Column(String(36), ForeignKey("utenti.id", ondelete="CASCADE"), nullable=False)
+    versione = Column(Integer, nullable=False)
+    eliminato_il = Column(DateTime, default=datetime.utcnow)
+
+
+class BrogliaccioVersione(Base):
+    """Contatore monotono per utente delle modifiche al brogliaccio"""
+    __tablename__ = "brogliaccio_versioni"
+    
+    utente_id = Column(String(36), ForeignKey("utenti.id", ondelete="CASCADE"), primary_key=True)
+    versione = Column(Integer, nullable=False, default=0)
+    # Tombstone fino a questa versione già rimosse: sotto serve una sincronizzazione completa
+    versione_minima = Column(Integer, nullable=False, default=0)
+
+
+class BrogliaccioIdempotenza(Base):
+    """Esiti delle operazioni batch per chiave del client (retry senza duplicati)"""
+    __tablename__ = "brogliaccio_idempotenza"
+    
+    utente_id = Column(String(36), ForeignKey("utenti.id", ondelete="CASCADE"), primary_key=True)
+    chiave = Column(String(100), primary_key=True)
+    esito = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# =============================================
+# MODEL: Eventi del calendario eliminati
+# =============================================
+class CalendarioEliminato(Base):
+    """Tombstone di richieste e attività eliminate, per il refresh con updated_since"""
+    __tablename__ = "calendario_eliminati"
+    
+    id = Column(String(36), primary_key=True)  # id dell'evento (richiesta o attività)
+    tipo = Column(String(20), nullable=False)  # richiesta | attivita
+    # Campi della richiesta usati dai filtri del calendario
+    creato_da_id = Column(String(36))
+    supervisore_id = Column(String(36))
+    ambito_id = Column(String(36))
+    eliminato_il = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+# =============================================
+# INDICI: Paginazione keyset (data DESC, id DESC)
+# =============================================
+def keyset_index(name: str, sort_column, id_column) -> None:
+    """
+    Indice per ORDER BY sort_column DESC NULLS LAST, id DESC.
+    PostgreSQL richiede l'ordinamento esplicito nell'indice,
+    SQLite (NULL già in fondo nei DESC) usa l'indice semplice.
+    """
+    Index(name, sort_column.desc().nulls_last(), id_column.desc()).ddl_if(dialect="postgresql")
+    Index(name, sort_column, id_column).ddl_if(dialect="sqlite")
+
+
+keyset_index("idx_richieste_created_at_id", Richiesta.created_at, Richiesta.id)
+keyset_index("idx_attivita_data_prevista_id", Attivita.data_prevista, Attivita.id)
+keyset_index("idx_contratti_clienti_created_at_id", ContrattoCliente.created_at, ContrattoCliente.id)
+
+
+# =============================================
+# INDICI: Calendario (finestra sulle date, refresh incrementale)
+# =============================================
+Index("idx_richieste_data_appuntamento", Richiesta.data_appuntamento)
+Index("idx_richieste_updated_at", Richiesta.updated_at)
+Index("idx_attivita_updated_at", Attivita.updated_at)
+Index("idx_calendario_eliminati_eliminato_il", CalendarioEliminato.eliminato_il)
+
+
+# =============================================
+# INDICI: Cronologia chat per richiesta
+# =============================================
+Index("idx_messaggi_richiesta_created_at", MessaggioChat.richiesta_id, MessaggioChat.created_at, MessaggioChat.id)
+
+
+# =============================================
+# INDICI: Brogliaccio (modifiche dopo una versione)
+# =============================================
+Index("idx_brogliaccio_utente_versione", Brogliaccio.utente_id, Brogliaccio.versione)
+Index("idx_brogliaccio_eliminati_utente_versione", BrogliaccioEliminato.utente_id, BrogliaccioEliminato.versione)
+
+
+# =============================================
+# INDICI: Clienti (duplicati per email e partita IVA: create e import)
+# =============================================
+Index("idx_clienti_email_principale", Cliente.email_principale)
+Index("idx_clienti_partita_iva", Cliente.partita_iva)
+# Sedi per cliente (anche nei trigger dell'indice di ricerca a ogni INSERT)
+Index("idx_sedi_clienti_cliente", SedeCliente.cliente_id)
+
+
+# =============================================
+# INDICI: Validazione automatica (risolte con scadenza passata)
+# =============================================
+Index("idx_richieste_stato_scadenza_validazione", Richiesta.stato, Richiesta.scadenza_validazione)
+
+# =============================================
+# INDICI: Registro monte ore
+# =============================================
+Index("idx_utilizzi_contratto_contratto", UtilizzoContratto.contratto_cliente_id, UtilizzoContratto.created_at)
+Index("idx_utilizzi_contratto_attivita", UtilizzoContratto.attivita_id)
+
+# =============================================
+# INDICI: Timer aperti (check-in atomico e timer attivo per tecnico)
+# =============================================
+TIME_ENTRY_APERTO = TimeEntry.fine.is_(None)
+
+Index(
+    "uq_time_entries_aperti", TimeEntry.tecnico_id, TimeEntry.attivita_id,
+    unique=True,
+    postgresql_where=TIME_ENTRY_APERTO,
+    sqlite_where=TIME_ENTRY_APERTO,
+)
@@ -0,0 +1,205 @@
+"""
+Indici di ricerca full-text su clienti, richieste e utenti
+
+PostgreSQL: indici GIN su espressioni to_tsvector (le query usano le stesse
+espressioni definite qui) e trigram (pg_trgm) sulla ragione sociale.
+SQLite: tabelle FTS5 (clienti_fts, richieste_fts, utenti_fts) con rowid
+preso da una tabella <fts>_chiavi (rowid intero stabile -> id della riga),
+mantenute da trigger. Vengono create e popolate da create_all se mancanti,
+anche su database esistenti.
+"""
+from sqlalchemy import DDL, Index, event, func, literal_column, text
+
+from ..database import Base
+from .models import Cliente, SedeCliente, Richiesta, Utente
+
+# Configurazioni text search PostgreSQL
+TS_SIMPLE = literal_column("'simple'::regconfig")
+TS_ITALIAN = literal_column("'italian'::regconfig")
+
+# Costanti inline (non parametri): l'espressione della query deve essere
+# identica a quella dell'indice anche con statement preparati
+_VUOTO = literal_column("''")
+_SPAZIO = literal_column("' '")
+
+
+def _concat(*columns):
+    """coalesce(a, '') || ' ' || coalesce(b, '') ..."""
+    expr = func.coalesce(columns[0], _VUOTO)
+    for column in columns[1:]:
+        expr = expr.op("||")(_SPAZIO).op("||")(func.coalesce(column, _VUOTO))
+    return expr
+
+
+def cliente_tsvector():
+    return func.to_tsvector(TS_SIMPLE, _concat(
+        Cliente.ragione_sociale, Cliente.partita_iva, Cliente.codice_fiscale, Cliente.email_principale
+    ))
+
+
+def sede_tsvector():
+    return func.to_tsvector(TS_SIMPLE, func.coalesce(SedeCliente.citta, _VUOTO))
+
+
+def richiesta_tsvector():
+    return func.to_tsvector(TS_ITALIAN, func.coalesce(Richiesta.descrizione, _VUOTO))
+
+
+def utente_tsvector():
+    return func.to_tsvector(TS_SIMPLE, _concat(Utente.nome, Utente.cognome, Utente.email))
+
+
+# =============================================
+# PostgreSQL
+# =============================================
+event.listen(
+    Base.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+
+def _gin_index(name: str, table, expression) -> None:
+    """Indice GIN su espressione (solo PostgreSQL), legato esplicitamente alla tabella"""
+    table.append_constraint(Index(name, expression, postgresql_using="gin").ddl_if(dialect="postgresql"))
+
+
+_gin_index("idx_clienti_fts", Cliente.__table__, cliente_tsvector())
+_gin_index("idx_sedi_clienti_citta_fts", SedeCliente.__table__, sede_tsvector())
+_gin_index("idx_richieste_fts", Richiesta.__table__, richiesta_tsvector())
+_gin_index("idx_utenti_fts", Utente.__table__, utente_tsvector())
+Index(
+    "idx_clienti_ragione_sociale_trgm", Cliente.ragione_sociale,
+    postgresql_using="gin", postgresql_ops={"ragione_sociale": "gin_trgm_ops"}
+).ddl_if(dialect="postgresql")
+
+
+# =============================================
+# SQLite (FTS5)
+# =============================================
+TOKENIZER = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+# Città delle sedi di un cliente, per la colonna citta di clienti_fts
+_CITTA_CLIENTE = "(SELECT group_concat(citta, ' ') FROM sedi_clienti WHERE cliente_id = {id})"
+
+# Le tabelle di origine hanno chiave primaria stringa: il loro rowid implicito
+# può cambiare con VACUUM. Il rowid FTS è quello di una tabella <fts>_chiavi
+# (INTEGER PRIMARY KEY, stabile) che lo associa all'id della riga.
+FTS_TABLES = {
+    "clienti_fts": {
+        "columns": ["ragione_sociale", "partita_iva", "codice_fiscale", "email_principale", "citta"],
+        "source": "clienti",
+        "values": [
+            "clienti.ragione_sociale", "clienti.partita_iva", "clienti.codice_fiscale",
+            "clienti.email_principale", _CITTA_CLIENTE.format(id="clienti.id"),
+        ],
+    },
+    "richieste_fts": {
+        "columns": ["descrizione"],
+        "source": "richieste",
+        "values": ["richieste.descrizione"],
+    },
+    "utenti_fts": {
+        "columns": ["nome", "cognome", "email"],
+        "source": "utenti",
+        "values": ["utenti.nome", "utenti.cognome", "utenti.email"],
+    },
+}
+
+
+def tabella_chiavi(fts: str) -> str:
+    """Tabella rowid FTS -> id della riga di origine"""
+    return f"{fts}_chiavi"
+
+
+def _rowid(fts: str, id_expr: str) -> str:
+    return f"(SELECT rowid FROM {tabella_chiavi(fts)} WHERE id = {id_expr})"
+
+
+def _trigger_sync(fts: str) -> list:
+    """Trigger insert/update/delete che tengono la tabella FTS allineata all'origine"""
+    config = FTS_TABLES[fts]
+    source, columns, chiavi = config["source"], config["columns"], tabella_chiavi(fts)
+    values = [v.replace(f"{source}.", "NEW.") for v in config["values"]]
+    column_list = ", ".join(columns)
+    assignments = ", ".join(f"{c} = {v}" for c, v in zip(columns, values))
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {chiavi}(id) VALUES (NEW.id); "
+        f"INSERT INTO {fts}(rowid, {column_list}) VALUES ({_rowid(fts, 'NEW.id')}, {', '.join(values)}); END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_au AFTER UPDATE ON {source} BEGIN "
+        f"UPDATE {fts} SET {assignments} WHERE rowid = {_rowid(fts, 'NEW.id')}; END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_ad AFTER DELETE ON {source} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = {_rowid(fts, 'OLD.id')}; "
+        f"DELETE FROM {chiavi} WHERE id = OLD.id; END",
+    ]
+
+
+def _trigger_sedi() -> list:
+    """Le modifiche alle sedi aggiornano la colonna citta del cliente"""
+    aggiorna = (
+        "UPDATE clienti_fts SET citta = " + _CITTA_CLIENTE.format(id="{ref}.cliente_id")
+        + " WHERE rowid = " + _rowid("clienti_fts", "{ref}.cliente_id") + ";"
+    )
+    return [
+        "CREATE TRIGGER IF NOT EXISTS trg_sedi_fts_ai AFTER INSERT ON sedi_clienti BEGIN "
+        + aggiorna.format(ref="NEW") + " END",
+        "CREATE TRIGGER IF NOT EXISTS trg_sedi_fts_au AFTER UPDATE ON sedi_clienti BEGIN "
+        + aggiorna.format(ref="OLD") + " " + aggiorna.format(ref="NEW") + " END",
+        "CREATE TRIGGER IF NOT EXISTS trg_sedi_fts_ad AFTER DELETE ON sedi_clienti BEGIN "
+        + aggiorna.format(ref="OLD") + " END",
+    ]
+
+
+TRIGGER_SEDI = ("trg_sedi_fts_ai", "trg_sedi_fts_au", "trg_sedi_fts_ad")
+
+
+def create_sqlite_search_index(connection) -> None:
+    """
+    Crea (e popola se nuove) le tabelle FTS5 e i relativi trigger. Se manca
+    la tabella FTS o quella delle chiavi (layout precedente, legato al rowid
+    dell'origine) entrambe vengono ricostruite insieme ai trigger.
+    """
+    esistenti = {
+        row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+    }
+    for fts, config in FTS_TABLES.items():
+        source, columns, chiavi = config["source"], config["columns"], tabella_chiavi(fts)
+        if source not in esistenti:
+            continue
+        if fts not in esistenti or chiavi not in esistenti:
+            for trigger in ("ai", "au", "ad"):
+                connection.execute(text(f"DROP TRIGGER IF EXISTS trg_{fts}_{trigger}"))
+            if fts == "clienti_fts":
+                for trigger in TRIGGER_SEDI:
+                    connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            connection.execute(text(f"DROP TABLE IF EXISTS {fts}"))
+            connection.execute(text(f"DROP TABLE IF EXISTS {chiavi}"))
+            connection.execute(text(f"CREATE TABLE {chiavi} (rowid INTEGER PRIMARY KEY, id VARCHAR(36) NOT NULL UNIQUE)"))
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columns)}, {TOKENIZER})"
+            ))
+            connection.execute(text(f"INSERT INTO {chiavi}(id) SELECT id FROM {source}"))
+            connection.execute(text(
+                f"INSERT INTO {fts}(rowid, {', '.join(columns)}) "
+                f"SELECT {chiavi}.rowid, {', '.join(config['values'])} "
+                f"FROM {source} JOIN {chiavi} ON {chiavi}.id = {source}.id"
+            ))
+        for trigger in _trigger_sync(fts):
+            connection.execute(text(trigger))
+    if {"clienti", "sedi_clienti"} <= esistenti:
+        for trigger in _trigger_sedi():
+            connection.execute(text(trigger))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        create_sqlite_search_index(connection)
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def _before_drop(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        for fts in FTS_TABLES:
+            connection.execute(text(f"DROP TABLE IF EXISTS {fts}"))
+            connection.execute(text(f"DROP TABLE IF EXISTS {tabella_chiavi(fts)}"))
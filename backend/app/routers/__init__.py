@@ -6,3 +6,7 @@ from .attivita import router as attivita
 from .contratti import router as contratti
 from .schedules import router as schedules
 from .chat import router as chat
+from .search import router as search
+from .fatturazione import router as fatturazione
+from .calendario import router as calendario
+from .brogliaccio import router as brogliaccio
@@ -2,12 +2,13 @@
 Router CRUD Ambiti
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from ..models import Ambito, Utente
 from ..schemas import AmbitoCreate, AmbitoUpdate, AmbitoResponse
+from ..services.catalog_cache import AMBITI, catalog_response, invalidate_catalog
 from ..utils import get_current_user, require_admin
 
 router = APIRouter()
@@ -15,15 +16,19 @@ router = APIRouter()
 
 @router.get("/", response_model=List[AmbitoResponse])
 async def list_ambiti(
+    request: Request,
     attivo: Optional[bool] = None,
     current_user: Utente = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Lista ambiti"""
-    query = db.query(Ambito)
-    if attivo is not None:
-        query = query.filter(Ambito.attivo == attivo)
-    return query.all()
+    """Lista ambiti (da cache, invalidata dalle modifiche)"""
+    def carica():
+        query = db.query(Ambito)
+        if attivo is not None:
+            query = query.filter(Ambito.attivo == attivo)
+        return query.all()
+
+    return await catalog_response(request, AMBITI, attivo, AmbitoResponse, carica)
 
 
 @router.get("/{ambito_id}", response_model=AmbitoResponse)
@@ -58,6 +63,7 @@ async def create_ambito(
     db.add(new_ambito)
     db.commit()
     db.refresh(new_ambito)
+    await invalidate_catalog(AMBITI)
     return new_ambito
 
 
@@ -79,6 +85,7 @@ async def update_ambito(
     
     db.commit()
     db.refresh(ambito)
+    await invalidate_catalog(AMBITI)
     return ambito
 
 
@@ -95,3 +102,4 @@ async def delete_ambito(
     
     ambito.attivo = False
     db.commit()
+    await invalidate_catalog(AMBITI)
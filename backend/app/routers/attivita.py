@@ -3,20 +3,40 @@ Router CRUD Attività con timer
 """
 from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
-from ..models import Attivita, TimeEntry, Richiesta, Utente, StatoAttivita, StatoRichiesta
+from ..database import get_async_db
+from ..models import (
+    Attivita, TimeEntry, Richiesta, Utente, ContrattoCliente,
+    StatoAttivita, StatoRichiesta, TipoAddebito, TipoContratto, UserRole
+)
+from ..models.models import TIME_ENTRY_APERTO
 from ..schemas import (
     AttivitaCreate, AttivitaUpdate, AttivitaResponse,
-    AttivitaTransizioneStato, AttivitaAddebito,
+    AttivitaTransizioneStato, AttivitaTransizioneBulk, AttivitaAddebito,
+    TransizioneBulkResponse,
     TimeEntryCreate, TimeEntryCheckout, TimeEntryResponse
 )
-from ..utils import get_current_user, require_tecnico
+from ..services.monte_ore import allinea_addebito_attivita, invia_alert_monte_ore
+from ..services.tempi import aggiungi_minuti
+from ..services.transizioni import applica_transizioni
+from ..services.validazione import scadenza_validazione
+from ..utils import (
+    get_current_user, require_tecnico,
+    keyset_order, keyset_filter, set_next_cursor,
+    NEXT_CURSOR_HEADER, rows_etag, etag_matches, not_modified,
+    colonne_risposta, righe_dict, json_response
+)
 
 router = APIRouter()
 
+# Colonne di AttivitaResponse per le liste (righe senza istanze ORM, vedi utils/serialization)
+COLONNE_LISTA = colonne_risposta(Attivita, AttivitaResponse)
+
 
 # Transizioni stato attività
 TRANSIZIONI_ATTIVITA = {
@@ -28,32 +48,72 @@ TRANSIZIONI_ATTIVITA = {
 
 @router.get("/", response_model=List[AttivitaResponse])
 async def list_attivita(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Cursore da X-Next-Cursor (ignora skip)"),
     richiesta_id: Optional[str] = None,
     stato: Optional[StatoAttivita] = None,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista attività con filtri"""
-    query = db.query(Attivita)
+    """Lista attività con filtri (skip/limit oppure cursor, vedi X-Next-Cursor; ETag da updated_at)"""
+    query = select(*COLONNE_LISTA)
     
     if richiesta_id:
-        query = query.filter(Attivita.richiesta_id == richiesta_id)
+        query = query.where(Attivita.richiesta_id == richiesta_id)
     if stato:
-        query = query.filter(Attivita.stato == stato)
+        query = query.where(Attivita.stato == stato)
+    
+    query = query.order_by(*keyset_order(Attivita.data_prevista, Attivita.id))
+    if cursor:
+        query = query.where(keyset_filter(Attivita.data_prevista, Attivita.id, cursor))
+    else:
+        query = query.offset(skip)
+    
+    result = await db.execute(query.limit(limit))
+    attivita = result.all()
+    set_next_cursor(response, attivita, limit, "data_prevista")
+    etag = rows_etag(attivita, response.headers.get(NEXT_CURSOR_HEADER))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return json_response(righe_dict(attivita, COLONNE_LISTA), response)
+
+
+@router.get("/timer-attivo", response_model=List[TimeEntryResponse])
+async def get_timer_attivo(
+    tecnico_id: Optional[str] = Query(None, description="Solo supervisore/admin (default: utente corrente)"),
+    current_user: Utente = Depends(require_tecnico()),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Time entry aperti del tecnico (indice uq_time_entries_aperti)"""
+    if tecnico_id and tecnico_id != current_user.id:
+        if current_user.ruolo not in (UserRole.admin, UserRole.supervisore):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo supervisore o admin possono vedere i timer di altri tecnici"
+            )
+    else:
+        tecnico_id = current_user.id
     
-    return query.order_by(Attivita.data_prevista.desc()).offset(skip).limit(limit).all()
+    result = await db.execute(
+        select(TimeEntry)
+        .where(TimeEntry.tecnico_id == tecnico_id, TIME_ENTRY_APERTO)
+        .order_by(TimeEntry.inizio)
+    )
+    return result.scalars().all()
 
 
 @router.get("/{attivita_id}", response_model=AttivitaResponse)
 async def get_attivita(
     attivita_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Dettaglio attività"""
-    attivita = db.query(Attivita).filter(Attivita.id == attivita_id).first()
+    attivita = await db.get(Attivita, attivita_id)
     if not attivita:
         raise HTTPException(status_code=404, detail="Attività non trovata")
     return attivita
@@ -63,11 +123,11 @@ async def get_attivita(
 async def create_attivita(
     attivita_data: AttivitaCreate,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crea nuova attività"""
     # Verifica richiesta esiste
-    richiesta = db.query(Richiesta).filter(Richiesta.id == attivita_data.richiesta_id).first()
+    richiesta = await db.get(Richiesta, attivita_data.richiesta_id)
     if not richiesta:
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     
@@ -86,8 +146,8 @@ async def create_attivita(
     if richiesta.stato == StatoRichiesta.da_gestire:
         richiesta.stato = StatoRichiesta.in_gestione
     
-    db.commit()
-    db.refresh(new_attivita)
+    await db.commit()
+    await db.refresh(new_attivita)
     return new_attivita
 
 
@@ -96,10 +156,10 @@ async def update_attivita(
     attivita_id: str,
     attivita_data: AttivitaUpdate,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiorna attività"""
-    attivita = db.query(Attivita).filter(Attivita.id == attivita_id).first()
+    attivita = await db.get(Attivita, attivita_id)
     if not attivita:
         raise HTTPException(status_code=404, detail="Attività non trovata")
     
@@ -107,8 +167,8 @@ async def update_attivita(
     for key, value in update_data.items():
         setattr(attivita, key, value)
     
-    db.commit()
-    db.refresh(attivita)
+    await db.commit()
+    await db.refresh(attivita)
     return attivita
 
 
@@ -117,10 +177,10 @@ async def transizione_stato_attivita(
     attivita_id: str,
     transizione: AttivitaTransizioneStato,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cambia stato attività"""
-    attivita = db.query(Attivita).filter(Attivita.id == attivita_id).first()
+    attivita = await db.get(Attivita, attivita_id)
     if not attivita:
         raise HTTPException(status_code=404, detail="Attività non trovata")
     
@@ -136,78 +196,146 @@ async def transizione_stato_attivita(
     
     # Se completata e risolutiva, aggiorna richiesta
     if transizione.nuovo_stato == StatoAttivita.completata and attivita.risolutiva:
-        richiesta = db.query(Richiesta).filter(Richiesta.id == attivita.richiesta_id).first()
+        richiesta = await db.get(Richiesta, attivita.richiesta_id)
         if richiesta and richiesta.stato == StatoRichiesta.in_gestione:
             richiesta.stato = StatoRichiesta.risolta
+            richiesta.scadenza_validazione = scadenza_validazione()
     
-    db.commit()
-    db.refresh(attivita)
+    await db.commit()
+    await db.refresh(attivita)
     return attivita
 
 
+@router.post("/transizione-bulk", response_model=TransizioneBulkResponse)
+async def transizione_stato_attivita_bulk(
+    transizione: AttivitaTransizioneBulk,
+    current_user: Utente = Depends(require_tecnico()),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Cambia stato a più attività (stesse regole di /transizione).
+    Le attività risolutive completate portano la richiesta in gestione a risolta.
+    """
+    esiti = await applica_transizioni(
+        db, Attivita, transizione.ids, transizione.nuovo_stato, TRANSIZIONI_ATTIVITA
+    )
+    
+    aggiornate = [e["id"] for e in esiti if e["ok"]]
+    if transizione.nuovo_stato == StatoAttivita.completata and aggiornate:
+        await db.execute(
+            update(Richiesta)
+            .where(
+                Richiesta.stato == StatoRichiesta.in_gestione,
+                Richiesta.id.in_(
+                    select(Attivita.richiesta_id).where(
+                        Attivita.id.in_(aggiornate),
+                        Attivita.risolutiva == True
+                    )
+                )
+            )
+            .values(stato=StatoRichiesta.risolta, scadenza_validazione=scadenza_validazione())
+            .execution_options(synchronize_session=False)
+        )
+    
+    await db.commit()
+    return {
+        "nuovo_stato": transizione.nuovo_stato,
+        "aggiornate": len(aggiornate),
+        "esiti": esiti
+    }
+
+
 @router.post("/{attivita_id}/addebito", response_model=AttivitaResponse)
 async def set_addebito(
     attivita_id: str,
     addebito: AttivitaAddebito,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Imposta tipo addebito attività"""
-    attivita = db.query(Attivita).filter(Attivita.id == attivita_id).first()
+    """
+    Imposta tipo addebito attività.
+    Per il monte ore scala le ore dal contratto (registro utilizzi_contratto),
+    stornando quanto già scalato se l'addebito cambia.
+    """
+    attivita = await db.get(Attivita, attivita_id)
     if not attivita:
         raise HTTPException(status_code=404, detail="Attività non trovata")
     
+    if addebito.tipo_addebito == TipoAddebito.monte_ore:
+        if not addebito.contratto_cliente_id:
+            raise HTTPException(status_code=400, detail="Contratto obbligatorio per addebito a monte ore")
+        contratto = await db.get(ContrattoCliente, addebito.contratto_cliente_id)
+        richiesta = await db.get(Richiesta, attivita.richiesta_id)
+        if not contratto or contratto.tipo != TipoContratto.monte_ore:
+            raise HTTPException(status_code=400, detail="Contratto monte ore non trovato")
+        if richiesta and contratto.cliente_id != richiesta.cliente_id:
+            raise HTTPException(status_code=400, detail="Il contratto non appartiene al cliente della richiesta")
+    
     attivita.tipo_addebito = addebito.tipo_addebito
     attivita.contratto_cliente_id = addebito.contratto_cliente_id
     attivita.voce_contratto_id = addebito.voce_contratto_id
     attivita.ore_addebitate = addebito.ore_addebitate
     
-    db.commit()
-    db.refresh(attivita)
+    esiti = await allinea_addebito_attivita(db, attivita, current_user.id)
+    
+    await db.commit()
+    await invia_alert_monte_ore(db, esiti)
+    await db.refresh(attivita)
     return attivita
 
 
 # =============================================
 # TIME ENTRIES (Timer)
 # =============================================
+def _insert_time_entry(db: AsyncSession):
+    """INSERT con supporto ON CONFLICT per il dialetto della sessione"""
+    if db.bind.dialect.name == "postgresql":
+        return pg_insert(TimeEntry)
+    return sqlite_insert(TimeEntry)
+
+
 @router.post("/{attivita_id}/checkin", response_model=TimeEntryResponse)
 async def checkin(
     attivita_id: str,
     checkin_data: TimeEntryCreate,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Check-in su attività (avvia timer)"""
-    attivita = db.query(Attivita).filter(Attivita.id == attivita_id).first()
+    """
+    Check-in su attività (avvia timer).
+    L'indice unico parziale uq_time_entries_aperti garantisce un solo timer
+    aperto per tecnico e attività anche con richieste concorrenti.
+    """
+    attivita = await db.get(Attivita, attivita_id)
     if not attivita:
         raise HTTPException(status_code=404, detail="Attività non trovata")
     
-    # Verifica non ci siano time entry aperti
-    open_entry = db.query(TimeEntry).filter(
-        TimeEntry.attivita_id == attivita_id,
-        TimeEntry.tecnico_id == current_user.id,
-        TimeEntry.fine.is_(None)
-    ).first()
-    if open_entry:
-        raise HTTPException(status_code=400, detail="Timer già attivo per questa attività")
-    
-    new_entry = TimeEntry(
-        attivita_id=attivita_id,
-        tecnico_id=current_user.id,
-        inizio=datetime.utcnow(),
-        latitudine_inizio=checkin_data.latitudine,
-        longitudine_inizio=checkin_data.longitudine,
-        note=checkin_data.note
+    result = await db.execute(
+        _insert_time_entry(db)
+        .values(
+            attivita_id=attivita_id,
+            tecnico_id=current_user.id,
+            inizio=datetime.utcnow(),
+            latitudine_inizio=checkin_data.latitudine,
+            longitudine_inizio=checkin_data.longitudine,
+            note=checkin_data.note
+        )
+        .on_conflict_do_nothing(
+            index_elements=[TimeEntry.tecnico_id, TimeEntry.attivita_id],
+            index_where=TIME_ENTRY_APERTO
+        )
+        .returning(TimeEntry.id)
     )
-    db.add(new_entry)
+    entry_id = result.scalar_one_or_none()
+    if entry_id is None:
+        raise HTTPException(status_code=400, detail="Timer già attivo per questa attività")
     
     # Passa attività a in_lavorazione se programmata
     if attivita.stato == StatoAttivita.programmata:
         attivita.stato = StatoAttivita.in_lavorazione
     
-    db.commit()
-    db.refresh(new_entry)
-    return new_entry
+    await db.commit()
+    return await db.get(TimeEntry, entry_id)
 
 
 @router.post("/{attivita_id}/checkout", response_model=TimeEntryResponse)
@@ -215,34 +343,55 @@ async def checkout(
     attivita_id: str,
     checkout_data: TimeEntryCheckout,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Check-out da attività (stoppa timer)"""
-    # Trova time entry aperto
-    entry = db.query(TimeEntry).filter(
-        TimeEntry.attivita_id == attivita_id,
-        TimeEntry.tecnico_id == current_user.id,
-        TimeEntry.fine.is_(None)
-    ).first()
-    if not entry:
+    """
+    Check-out da attività (stoppa timer).
+    Chiude il time entry aperto con un solo UPDATE: di due checkout
+    concorrenti solo il primo trova il timer ancora aperto.
+    """
+    fine = datetime.utcnow()
+    result = await db.execute(
+        update(TimeEntry)
+        .where(
+            TimeEntry.attivita_id == attivita_id,
+            TimeEntry.tecnico_id == current_user.id,
+            TIME_ENTRY_APERTO
+        )
+        .values(fine=fine)
+        .returning(TimeEntry.id, TimeEntry.inizio)
+        .execution_options(synchronize_session=False)
+    )
+    chiuso = result.one_or_none()
+    if chiuso is None:
         raise HTTPException(status_code=400, detail="Nessun timer attivo per questa attività")
     
-    entry.fine = datetime.utcnow()
-    entry.durata_minuti = int((entry.fine - entry.inizio).total_seconds() / 60)
+    durata_minuti = int((fine - chiuso.inizio).total_seconds() / 60)
+    valori = {"durata_minuti": durata_minuti}
     if checkout_data.note:
-        entry.note = checkout_data.note
+        valori["note"] = checkout_data.note
+    await db.execute(
+        update(TimeEntry)
+        .where(TimeEntry.id == chiuso.id)
+        .values(**valori)
+        .execution_options(synchronize_session=False)
+    )
     
-    db.commit()
-    db.refresh(entry)
-    return entry
+    # Totali di attività e richiesta nella stessa transazione
+    await aggiungi_minuti(db, attivita_id, durata_minuti)
+    
+    await db.commit()
+    return await db.get(TimeEntry, chiuso.id)
 
 
 @router.get("/{attivita_id}/time-entries", response_model=List[TimeEntryResponse])
 async def get_time_entries(
     attivita_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista time entries per attività"""
-    entries = db.query(TimeEntry).filter(TimeEntry.attivita_id == attivita_id).all()
-    return entries
+    result = await db.execute(
+        select(TimeEntry).where(TimeEntry.attivita_id == attivita_id)
+    )
+    return result.scalars().all()
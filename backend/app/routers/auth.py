@@ -168,12 +168,13 @@ async def change_password(
     db: Session = Depends(get_db)
 ):
     """Cambio password utente corrente"""
-    if not verify_password(old_password, current_user.password_hash):
+    user = db.query(Utente).filter(Utente.id == current_user.id).first()
+    if not verify_password(old_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Password attuale non corretta"
         )
     
-    current_user.password_hash = get_password_hash(new_password)
+    user.password_hash = get_password_hash(new_password)
     db.commit()
     return {"message": "Password aggiornata con successo"}
@@ -1,96 +1,170 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models.models import Brogliaccio, Utente
-from ..schemas import schemas
-from .auth import get_current_user
+"""
+Router Brogliaccio: note rapide dell'utente
+Oltre al CRUD espone il delta sync (modifiche dopo una versione, con gli id
+eliminati) e un WebSocket che notifica la nuova versione a ogni modifica.
+"""
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import AsyncSessionLocal, get_async_db
+from ..models import Brogliaccio, Utente
+from ..schemas import (
+    BrogliaccioCreate, BrogliaccioUpdate, BrogliaccioResponse, BrogliaccioModifiche,
+    BrogliaccioBatch, BrogliaccioBatchResponse
+)
+from ..services.brogliaccio import (
+    ChiaviInElaborazione, applica_batch, campi_nulli, canale_brogliaccio, modifiche,
+    notifica_versione, prossima_versione, registra_eliminazioni
+)
+from ..services.chat_hub import inoltra_eventi
+from ..utils import get_current_user, get_user_from_token
 
 router = APIRouter()
 
-@router.get("/", response_model=List[schemas.BrogliaccioResponse])
+
+async def _get_voce(db: AsyncSession, entry_id: str, utente_id: str) -> Brogliaccio:
+    result = await db.execute(
+        select(Brogliaccio).where(Brogliaccio.id == entry_id, Brogliaccio.utente_id == utente_id)
+    )
+    entry = result.scalar_one_or_none()
+    if not entry:
+        raise HTTPException(status_code=404, detail="Voce non trovata")
+    return entry
+
+
+@router.get("/", response_model=List[BrogliaccioResponse])
 async def get_brogliaccio(
-    status: Optional[str] = "draft",  # Default to showing drafts
-    db: Session = Depends(get_db),
-    current_user: Utente = Depends(get_current_user)
+    status: str = Query("draft", description="Stato delle voci, 'all' per tutte"),
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Recupera le voci del brogliaccio dell'utente corrente.
-    Default: mostra solo 'draft'.
+    Voci del brogliaccio dell'utente corrente (default: solo 'draft').
+    Per tenere aggiornata la bacheca usare /modifiche.
     """
-    query = db.query(Brogliaccio).filter(Brogliaccio.utente_id == current_user.id)
-    
+    query = select(Brogliaccio).where(Brogliaccio.utente_id == current_user.id)
     if status != "all":
-        query = query.filter(Brogliaccio.stato == status)
-        
-    return query.order_by(Brogliaccio.created_at.desc()).all()
+        query = query.where(Brogliaccio.stato == status)
+    result = await db.execute(query.order_by(Brogliaccio.created_at.desc()).limit(limit))
+    return result.scalars().all()
 
 
-@router.post("/", response_model=schemas.BrogliaccioResponse, status_code=status.HTTP_201_CREATED)
-async def create_brogliaccio_entry(
-    entry: schemas.BrogliaccioCreate,
-    db: Session = Depends(get_db),
-    current_user: Utente = Depends(get_current_user)
+@router.get("/modifiche", response_model=BrogliaccioModifiche)
+async def get_modifiche_brogliaccio(
+    da_versione: int = Query(0, ge=0, description="Ultima versione ricevuta (0 = elenco completo)"),
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Crea una nuova voce nel brogliaccio
+    Delta sync: voci create o modificate e id eliminati dopo da_versione.
+    Con completo=True la risposta contiene tutte le voci e sostituisce lo
+    stato del client (prima sincronizzazione o versione troppo vecchia).
     """
+    return await modifiche(db, current_user.id, da_versione)
+
+
+@router.post("/", response_model=BrogliaccioResponse, status_code=status.HTTP_201_CREATED)
+async def create_brogliaccio_entry(
+    entry: BrogliaccioCreate,
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Crea una nuova voce nel brogliaccio"""
+    versione = await prossima_versione(db, current_user.id)
     new_entry = Brogliaccio(
         utente_id=current_user.id,
         contenuto=entry.contenuto,
         tipo=entry.tipo,
         media_url=entry.media_url,
         metadata_json=entry.metadata_json,
-        stato="draft"
+        stato="draft",
+        versione=versione
     )
     db.add(new_entry)
-    db.commit()
-    db.refresh(new_entry)
+    await db.commit()
+    await db.refresh(new_entry)
+    await notifica_versione(current_user.id, versione)
     return new_entry
 
 
-@router.put("/{entry_id}", response_model=schemas.BrogliaccioResponse)
-async def update_brogliaccio_entry(
-    entry_id: str,
-    update_data: schemas.BrogliaccioUpdate,
-    db: Session = Depends(get_db),
-    current_user: Utente = Depends(get_current_user)
+@router.post("/batch", response_model=BrogliaccioBatchResponse)
+async def batch_brogliaccio(
+    batch: BrogliaccioBatch,
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Aggiorna una voce del brogliaccio
+    Applica in una transazione fino a 500 operazioni create/update/delete
+    (note raccolte offline), con esito per ogni operazione. Le operazioni
+    con `chiave` già applicata restituiscono l'esito originale (ripetuta=True),
+    quindi il client può ripetere il batch dopo un errore di rete.
     """
-    entry = db.query(Brogliaccio).filter(
-        Brogliaccio.id == entry_id,
-        Brogliaccio.utente_id == current_user.id
-    ).first()
-    
-    if not entry:
-        raise HTTPException(status_code=404, detail="Voce non trovata")
-    
-    for key, value in update_data.model_dump(exclude_unset=True).items():
+    try:
+        esito = await applica_batch(db, current_user.id, batch.operazioni)
+        await db.commit()
+    except ChiaviInElaborazione:
+        # Stesse chiavi inviate da un'altra richiesta ancora in corso
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Operazioni già in elaborazione, riprovare")
+    if esito["applicate"]:
+        await notifica_versione(current_user.id, esito["versione"])
+    return esito
+
+
+@router.put("/{entry_id}", response_model=BrogliaccioResponse)
+async def update_brogliaccio_entry(
+    entry_id: str,
+    update_data: BrogliaccioUpdate,
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Aggiorna una voce del brogliaccio"""
+    valori = update_data.model_dump(exclude_unset=True)
+    nulli = campi_nulli(valori)
+    if nulli:
+        raise HTTPException(status_code=400, detail=f"Campi obbligatori non annullabili: {', '.join(nulli)}")
+    entry = await _get_voce(db, entry_id, current_user.id)
+    for key, value in valori.items():
         setattr(entry, key, value)
-    
-    db.commit()
-    db.refresh(entry)
+    entry.versione = await prossima_versione(db, current_user.id)
+
+    await db.commit()
+    await db.refresh(entry)
+    await notifica_versione(current_user.id, entry.versione)
     return entry
 
 
 @router.delete("/{entry_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_brogliaccio_entry(
     entry_id: str,
-    db: Session = Depends(get_db),
-    current_user: Utente = Depends(get_current_user)
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """Elimina una voce del brogliaccio (tombstone per il delta sync)"""
+    entry = await _get_voce(db, entry_id, current_user.id)
+    versione = await prossima_versione(db, current_user.id)
+    await db.delete(entry)
+    await registra_eliminazioni(db, current_user.id, [entry_id], versione)
+    await db.commit()
+    await notifica_versione(current_user.id, versione)
+
+
+# =============================================
+# PUSH (WebSocket)
+# =============================================
+@router.websocket("/ws")
+async def brogliaccio_ws(websocket: WebSocket, token: str = Query(...)):
     """
-    Elimina una voce del brogliaccio
+    Notifiche {"tipo": "brogliaccio", "versione": N} a ogni modifica del
+    brogliaccio dell'utente: il client chiama poi /modifiche con la sua versione.
+    Token JWT in query string (i browser non inviano header sui WebSocket).
     """
-    entry = db.query(Brogliaccio).filter(
-        Brogliaccio.id == entry_id,
-        Brogliaccio.utente_id == current_user.id
-    ).first()
-    
-    if not entry:
-        raise HTTPException(status_code=404, detail="Voce non trovata")
-    
-    db.delete(entry)
-    db.commit()
+    async with AsyncSessionLocal() as db:
+        user = await get_user_from_token(token, db)
+    if user is None or not user.attivo:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await inoltra_eventi(websocket, [canale_brogliaccio(user.id)])
@@ -0,0 +1,146 @@
+"""
+Router Calendario: eventi (richieste con appuntamento e attività previste)
+in una finestra temporale, con proiezione compatta per il calendario
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_async_db
+from ..models import Attivita, CalendarioEliminato, Cliente, Richiesta, TipologiaAttivita, Utente, UserRole
+from ..schemas import CalendarioResponse
+from ..utils import get_current_user
+
+router = APIRouter()
+
+# Ampiezza massima della finestra (vista trimestrale)
+FINESTRA_MAX_GIORNI = 92
+# Durata di un appuntamento senza durata nota
+DURATA_PREDEFINITA_MINUTI = 60
+# Caratteri della descrizione usati come titolo dell'attività
+TITOLO_MAX = 80
+
+
+def _condizioni_data(colonna, da: datetime, a: datetime, updated_at, updated_since: Optional[datetime]) -> list:
+    """
+    Finestra [da, a) sull'inizio dell'evento (indice sulla data); con
+    updated_since solo le righe modificate dopo, anche se spostate fuori
+    dalla finestra o senza data, così il client può aggiornarle o rimuoverle.
+    """
+    if updated_since:
+        return [updated_at >= updated_since]
+    return [colonna >= da, colonna < a]
+
+
+@router.get("/", response_model=CalendarioResponse)
+async def get_calendario(
+    da: datetime = Query(..., description="Inizio finestra (incluso)"),
+    a: datetime = Query(..., description="Fine finestra (esclusa)"),
+    tecnico_id: Optional[str] = Query(None, description="Supervisore/tecnico della richiesta"),
+    ambito_id: Optional[str] = None,
+    updated_since: Optional[datetime] = Query(None, description="Solo eventi modificati dopo (aggiornato_al precedente)"),
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Eventi del calendario nella finestra [da, a): richieste per
+    data_appuntamento e attività per data_prevista, con titolo, inizio, fine,
+    stato e priorità. Con updated_since restituisce solo le modifiche e
+    in eliminati gli id degli eventi cancellati nel frattempo.
+    """
+    if a <= da:
+        raise HTTPException(status_code=400, detail="La fine della finestra deve essere successiva all'inizio")
+    if a - da > timedelta(days=FINESTRA_MAX_GIORNI):
+        raise HTTPException(status_code=400, detail=f"Finestra troppo ampia (max {FINESTRA_MAX_GIORNI} giorni)")
+
+    # Letto prima delle query: il refresh successivo non perde modifiche concorrenti
+    aggiornato_al = datetime.utcnow()
+
+    def filtri(tabella) -> list:
+        condizioni = []
+        if current_user.ruolo == UserRole.cliente:
+            condizioni.append(tabella.creato_da_id == current_user.id)
+        if tecnico_id:
+            condizioni.append(tabella.supervisore_id == tecnico_id)
+        if ambito_id:
+            condizioni.append(tabella.ambito_id == ambito_id)
+        return condizioni
+
+    filtri_richiesta = filtri(Richiesta)
+
+    richieste = await db.execute(
+        select(
+            Richiesta.id,
+            Richiesta.numero_richiesta,
+            Cliente.ragione_sociale,
+            Richiesta.data_appuntamento,
+            Richiesta.stato,
+            Richiesta.priorita,
+            Richiesta.supervisore_id,
+        )
+        .join(Cliente, Cliente.id == Richiesta.cliente_id)
+        .where(
+            *_condizioni_data(Richiesta.data_appuntamento, da, a, Richiesta.updated_at, updated_since),
+            *filtri_richiesta
+        )
+        .order_by(Richiesta.data_appuntamento)
+    )
+    attivita = await db.execute(
+        select(
+            Attivita.id,
+            func.substr(Attivita.descrizione, 1, TITOLO_MAX),
+            Attivita.data_prevista,
+            TipologiaAttivita.tempo_stimato_minuti,
+            Attivita.stato,
+            Attivita.priorita,
+            Attivita.richiesta_id,
+            Richiesta.supervisore_id,
+        )
+        .join(Richiesta, Richiesta.id == Attivita.richiesta_id)
+        .outerjoin(TipologiaAttivita, TipologiaAttivita.id == Attivita.tipologia_id)
+        .where(
+            *_condizioni_data(Attivita.data_prevista, da, a, Attivita.updated_at, updated_since),
+            *filtri_richiesta
+        )
+        .order_by(Attivita.data_prevista)
+    )
+
+    eventi = [
+        {
+            "id": id_,
+            "tipo": "richiesta",
+            "titolo": f"Richiesta #{numero} - {ragione_sociale}",
+            "inizio": inizio,
+            "fine": inizio + timedelta(minutes=DURATA_PREDEFINITA_MINUTI) if inizio else None,
+            "stato": stato.value,
+            "priorita": priorita,
+            "richiesta_id": id_,
+            "tecnico_id": tecnico,
+        }
+        for id_, numero, ragione_sociale, inizio, stato, priorita, tecnico in richieste
+    ]
+    eventi.extend(
+        {
+            "id": id_,
+            "tipo": "attivita",
+            "titolo": f"Attività: {descrizione}",
+            "inizio": inizio,
+            "fine": inizio + timedelta(minutes=durata or DURATA_PREDEFINITA_MINUTI) if inizio else None,
+            "stato": stato.value,
+            "priorita": priorita,
+            "richiesta_id": richiesta_id,
+            "tecnico_id": tecnico,
+        }
+        for id_, descrizione, inizio, durata, stato, priorita, richiesta_id, tecnico in attivita
+    )
+    eliminati = []
+    if updated_since:
+        eliminati = (await db.execute(
+            select(CalendarioEliminato.id).where(
+                CalendarioEliminato.eliminato_il >= updated_since,
+                *filtri(CalendarioEliminato)
+            )
+        )).scalars().all()
+    return {"eventi": eventi, "eliminati": eliminati, "aggiornato_al": aggiornato_al}
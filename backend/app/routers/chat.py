@@ -1,32 +1,102 @@
 """
 Router Chat richieste
+Oltre alle API REST espone WebSocket per ricevere in push nuovi messaggi
+e conferme di lettura (per richiesta o per utente), senza polling.
 """
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, status
+from sqlalchemy import select, update, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
-from ..models import MessaggioChat, Richiesta, Utente
+from ..config import get_settings
+from ..database import AsyncSessionLocal, get_async_db
+from ..models import MessaggioChat, Richiesta, Utente, UserRole
 from ..schemas import MessaggioCreate, MessaggioResponse
-from ..utils import get_current_user
+from ..services import send_chat_notification_email
+from ..services.chat_hub import get_chat_hub, canale_richiesta, canale_utente, inoltra_eventi
+from ..services.chat_non_letti import incrementa_non_letti, azzera_non_letti, get_non_letti
+from ..utils import NEXT_CURSOR_HEADER, get_current_user, get_user_from_token, make_etag, etag_matches, not_modified
 
 router = APIRouter()
+settings = get_settings()
+
+
+def _puo_vedere(user: Utente, richiesta: Richiesta) -> bool:
+    """Stessa regola della lista richieste: il cliente vede solo le sue"""
+    return user.ruolo != UserRole.cliente or richiesta.creato_da_id == user.id
+
+
+async def _partecipanti(db: AsyncSession, richiesta: Richiesta) -> List[Tuple[str, str]]:
+    """(id, email) degli utenti attivi coinvolti nella richiesta (creatore, supervisore, autori chat)"""
+    autori = select(MessaggioChat.autore_id).where(MessaggioChat.richiesta_id == richiesta.id)
+    coinvolti = [uid for uid in (richiesta.creato_da_id, richiesta.supervisore_id) if uid]
+    result = await db.execute(
+        select(Utente.id, Utente.email).where(
+            or_(Utente.id.in_(autori), Utente.id.in_(coinvolti)),
+            Utente.attivo == True
+        )
+    )
+    return [tuple(row) for row in result.all()]
 
 
 @router.get("/richiesta/{richiesta_id}", response_model=List[MessaggioResponse])
 async def get_messaggi_richiesta(
     richiesta_id: str,
+    request: Request,
+    response: Response,
+    since_id: Optional[str] = Query(None, description="Solo i messaggi successivi a questo id"),
+    before: Optional[str] = Query(None, description="Messaggi precedenti a questo id (da X-Next-Cursor)"),
+    limit: int = Query(100, ge=1, le=500),
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista messaggi di una richiesta"""
-    richiesta = db.query(Richiesta).filter(Richiesta.id == richiesta_id).first()
+    """
+    Messaggi di una richiesta in ordine cronologico.
+    Senza cursori ritorna gli ultimi `limit` messaggi: se ce ne sono di più
+    vecchi l'header X-Next-Cursor contiene il valore da passare in `before`.
+    Con since_id ritorna solo i messaggi nuovi (aggiornamento incrementale).
+    Supporta If-None-Match: 304 se la pagina non è cambiata.
+    """
+    if since_id and before:
+        raise HTTPException(status_code=400, detail="Usare since_id oppure before, non entrambi")
+    
+    richiesta = await db.get(Richiesta, richiesta_id)
     if not richiesta:
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     
-    messaggi = db.query(MessaggioChat).filter(
-        MessaggioChat.richiesta_id == richiesta_id
-    ).order_by(MessaggioChat.created_at).all()
+    query = select(MessaggioChat).where(MessaggioChat.richiesta_id == richiesta_id)
+    riferimento_id = since_id or before
+    if riferimento_id:
+        riferimento = await db.get(MessaggioChat, riferimento_id)
+        if riferimento is None or riferimento.richiesta_id != richiesta_id:
+            raise HTTPException(status_code=400, detail="Cursore non valido")
+        if since_id:
+            query = query.where(or_(
+                MessaggioChat.created_at > riferimento.created_at,
+                and_(MessaggioChat.created_at == riferimento.created_at, MessaggioChat.id > riferimento.id)
+            ))
+        else:
+            query = query.where(or_(
+                MessaggioChat.created_at < riferimento.created_at,
+                and_(MessaggioChat.created_at == riferimento.created_at, MessaggioChat.id < riferimento.id)
+            ))
+    
+    if since_id:
+        query = query.order_by(MessaggioChat.created_at, MessaggioChat.id).limit(limit)
+        messaggi = list((await db.execute(query)).scalars().all())
+    else:
+        # Dal più recente all'indietro: una riga in più indica che esistono messaggi più vecchi
+        query = query.order_by(MessaggioChat.created_at.desc(), MessaggioChat.id.desc()).limit(limit + 1)
+        messaggi = list((await db.execute(query)).scalars().all())
+        if len(messaggi) > limit:
+            messaggi = messaggi[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = messaggi[-1].id
+        messaggi.reverse()
+    
+    etag = make_etag(richiesta_id, [(m.id, m.letto) for m in messaggi], response.headers.get(NEXT_CURSOR_HEADER))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     
     return messaggi
 
@@ -35,10 +105,10 @@ async def get_messaggi_richiesta(
 async def send_messaggio(
     messaggio_data: MessaggioCreate,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Invia messaggio in chat richiesta"""
-    richiesta = db.query(Richiesta).filter(Richiesta.id == messaggio_data.richiesta_id).first()
+    richiesta = await db.get(Richiesta, messaggio_data.richiesta_id)
     if not richiesta:
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     
@@ -49,10 +119,30 @@ async def send_messaggio(
         allegati=messaggio_data.allegati
     )
     db.add(new_messaggio)
-    db.commit()
-    db.refresh(new_messaggio)
+    await db.flush()
     
-    # TODO: Inviare notifiche email/push agli altri partecipanti
+    # Contatori non letti aggiornati nella stessa transazione del messaggio
+    partecipanti = await _partecipanti(db, richiesta)
+    await incrementa_non_letti(db, richiesta.id, [uid for uid, _ in partecipanti if uid != current_user.id])
+    await db.commit()
+    await db.refresh(new_messaggio)
+    
+    # Push ai client collegati: chat della richiesta e canali dei partecipanti
+    await get_chat_hub().publish(
+        [canale_richiesta(richiesta.id)] + [canale_utente(uid) for uid, _ in partecipanti],
+        {"tipo": "messaggio", "messaggio": MessaggioResponse.model_validate(new_messaggio).model_dump(mode="json")}
+    )
+    
+    # Notifica email agli altri partecipanti (accodata, non blocca la risposta)
+    if settings.CHAT_EMAIL_NOTIFICATIONS:
+        destinatari = [email for uid, email in partecipanti if uid != current_user.id]
+        if destinatari:
+            await send_chat_notification_email(
+                destinatari,
+                richiesta.numero_richiesta,
+                f"{current_user.nome} {current_user.cognome}",
+                new_messaggio.messaggio
+            )
     
     return new_messaggio
 
@@ -61,15 +151,27 @@ async def send_messaggio(
 async def mark_read(
     richiesta_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Marca tutti i messaggi come letti"""
-    db.query(MessaggioChat).filter(
-        MessaggioChat.richiesta_id == richiesta_id,
-        MessaggioChat.autore_id != current_user.id,
-        MessaggioChat.letto == False
-    ).update({"letto": True})
-    db.commit()
+    result = await db.execute(
+        update(MessaggioChat)
+        .where(
+            MessaggioChat.richiesta_id == richiesta_id,
+            MessaggioChat.autore_id != current_user.id,
+            MessaggioChat.letto == False
+        )
+        .values(letto=True)
+    )
+    await azzera_non_letti(db, current_user.id, richiesta_id)
+    await db.commit()
+    
+    if result.rowcount:
+        # Conferma di lettura per gli altri partecipanti e per gli altri dispositivi dell'utente
+        await get_chat_hub().publish(
+            [canale_richiesta(richiesta_id), canale_utente(current_user.id)],
+            {"tipo": "letti", "richiesta_id": richiesta_id, "utente_id": current_user.id, "aggiornati": result.rowcount}
+        )
     
     return {"message": "Messaggi marcati come letti"}
 
@@ -77,12 +179,39 @@ async def mark_read(
 @router.get("/non-letti")
 async def count_non_letti(
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Conta messaggi non letti per l'utente corrente"""
-    count = db.query(MessaggioChat).filter(
-        MessaggioChat.autore_id != current_user.id,
-        MessaggioChat.letto == False
-    ).count()
+    """Messaggi non letti dell'utente corrente: totale e dettaglio per richiesta"""
+    totale, per_richiesta = await get_non_letti(db, current_user.id)
     
-    return {"non_letti": count}
+    return {"non_letti": totale, "per_richiesta": per_richiesta}
+
+
+# =============================================
+# PUSH (WebSocket)
+# =============================================
+@router.websocket("/ws")
+async def chat_ws_utente(websocket: WebSocket, token: str = Query(...)):
+    """
+    Eventi chat dell'utente: nuovi messaggi sulle richieste in cui è coinvolto
+    e conferme di lettura dai suoi altri dispositivi.
+    Token JWT in query string (i browser non inviano header sui WebSocket).
+    """
+    async with AsyncSessionLocal() as db:
+        user = await get_user_from_token(token, db)
+    if user is None or not user.attivo:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await inoltra_eventi(websocket, [canale_utente(user.id)])
+
+
+@router.websocket("/ws/richiesta/{richiesta_id}")
+async def chat_ws_richiesta(websocket: WebSocket, richiesta_id: str, token: str = Query(...)):
+    """Eventi della chat di una richiesta (nuovi messaggi e conferme di lettura)"""
+    async with AsyncSessionLocal() as db:
+        user = await get_user_from_token(token, db)
+        richiesta = await db.get(Richiesta, richiesta_id) if user else None
+    if user is None or not user.attivo or richiesta is None or not _puo_vedere(user, richiesta):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await inoltra_eventi(websocket, [canale_richiesta(richiesta_id)])
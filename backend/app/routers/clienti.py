@@ -1,49 +1,90 @@
 """
 Router CRUD Clienti
 """
+import asyncio
+import shutil
+import tempfile
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, File, HTTPException, status, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models import Cliente, SedeCliente, Utente
+from ..models.loaders import CLIENTE_DETAIL_LOAD
 from ..schemas import (
-    ClienteCreate, ClienteUpdate, ClienteResponse, ClienteListResponse,
+    ClienteCreate, ClienteUpdate, ClienteResponse, ClienteListResponse, ClienteTypeahead,
     SedeClienteCreate, SedeClienteResponse
 )
-from ..utils import get_current_user, require_tecnico
+from ..services.import_clienti import formato_file, stream_import
+from ..services.search import query_ricerca
+from ..services.typeahead import get_clienti_typeahead
+from ..utils import get_current_user, require_supervisore, require_tecnico, rows_etag, etag_matches, not_modified
 
 router = APIRouter()
 
 
+async def _get_cliente_con_sedi(db: AsyncSession, cliente_id: str) -> Optional[Cliente]:
+    """Carica cliente con sedi (necessarie per ClienteResponse)"""
+    result = await db.execute(
+        select(Cliente).options(*CLIENTE_DETAIL_LOAD).where(Cliente.id == cliente_id)
+    )
+    return result.scalar_one_or_none()
+
+
 @router.get("/", response_model=List[ClienteListResponse])
 async def list_clienti(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
     search: Optional[str] = None,
     attivo: Optional[bool] = None,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista clienti con paginazione e filtri"""
-    query = db.query(Cliente)
+    """Lista clienti con paginazione e filtri (ETag da updated_at)"""
+    query = select(Cliente)
     
     if search:
-        query = query.filter(Cliente.ragione_sociale.ilike(f"%{search}%"))
+        # Indice full-text (tsvector/trigram su PostgreSQL, FTS5 su SQLite)
+        query = query.where(Cliente.id.in_(query_ricerca(db.bind.dialect.name, "cliente", search, Cliente.id)))
     if attivo is not None:
-        query = query.filter(Cliente.attivo == attivo)
+        query = query.where(Cliente.attivo == attivo)
     
-    return query.offset(skip).limit(limit).all()
+    result = await db.execute(query.offset(skip).limit(limit))
+    clienti = result.scalars().all()
+    etag = rows_etag(clienti)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return clienti
+
+
+@router.get("/typeahead", response_model=List[ClienteTypeahead])
+async def typeahead_clienti(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(5, ge=1, le=20),
+    attivo: Optional[bool] = True,
+    current_user: Utente = Depends(get_current_user)
+):
+    """
+    Completamento clienti per prefisso su ragione sociale, alias, codice
+    gestionale e partita IVA (indice in memoria, nessuna query per tasto)
+    """
+    indice = await get_clienti_typeahead().pronto()
+    return indice.cerca(q, limit, attivo)
 
 
 @router.get("/{cliente_id}", response_model=ClienteResponse)
 async def get_cliente(
     cliente_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Dettaglio cliente con sedi"""
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = await _get_cliente_con_sedi(db, cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente non trovato")
     return cliente
@@ -53,11 +94,14 @@ async def get_cliente(
 async def create_cliente(
     cliente_data: ClienteCreate,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crea nuovo cliente"""
     # Verifica email unica
-    existing = db.query(Cliente).filter(Cliente.email_principale == cliente_data.email_principale).first()
+    result = await db.execute(
+        select(Cliente).where(Cliente.email_principale == cliente_data.email_principale)
+    )
+    existing = result.scalars().first()
     if existing:
         raise HTTPException(status_code=400, detail="Email già in uso")
     
@@ -66,6 +110,8 @@ async def create_cliente(
         ragione_sociale=cliente_data.ragione_sociale,
         partita_iva=cliente_data.partita_iva,
         codice_fiscale=cliente_data.codice_fiscale,
+        nome_alternativo=cliente_data.nome_alternativo,
+        codice_gestionale_esterno=cliente_data.codice_gestionale_esterno,
         email_principale=cliente_data.email_principale,
         email_secondarie=cliente_data.email_secondarie,
         telefoni=cliente_data.telefoni,
@@ -74,7 +120,7 @@ async def create_cliente(
         note=cliente_data.note
     )
     db.add(new_cliente)
-    db.flush()
+    await db.flush()
     
     # Aggiungi sedi se presenti
     if cliente_data.sedi:
@@ -85,9 +131,31 @@ async def create_cliente(
             )
             db.add(sede)
     
-    db.commit()
-    db.refresh(new_cliente)
-    return new_cliente
+    await db.commit()
+    get_clienti_typeahead().aggiorna(new_cliente)
+    return await _get_cliente_con_sedi(db, new_cliente.id)
+
+
+@router.post("/import")
+async def import_clienti(
+    file: UploadFile = File(..., description="CSV (separatore , o ;) oppure XLSX"),
+    current_user: Utente = Depends(require_supervisore())
+):
+    """
+    Import massivo di clienti e sedi da CSV/XLSX, a blocchi con commit per
+    blocco. Risponde in JSON lines: una riga di avanzamento per blocco
+    (righe, importati, sedi, duplicati, scartati) e il riepilogo finale con
+    completato, errore e le prime righe scartate.
+    """
+    try:
+        formato = formato_file(file.filename)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    # L'upload viene chiuso prima che parta la risposta in streaming: copia su disco
+    copia = tempfile.TemporaryFile()
+    await asyncio.to_thread(shutil.copyfileobj, file.file, copia)
+    copia.seek(0)
+    return StreamingResponse(stream_import(copia, formato), media_type="application/x-ndjson")
 
 
 @router.put("/{cliente_id}", response_model=ClienteResponse)
@@ -95,10 +163,10 @@ async def update_cliente(
     cliente_id: str,
     cliente_data: ClienteUpdate,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiorna cliente"""
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = await _get_cliente_con_sedi(db, cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente non trovato")
     
@@ -106,8 +174,9 @@ async def update_cliente(
     for key, value in update_data.items():
         setattr(cliente, key, value)
     
-    db.commit()
-    db.refresh(cliente)
+    await db.commit()
+    await db.refresh(cliente)
+    get_clienti_typeahead().aggiorna(cliente)
     return cliente
 
 
@@ -115,15 +184,16 @@ async def update_cliente(
 async def delete_cliente(
     cliente_id: str,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Disattiva cliente (soft delete)"""
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = await db.get(Cliente, cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente non trovato")
     
     cliente.attivo = False
-    db.commit()
+    await db.commit()
+    get_clienti_typeahead().aggiorna(cliente)
 
 
 # =============================================
@@ -134,17 +204,17 @@ async def add_sede(
     cliente_id: str,
     sede_data: SedeClienteCreate,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiungi sede a cliente"""
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = await db.get(Cliente, cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente non trovato")
     
     sede = SedeCliente(cliente_id=cliente_id, **sede_data.model_dump())
     db.add(sede)
-    db.commit()
-    db.refresh(sede)
+    await db.commit()
+    await db.refresh(sede)
     return sede
 
 
@@ -153,15 +223,18 @@ async def delete_sede(
     cliente_id: str,
     sede_id: str,
     current_user: Utente = Depends(require_tecnico()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Rimuovi sede da cliente"""
-    sede = db.query(SedeCliente).filter(
-        SedeCliente.id == sede_id,
-        SedeCliente.cliente_id == cliente_id
-    ).first()
+    result = await db.execute(
+        select(SedeCliente).where(
+            SedeCliente.id == sede_id,
+            SedeCliente.cliente_id == cliente_id
+        )
+    )
+    sede = result.scalars().first()
     if not sede:
         raise HTTPException(status_code=404, detail="Sede non trovata")
     
-    db.delete(sede)
-    db.commit()
+    await db.delete(sede)
+    await db.commit()
@@ -2,45 +2,67 @@
 Router CRUD Contratti
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
-from ..models import Contratto, VoceContratto, ContrattoCliente, Utente, StatoContratto
+from ..database import get_async_db
+from ..models import Contratto, VoceContratto, ContrattoCliente, UtilizzoContratto, Utente, StatoContratto
+from ..models.loaders import CONTRATTO_DETAIL_LOAD
 from ..schemas import (
     ContrattoCreate, ContrattoUpdate, ContrattoResponse,
     VoceContrattoCreate, VoceContrattoResponse,
-    ContrattoClienteCreate, ContrattoClienteUpdate, ContrattoClienteResponse
+    ContrattoClienteCreate, ContrattoClienteUpdate, ContrattoClienteResponse,
+    UtilizzoContrattoResponse, RicalcoloOreRequest
+)
+from ..services.catalog_cache import CONTRATTI_TEMPLATES, catalog_response, invalidate_catalog
+from ..services.monte_ore import ricarica_monte_ore, ricalcolo_ore_utilizzate
+from ..utils import (
+    get_current_user, require_admin, require_supervisore,
+    keyset_order, keyset_filter, set_next_cursor,
+    NEXT_CURSOR_HEADER, rows_etag, etag_matches, not_modified
 )
-from ..utils import get_current_user, require_admin, require_supervisore
 
 router = APIRouter()
 
 
+async def _get_contratto_con_voci(db: AsyncSession, contratto_id: str) -> Optional[Contratto]:
+    """Carica contratto template con voci (necessarie per ContrattoResponse)"""
+    result = await db.execute(
+        select(Contratto).options(*CONTRATTO_DETAIL_LOAD).where(Contratto.id == contratto_id)
+    )
+    return result.scalar_one_or_none()
+
+
 # =============================================
 # CONTRATTI (Template)
 # =============================================
 @router.get("/templates", response_model=List[ContrattoResponse])
 async def list_contratti_templates(
+    request: Request,
     attivo: Optional[bool] = None,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista contratti template"""
-    query = db.query(Contratto)
-    if attivo is not None:
-        query = query.filter(Contratto.attivo == attivo)
-    return query.all()
+    """Lista contratti template (da cache, invalidata dalle modifiche a template e voci)"""
+    async def carica():
+        query = select(Contratto).options(*CONTRATTO_DETAIL_LOAD)
+        if attivo is not None:
+            query = query.where(Contratto.attivo == attivo)
+        result = await db.execute(query)
+        return result.scalars().all()
+
+    return await catalog_response(request, CONTRATTI_TEMPLATES, attivo, ContrattoResponse, carica)
 
 
 @router.get("/templates/{contratto_id}", response_model=ContrattoResponse)
 async def get_contratto_template(
     contratto_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Dettaglio contratto template con voci"""
-    contratto = db.query(Contratto).filter(Contratto.id == contratto_id).first()
+    contratto = await _get_contratto_con_voci(db, contratto_id)
     if not contratto:
         raise HTTPException(status_code=404, detail="Contratto non trovato")
     return contratto
@@ -50,7 +72,7 @@ async def get_contratto_template(
 async def create_contratto_template(
     contratto_data: ContrattoCreate,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crea nuovo contratto template (solo admin)"""
     new_contratto = Contratto(
@@ -59,7 +81,7 @@ async def create_contratto_template(
         descrizione=contratto_data.descrizione
     )
     db.add(new_contratto)
-    db.flush()
+    await db.flush()
     
     # Aggiungi voci se presenti
     if contratto_data.voci:
@@ -71,9 +93,9 @@ async def create_contratto_template(
             )
             db.add(voce)
     
-    db.commit()
-    db.refresh(new_contratto)
-    return new_contratto
+    await db.commit()
+    await invalidate_catalog(CONTRATTI_TEMPLATES)
+    return await _get_contratto_con_voci(db, new_contratto.id)
 
 
 @router.put("/templates/{contratto_id}", response_model=ContrattoResponse)
@@ -81,10 +103,10 @@ async def update_contratto_template(
     contratto_id: str,
     contratto_data: ContrattoUpdate,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiorna contratto template (solo admin)"""
-    contratto = db.query(Contratto).filter(Contratto.id == contratto_id).first()
+    contratto = await _get_contratto_con_voci(db, contratto_id)
     if not contratto:
         raise HTTPException(status_code=404, detail="Contratto non trovato")
     
@@ -92,8 +114,9 @@ async def update_contratto_template(
     for key, value in update_data.items():
         setattr(contratto, key, value)
     
-    db.commit()
-    db.refresh(contratto)
+    await db.commit()
+    await invalidate_catalog(CONTRATTI_TEMPLATES)
+    await db.refresh(contratto)
     return contratto
 
 
@@ -105,17 +128,18 @@ async def add_voce_contratto(
     contratto_id: str,
     voce_data: VoceContrattoCreate,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiungi voce a contratto template"""
-    contratto = db.query(Contratto).filter(Contratto.id == contratto_id).first()
+    contratto = await db.get(Contratto, contratto_id)
     if not contratto:
         raise HTTPException(status_code=404, detail="Contratto non trovato")
     
     voce = VoceContratto(contratto_id=contratto_id, **voce_data.model_dump())
     db.add(voce)
-    db.commit()
-    db.refresh(voce)
+    await db.commit()
+    await invalidate_catalog(CONTRATTI_TEMPLATES)
+    await db.refresh(voce)
     return voce
 
 
@@ -124,18 +148,22 @@ async def delete_voce_contratto(
     contratto_id: str,
     voce_id: str,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Rimuovi voce da contratto template"""
-    voce = db.query(VoceContratto).filter(
-        VoceContratto.id == voce_id,
-        VoceContratto.contratto_id == contratto_id
-    ).first()
+    result = await db.execute(
+        select(VoceContratto).where(
+            VoceContratto.id == voce_id,
+            VoceContratto.contratto_id == contratto_id
+        )
+    )
+    voce = result.scalars().first()
     if not voce:
         raise HTTPException(status_code=404, detail="Voce non trovata")
     
-    db.delete(voce)
-    db.commit()
+    await db.delete(voce)
+    await db.commit()
+    await invalidate_catalog(CONTRATTI_TEMPLATES)
 
 
 # =============================================
@@ -143,32 +171,48 @@ async def delete_voce_contratto(
 # =============================================
 @router.get("/", response_model=List[ContrattoClienteResponse])
 async def list_contratti_clienti(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Cursore da X-Next-Cursor (ignora skip)"),
     cliente_id: Optional[str] = None,
     stato: Optional[StatoContratto] = None,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista contratti attivi dei clienti"""
-    query = db.query(ContrattoCliente)
+    """Lista contratti attivi dei clienti (skip/limit oppure cursor, vedi X-Next-Cursor; ETag da updated_at)"""
+    query = select(ContrattoCliente)
     
     if cliente_id:
-        query = query.filter(ContrattoCliente.cliente_id == cliente_id)
+        query = query.where(ContrattoCliente.cliente_id == cliente_id)
     if stato:
-        query = query.filter(ContrattoCliente.stato == stato)
+        query = query.where(ContrattoCliente.stato == stato)
+    
+    query = query.order_by(*keyset_order(ContrattoCliente.created_at, ContrattoCliente.id))
+    if cursor:
+        query = query.where(keyset_filter(ContrattoCliente.created_at, ContrattoCliente.id, cursor))
+    else:
+        query = query.offset(skip)
     
-    return query.offset(skip).limit(limit).all()
+    result = await db.execute(query.limit(limit))
+    contratti = result.scalars().all()
+    set_next_cursor(response, contratti, limit, "created_at")
+    etag = rows_etag(contratti, response.headers.get(NEXT_CURSOR_HEADER))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return contratti
 
 
 @router.get("/{contratto_cliente_id}", response_model=ContrattoClienteResponse)
 async def get_contratto_cliente(
     contratto_cliente_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Dettaglio contratto cliente"""
-    contratto = db.query(ContrattoCliente).filter(ContrattoCliente.id == contratto_cliente_id).first()
+    contratto = await db.get(ContrattoCliente, contratto_cliente_id)
     if not contratto:
         raise HTTPException(status_code=404, detail="Contratto non trovato")
     return contratto
@@ -178,13 +222,13 @@ async def get_contratto_cliente(
 async def create_contratto_cliente(
     contratto_data: ContrattoClienteCreate,
     current_user: Utente = Depends(require_supervisore()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Assegna contratto a cliente"""
     new_contratto = ContrattoCliente(**contratto_data.model_dump())
     db.add(new_contratto)
-    db.commit()
-    db.refresh(new_contratto)
+    await db.commit()
+    await db.refresh(new_contratto)
     return new_contratto
 
 
@@ -193,10 +237,10 @@ async def update_contratto_cliente(
     contratto_cliente_id: str,
     contratto_data: ContrattoClienteUpdate,
     current_user: Utente = Depends(require_supervisore()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiorna contratto cliente"""
-    contratto = db.query(ContrattoCliente).filter(ContrattoCliente.id == contratto_cliente_id).first()
+    contratto = await db.get(ContrattoCliente, contratto_cliente_id)
     if not contratto:
         raise HTTPException(status_code=404, detail="Contratto non trovato")
     
@@ -204,29 +248,57 @@ async def update_contratto_cliente(
     for key, value in update_data.items():
         setattr(contratto, key, value)
     
-    db.commit()
-    db.refresh(contratto)
+    await db.commit()
+    await db.refresh(contratto)
     return contratto
 
 
+@router.get("/{contratto_cliente_id}/utilizzi", response_model=List[UtilizzoContrattoResponse])
+async def list_utilizzi_contratto(
+    contratto_cliente_id: str,
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Registro delle ore scalate dal contratto (storni negativi)"""
+    result = await db.execute(
+        select(UtilizzoContratto)
+        .where(UtilizzoContratto.contratto_cliente_id == contratto_cliente_id)
+        .order_by(UtilizzoContratto.created_at, UtilizzoContratto.id)
+    )
+    return result.scalars().all()
+
+
 @router.post("/{contratto_cliente_id}/ricarica")
 async def ricarica_ore(
     contratto_cliente_id: str,
     ore_aggiuntive: int,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Ricarica ore per contratto monte ore"""
-    contratto = db.query(ContrattoCliente).filter(ContrattoCliente.id == contratto_cliente_id).first()
+    contratto = await db.get(ContrattoCliente, contratto_cliente_id)
     if not contratto:
         raise HTTPException(status_code=404, detail="Contratto non trovato")
     
     if contratto.tipo.value != "monte_ore":
         raise HTTPException(status_code=400, detail="Solo contratti monte ore possono essere ricaricati")
     
-    contratto.ore_totali = (contratto.ore_totali or 0) + ore_aggiuntive
-    if contratto.stato == StatoContratto.esaurito:
-        contratto.stato = StatoContratto.attivo
-    
-    db.commit()
-    return {"message": f"Aggiunte {ore_aggiuntive} ore. Totale ore: {contratto.ore_totali}"}
+    ore_totali = await ricarica_monte_ore(db, contratto_cliente_id, ore_aggiuntive)
+    await db.commit()
+    return {"message": f"Aggiunte {ore_aggiuntive} ore. Totale ore: {ore_totali}"}
+
+
+@router.post("/ricalcola-ore")
+async def ricalcola_ore(
+    ricalcolo: RicalcoloOreRequest,
+    current_user: Utente = Depends(require_admin()),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ricalcola ore_utilizzate e stato dei contratti monte ore dal registro utilizzi"""
+    aggiornati = None
+    for stmt in ricalcolo_ore_utilizzate(ricalcolo.contratti_ids):
+        result = await db.execute(stmt)
+        if aggiornati is None:
+            aggiornati = result.rowcount
+    await db.commit()
+    return {"contratti_aggiornati": aggiornati}
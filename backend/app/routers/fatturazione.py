@@ -0,0 +1,95 @@
+"""
+Router Fatturazione: export aggregato e passaggi di stato in blocco
+"""
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_async_db
+from ..models import Utente, StatoRichiesta
+from ..schemas import FatturazioneTransizione, FatturazioneTransizioneResponse
+from ..services.fatturazione import (
+    FORMATI, filtro_richieste, query_export, stream_export, transizione_in_blocco
+)
+from ..utils import require_supervisore
+
+router = APIRouter()
+
+# Passaggi della fatturazione gestiti in blocco
+TRANSIZIONI_FATTURAZIONE = {
+    StatoRichiesta.validata: StatoRichiesta.da_fatturare,
+    StatoRichiesta.da_fatturare: StatoRichiesta.fatturata,
+}
+
+
+@router.get("/export")
+async def export_fatturazione(
+    formato: str = Query("csv", description="csv oppure jsonl"),
+    stato: StatoRichiesta = StatoRichiesta.da_fatturare,
+    cliente_id: Optional[str] = None,
+    da: Optional[datetime] = Query(None, description="Competenza da (inclusa)"),
+    a: Optional[datetime] = Query(None, description="Competenza fino a (esclusa)"),
+    solo_fatturabili: bool = True,
+    current_user: Utente = Depends(require_supervisore()),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Attività aggregate per cliente e mese di competenza (validazione della
+    richiesta), tipo addebito, contratto e fatturabilità, in streaming.
+    richieste_ids (separati da ";" nel CSV) sono gli id da passare a
+    /transizione per segnare come fatturate le richieste esportate.
+    """
+    if formato not in FORMATI:
+        raise HTTPException(status_code=400, detail=f"Formato non valido: {formato} (csv, jsonl)")
+
+    query = query_export(
+        db.bind.dialect.name,
+        filtro_richieste(stato, cliente_id, da, a),
+        solo_fatturabili
+    )
+    nome_file = f"fatturazione_{datetime.utcnow():%Y%m%d_%H%M%S}.{formato}"
+    return StreamingResponse(
+        stream_export(query, formato),
+        media_type=FORMATI[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome_file}"'}
+    )
+
+
+@router.post("/transizione", response_model=FatturazioneTransizioneResponse)
+async def transizione_fatturazione(
+    transizione: FatturazioneTransizione,
+    current_user: Utente = Depends(require_supervisore()),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Porta in blocco (un solo UPDATE, una transazione) le richieste filtrate
+    da validata a da_fatturare oppure da da_fatturare a fatturata.
+    Il passaggio a fatturata richiede richieste_ids (quelli dell'export):
+    un filtro per cliente/periodo includerebbe anche richieste arrivate
+    in da_fatturare dopo l'export.
+    """
+    nuovo_stato = TRANSIZIONI_FATTURAZIONE.get(transizione.stato_origine)
+    if nuovo_stato is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Stato di origine non valido per la fatturazione: {transizione.stato_origine.value}"
+        )
+
+    if nuovo_stato == StatoRichiesta.fatturata and not transizione.richieste_ids:
+        raise HTTPException(
+            status_code=400,
+            detail="Per il passaggio a fatturata indicare richieste_ids (gli id dell'export)"
+        )
+
+    condizioni = filtro_richieste(
+        transizione.stato_origine,
+        transizione.cliente_id,
+        transizione.da,
+        transizione.a,
+        transizione.richieste_ids
+    )
+    richieste_ids = await transizione_in_blocco(db, condizioni, nuovo_stato)
+    await db.commit()
+    return {"nuovo_stato": nuovo_stato, "totale": len(richieste_ids), "richieste_ids": richieste_ids}
@@ -3,19 +3,35 @@ Router CRUD Richieste con gestione stati
 """
 from typing import List, Optional
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
-from ..models import Richiesta, Attivita, Utente, StatoRichiesta, OrigineRichiesta, UserRole
+from ..database import get_async_db
+from ..models import (
+    Richiesta, Attivita, CalendarioEliminato, Cliente, Utente, StatoRichiesta, OrigineRichiesta, UserRole
+)
+from ..models.loaders import RICHIESTA_DETAIL_LOAD
 from ..schemas import (
     RichiestaCreate, RichiestaUpdate, RichiestaResponse, 
-    RichiestaDetailResponse, RichiestaTransizioneStato
+    RichiestaDetailResponse, RichiestaTransizioneStato, RichiestaTransizioneBulk,
+    TransizioneBulkResponse,
+    RiepilogoMinutiRichiesta, RiepilogoMinutiCliente
+)
+from ..services.transizioni import applica_transizioni
+from ..services.validazione import get_validazione_automatica, scadenza_validazione
+from ..utils import (
+    get_current_user, require_admin, require_supervisore,
+    keyset_order, keyset_filter, set_next_cursor,
+    NEXT_CURSOR_HEADER, rows_etag, etag_matches, not_modified,
+    colonne_risposta, righe_dict, json_response
 )
-from ..utils import get_current_user, require_supervisore
 
 router = APIRouter()
 
+# Colonne di RichiestaResponse per le liste (righe senza istanze ORM, vedi utils/serialization)
+COLONNE_LISTA = colonne_risposta(Richiesta, RichiestaResponse)
+
 
 # Transizioni di stato valide
 TRANSIZIONI_VALIDE = {
@@ -32,39 +48,146 @@ TRANSIZIONI_VALIDE = {
 
 @router.get("/", response_model=List[RichiestaResponse])
 async def list_richieste(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Cursore da X-Next-Cursor (ignora skip)"),
     stato: Optional[StatoRichiesta] = None,
     cliente_id: Optional[str] = None,
     priorita: Optional[str] = None,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista richieste con filtri"""
-    query = db.query(Richiesta)
+    """
+    Lista richieste con filtri.
+    Paginazione con skip/limit oppure keyset con cursor: se la pagina è piena
+    l'header X-Next-Cursor contiene il cursore della pagina successiva.
+    ETag debole da id e updated_at delle righe: 304 se la pagina non è cambiata.
+    """
+    query = select(*COLONNE_LISTA)
     
     # Filtro per ruolo cliente: vede solo le sue
     if current_user.ruolo == UserRole.cliente:
-        query = query.filter(Richiesta.creato_da_id == current_user.id)
+        query = query.where(Richiesta.creato_da_id == current_user.id)
     
     if stato:
-        query = query.filter(Richiesta.stato == stato)
+        query = query.where(Richiesta.stato == stato)
     if cliente_id:
-        query = query.filter(Richiesta.cliente_id == cliente_id)
+        query = query.where(Richiesta.cliente_id == cliente_id)
     if priorita:
-        query = query.filter(Richiesta.priorita == priorita)
+        query = query.where(Richiesta.priorita == priorita)
+    
+    query = query.order_by(*keyset_order(Richiesta.created_at, Richiesta.id))
+    if cursor:
+        query = query.where(keyset_filter(Richiesta.created_at, Richiesta.id, cursor))
+    else:
+        query = query.offset(skip)
+    
+    result = await db.execute(query.limit(limit))
+    richieste = result.all()
+    set_next_cursor(response, richieste, limit, "created_at")
+    etag = rows_etag(richieste, response.headers.get(NEXT_CURSOR_HEADER))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return json_response(righe_dict(richieste, COLONNE_LISTA), response)
+
+
+@router.get("/riepilogo-minuti", response_model=List[RiepilogoMinutiCliente])
+async def riepilogo_minuti(
+    stato: Optional[StatoRichiesta] = None,
+    cliente_id: Optional[str] = None,
+    da: Optional[datetime] = Query(None, description="Richieste create da (incluso)"),
+    a: Optional[datetime] = Query(None, description="Richieste create fino a (escluso)"),
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Minuti lavorati per cliente, sommando i totali delle richieste"""
+    query = (
+        select(
+            Richiesta.cliente_id,
+            Cliente.ragione_sociale,
+            func.count(Richiesta.id).label("richieste"),
+            func.sum(Richiesta.minuti_totali).label("minuti_totali"),
+        )
+        .join(Cliente, Cliente.id == Richiesta.cliente_id)
+        .group_by(Richiesta.cliente_id, Cliente.ragione_sociale)
+        .order_by(Cliente.ragione_sociale)
+    )
+    if current_user.ruolo == UserRole.cliente:
+        query = query.where(Richiesta.creato_da_id == current_user.id)
+    if stato:
+        query = query.where(Richiesta.stato == stato)
+    if cliente_id:
+        query = query.where(Richiesta.cliente_id == cliente_id)
+    if da:
+        query = query.where(Richiesta.created_at >= da)
+    if a:
+        query = query.where(Richiesta.created_at < a)
     
-    return query.order_by(Richiesta.created_at.desc()).offset(skip).limit(limit).all()
+    result = await db.execute(query)
+    return [row._asdict() for row in result.all()]
+
+
+@router.get("/validazione-automatica")
+async def get_validazione_automatica_stato(
+    current_user: Utente = Depends(require_admin())
+):
+    """Metriche del job di validazione automatica (richieste e durata dei lotti)"""
+    return get_validazione_automatica().metriche.as_dict()
+
+
+@router.post("/validazione-automatica/esegui")
+async def esegui_validazione_automatica(
+    current_user: Utente = Depends(require_admin())
+):
+    """Esegue subito la validazione delle richieste risolte scadute"""
+    validate = await get_validazione_automatica().esegui()
+    return {"validate": validate}
+
+
+@router.get("/{richiesta_id}/minuti", response_model=RiepilogoMinutiRichiesta)
+async def get_minuti_richiesta(
+    richiesta_id: str,
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Minuti lavorati sulla richiesta e sulle sue attività"""
+    result = await db.execute(
+        select(Richiesta.minuti_totali, Richiesta.creato_da_id).where(Richiesta.id == richiesta_id)
+    )
+    richiesta = result.one_or_none()
+    if not richiesta or (
+        current_user.ruolo == UserRole.cliente and richiesta.creato_da_id != current_user.id
+    ):
+        raise HTTPException(status_code=404, detail="Richiesta non trovata")
+    
+    result = await db.execute(
+        select(Attivita.id, Attivita.descrizione, Attivita.stato, Attivita.minuti_totali)
+        .where(Attivita.richiesta_id == richiesta_id)
+        .order_by(Attivita.created_at)
+    )
+    return {
+        "richiesta_id": richiesta_id,
+        "minuti_totali": richiesta.minuti_totali,
+        "attivita": result.all(),
+    }
 
 
 @router.get("/{richiesta_id}", response_model=RichiestaDetailResponse)
 async def get_richiesta(
     richiesta_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Dettaglio richiesta con attività"""
-    richiesta = db.query(Richiesta).filter(Richiesta.id == richiesta_id).first()
+    result = await db.execute(
+        select(Richiesta)
+        .options(*RICHIESTA_DETAIL_LOAD)
+        .where(Richiesta.id == richiesta_id)
+    )
+    richiesta = result.scalar_one_or_none()
     if not richiesta:
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     return richiesta
@@ -74,7 +197,7 @@ async def get_richiesta(
 async def create_richiesta(
     richiesta_data: RichiestaCreate,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crea nuova richiesta"""
     try:
@@ -96,8 +219,8 @@ async def create_richiesta(
             scadenza_validazione=datetime.now().date() + timedelta(days=7)
         )
         db.add(new_richiesta)
-        db.commit()
-        db.refresh(new_richiesta)
+        await db.commit()
+        await db.refresh(new_richiesta)
         return new_richiesta
     except Exception as e:
         import traceback
@@ -111,10 +234,10 @@ async def update_richiesta(
     richiesta_id: str,
     richiesta_data: RichiestaUpdate,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiorna richiesta"""
-    richiesta = db.query(Richiesta).filter(Richiesta.id == richiesta_id).first()
+    richiesta = await db.get(Richiesta, richiesta_id)
     if not richiesta:
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     
@@ -122,8 +245,8 @@ async def update_richiesta(
     for key, value in update_data.items():
         setattr(richiesta, key, value)
     
-    db.commit()
-    db.refresh(richiesta)
+    await db.commit()
+    await db.refresh(richiesta)
     return richiesta
 
 
@@ -132,10 +255,10 @@ async def transizione_stato(
     richiesta_id: str,
     transizione: RichiestaTransizioneStato,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cambia stato richiesta"""
-    richiesta = db.query(Richiesta).filter(Richiesta.id == richiesta_id).first()
+    richiesta = await db.get(Richiesta, richiesta_id)
     if not richiesta:
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     
@@ -155,23 +278,68 @@ async def transizione_stato(
         richiesta.validata_da_id = current_user.id
         richiesta.validata_il = datetime.utcnow()
         richiesta.validata_automaticamente = False
+    elif transizione.nuovo_stato == StatoRichiesta.risolta:
+        richiesta.scadenza_validazione = scadenza_validazione()
     
     richiesta.stato = transizione.nuovo_stato
-    db.commit()
-    db.refresh(richiesta)
+    await db.commit()
+    await db.refresh(richiesta)
     return richiesta
 
 
+@router.post("/transizione-bulk", response_model=TransizioneBulkResponse)
+async def transizione_stato_bulk(
+    transizione: RichiestaTransizioneBulk,
+    current_user: Utente = Depends(require_supervisore()),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Cambia stato a più richieste (stesse regole di /transizione).
+    Esito per ogni id: quelle non valide non bloccano le altre.
+    """
+    valori = {}
+    if transizione.nuovo_stato == StatoRichiesta.riaperta:
+        valori = {"riaperta_il": datetime.utcnow(), "motivazione_riapertura": transizione.motivazione}
+    elif transizione.nuovo_stato == StatoRichiesta.validata:
+        valori = {
+            "validata_da_id": current_user.id,
+            "validata_il": datetime.utcnow(),
+            "validata_automaticamente": False
+        }
+    elif transizione.nuovo_stato == StatoRichiesta.risolta:
+        valori = {"scadenza_validazione": scadenza_validazione()}
+    
+    esiti = await applica_transizioni(
+        db, Richiesta, transizione.ids, transizione.nuovo_stato, TRANSIZIONI_VALIDE, valori
+    )
+    await db.commit()
+    return {
+        "nuovo_stato": transizione.nuovo_stato,
+        "aggiornate": sum(e["ok"] for e in esiti),
+        "esiti": esiti
+    }
+
+
 @router.delete("/{richiesta_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_richiesta(
     richiesta_id: str,
     current_user: Utente = Depends(require_supervisore()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Elimina richiesta (solo supervisore/admin)"""
-    richiesta = db.query(Richiesta).filter(Richiesta.id == richiesta_id).first()
+    """Elimina richiesta (solo supervisore/admin), con tombstone per il calendario"""
+    richiesta = await db.get(Richiesta, richiesta_id)
     if not richiesta:
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     
-    db.delete(richiesta)
-    db.commit()
+    attivita_ids = (await db.execute(
+        select(Attivita.id).where(Attivita.richiesta_id == richiesta_id)
+    )).scalars().all()
+    filtri = {
+        "creato_da_id": richiesta.creato_da_id,
+        "supervisore_id": richiesta.supervisore_id,
+        "ambito_id": richiesta.ambito_id,
+    }
+    db.add(CalendarioEliminato(id=richiesta_id, tipo="richiesta", **filtri))
+    db.add_all(CalendarioEliminato(id=id_, tipo="attivita", **filtri) for id_ in attivita_ids)
+    await db.delete(richiesta)
+    await db.commit()
@@ -4,16 +4,28 @@ Router CRUD Schedules (Pianificazioni automatiche)
 from typing import List, Optional
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models import Schedule, Utente
 from ..schemas import ScheduleCreate, ScheduleUpdate, ScheduleResponse
+from ..services.scheduler import (
+    ConfigurazioneNonValida, get_scheduler, esegui_azione, normalizza_trigger, valida_frequenza
+)
 from ..utils import get_current_user, require_admin
 
 router = APIRouter()
 
 
+def _valida_frequenza(frequenza: str, intervallo_custom: Optional[str]) -> None:
+    """400 se il motore non potrebbe calcolare il trigger successivo"""
+    try:
+        valida_frequenza(frequenza, intervallo_custom)
+    except ConfigurazioneNonValida as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/", response_model=List[ScheduleResponse])
 async def list_schedules(
     skip: int = Query(0, ge=0),
@@ -21,45 +33,50 @@ async def list_schedules(
     attivo: Optional[bool] = None,
     tipo_entita: Optional[str] = None,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista pianificazioni"""
-    query = db.query(Schedule)
+    query = select(Schedule)
     
     if attivo is not None:
-        query = query.filter(Schedule.attivo == attivo)
+        query = query.where(Schedule.attivo == attivo)
     if tipo_entita:
-        query = query.filter(Schedule.tipo_entita == tipo_entita)
+        query = query.where(Schedule.tipo_entita == tipo_entita)
     
-    return query.order_by(Schedule.prossimo_trigger).offset(skip).limit(limit).all()
+    result = await db.execute(
+        query.order_by(Schedule.prossimo_trigger).offset(skip).limit(limit)
+    )
+    return result.scalars().all()
 
 
 @router.get("/prossimi")
 async def get_prossimi_trigger(
     giorni: int = Query(7, ge=1, le=90),
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Schedules in scadenza nei prossimi X giorni"""
     from datetime import timedelta
     limite = datetime.utcnow() + timedelta(days=giorni)
     
-    schedules = db.query(Schedule).filter(
-        Schedule.attivo == True,
-        Schedule.prossimo_trigger <= limite
-    ).order_by(Schedule.prossimo_trigger).all()
+    result = await db.execute(
+        select(Schedule).where(
+            Schedule.attivo == True,
+            Schedule.prossimo_trigger <= limite
+        ).order_by(Schedule.prossimo_trigger)
+    )
     
-    return schedules
+    return result.scalars().all()
 
 
 @router.get("/{schedule_id}", response_model=ScheduleResponse)
 async def get_schedule(
     schedule_id: str,
     current_user: Utente = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Dettaglio schedule"""
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = await db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule non trovato")
     return schedule
@@ -69,13 +86,16 @@ async def get_schedule(
 async def create_schedule(
     schedule_data: ScheduleCreate,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crea nuovo schedule (solo admin)"""
+    _valida_frequenza(schedule_data.frequenza, schedule_data.intervallo_custom)
     new_schedule = Schedule(**schedule_data.model_dump())
+    new_schedule.prossimo_trigger = normalizza_trigger(new_schedule.prossimo_trigger)
     db.add(new_schedule)
-    db.commit()
-    db.refresh(new_schedule)
+    await db.commit()
+    await db.refresh(new_schedule)
+    get_scheduler().notify(new_schedule.id, new_schedule.prossimo_trigger, new_schedule.attivo)
     return new_schedule
 
 
@@ -84,19 +104,22 @@ async def update_schedule(
     schedule_id: str,
     schedule_data: ScheduleUpdate,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aggiorna schedule (solo admin)"""
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = await db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule non trovato")
     
     update_data = schedule_data.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(schedule, key, value)
+    if "frequenza" in update_data:
+        _valida_frequenza(schedule.frequenza, schedule.intervallo_custom)
     
-    db.commit()
-    db.refresh(schedule)
+    await db.commit()
+    await db.refresh(schedule)
+    get_scheduler().notify(schedule.id, schedule.prossimo_trigger, schedule.attivo)
     return schedule
 
 
@@ -104,15 +127,16 @@ async def update_schedule(
 async def toggle_schedule(
     schedule_id: str,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Attiva/disattiva schedule"""
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = await db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule non trovato")
     
     schedule.attivo = not schedule.attivo
-    db.commit()
+    await db.commit()
+    get_scheduler().notify(schedule.id, schedule.prossimo_trigger, schedule.attivo)
     return {"attivo": schedule.attivo}
 
 
@@ -120,30 +144,35 @@ async def toggle_schedule(
 async def trigger_schedule(
     schedule_id: str,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Forza esecuzione manuale schedule (solo admin)"""
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = await db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule non trovato")
     
-    # TODO: Implementare logica trigger effettivo (crea_richiesta, invia_notifica, etc.)
+    # Esecuzione fuori calendario: prossimo_trigger resta invariato
+    try:
+        risultato = await esegui_azione(db, schedule)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     schedule.ultimo_trigger = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
-    return {"message": "Trigger eseguito", "ultimo_trigger": schedule.ultimo_trigger}
+    return {"message": "Trigger eseguito", "ultimo_trigger": schedule.ultimo_trigger, **risultato}
 
 
 @router.delete("/{schedule_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_schedule(
     schedule_id: str,
     current_user: Utente = Depends(require_admin()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Elimina schedule (solo admin)"""
-    schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
+    schedule = await db.get(Schedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule non trovato")
     
-    db.delete(schedule)
-    db.commit()
+    await db.delete(schedule)
+    await db.commit()
+    get_scheduler().notify(schedule_id, None)
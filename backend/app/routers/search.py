@@ -0,0 +1,36 @@
+"""
+Router Ricerca globale (clienti, richieste, utenti)
+"""
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_async_db
+from ..models import Utente
+from ..schemas import RisultatoRicerca
+from ..services.search import TIPI, cerca
+from ..utils import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[RisultatoRicerca])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Testo da cercare (ogni parola come prefisso)"),
+    tipi: Optional[List[str]] = Query(None, description="cliente, richiesta, utente (default tutti)"),
+    skip: int = Query(0, ge=0, le=1000),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Utente = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ricerca full-text con risultati di tutte le entità ordinati per rilevanza.
+    Clienti: ragione sociale, P.IVA, codice fiscale, email, città delle sedi.
+    Richieste: descrizione. Utenti: nome, cognome, email (solo admin/supervisore).
+    """
+    if tipi:
+        sconosciuti = set(tipi) - set(TIPI)
+        if sconosciuti:
+            raise HTTPException(status_code=400, detail=f"Tipi non validi: {', '.join(sorted(sconosciuti))}")
+    
+    return await cerca(db, q, current_user, tipi=tipi, skip=skip, limit=limit)
@@ -9,6 +9,7 @@ from pydantic import BaseModel, EmailStr
 from ..database import get_db
 from ..models import Utente, UserRole
 from ..schemas import UtenteResponse, UtenteCreate
+from ..services import invalidate_user
 from ..utils import get_current_user, require_admin, get_password_hash
 
 router = APIRouter(prefix="/api/users", tags=["users"])
@@ -115,6 +116,7 @@ async def update_user(
     
     db.commit()
     db.refresh(user)
+    await invalidate_user(user.id)
     return user
 
 
@@ -148,6 +150,7 @@ async def delete_user(
     
     db.delete(user)
     db.commit()
+    await invalidate_user(user_id)
     return {"message": "Utente eliminato con successo"}
 
 
@@ -182,6 +185,7 @@ async def toggle_user_active(
     user.attivo = not user.attivo
     db.commit()
     db.refresh(user)
+    await invalidate_user(user.id)
     return {"message": f"Utente {'attivato' if user.attivo else 'disattivato'}", "attivo": user.attivo}
 
 
@@ -221,13 +225,15 @@ async def transfer_super_admin(
             detail="Sei già il Super Admin"
         )
     
-    # Trasferimento
-    current_user.is_super_admin = False
+    # Trasferimento (current_user è uno snapshot in cache, va ricaricato)
+    super_admin = db.query(Utente).filter(Utente.id == current_user.id).first()
+    super_admin.is_super_admin = False
     target_user.is_super_admin = True
     
     db.commit()
-    db.refresh(current_user)
+    db.refresh(super_admin)
     db.refresh(target_user)
+    await invalidate_user(super_admin.id, target_user.id)
     
     return {
         "message": f"Ruolo Super Admin trasferito a {target_user.nome} {target_user.cognome}",
@@ -14,6 +14,7 @@ from .schemas import (
     ClienteUpdate,
     ClienteResponse,
     ClienteListResponse,
+    ClienteTypeahead,
     SedeClienteBase,
     SedeClienteCreate,
     SedeClienteResponse,
@@ -33,17 +34,22 @@ from .schemas import (
     RichiestaResponse,
     RichiestaDetailResponse,
     RichiestaTransizioneStato,
+    RichiestaTransizioneBulk,
     # Attività
     AttivitaBase,
     AttivitaCreate,
     AttivitaUpdate,
     AttivitaResponse,
     AttivitaTransizioneStato,
+    AttivitaTransizioneBulk,
     AttivitaAddebito,
     # Time Entry
     TimeEntryCreate,
     TimeEntryCheckout,
     TimeEntryResponse,
+    MinutiAttivita,
+    RiepilogoMinutiRichiesta,
+    RiepilogoMinutiCliente,
     # Contratto
     ContrattoBase,
     ContrattoCreate,
@@ -57,6 +63,8 @@ from .schemas import (
     ContrattoClienteCreate,
     ContrattoClienteUpdate,
     ContrattoClienteResponse,
+    UtilizzoContrattoResponse,
+    RicalcoloOreRequest,
     # Schedule
     ScheduleBase,
     ScheduleCreate,
@@ -66,6 +74,27 @@ from .schemas import (
     MessaggioBase,
     MessaggioCreate,
     MessaggioResponse,
+    # Brogliaccio
+    BrogliaccioCreate,
+    BrogliaccioUpdate,
+    BrogliaccioResponse,
+    BrogliaccioModifiche,
+    TipoOperazioneBrogliaccio,
+    BrogliaccioOperazione,
+    BrogliaccioBatch,
+    EsitoOperazioneBrogliaccio,
+    BrogliaccioBatchResponse,
+    # Transizioni in blocco
+    EsitoTransizione,
+    TransizioneBulkResponse,
+    # Fatturazione
+    FatturazioneTransizione,
+    FatturazioneTransizioneResponse,
+    # Calendario
+    EventoCalendario,
+    CalendarioResponse,
+    # Ricerca
+    RisultatoRicerca,
     # Enums
     UserRole,
     StatoRichiesta,
@@ -169,6 +169,8 @@ class ClienteBase(BaseModel):
     ragione_sociale: str = Field(..., min_length=1, max_length=255)
     partita_iva: Optional[str] = None
     codice_fiscale: Optional[str] = None
+    nome_alternativo: Optional[str] = Field(None, max_length=255)
+    codice_gestionale_esterno: Optional[str] = Field(None, max_length=50)
     email_principale: EmailStr
     email_secondarie: Optional[List[str]] = None
     telefoni: Optional[List[str]] = None
@@ -185,6 +187,8 @@ class ClienteUpdate(BaseModel):
     ragione_sociale: Optional[str] = None
     partita_iva: Optional[str] = None
     codice_fiscale: Optional[str] = None
+    nome_alternativo: Optional[str] = None
+    codice_gestionale_esterno: Optional[str] = None
     email_principale: Optional[EmailStr] = None
     email_secondarie: Optional[List[str]] = None
     telefoni: Optional[List[str]] = None
@@ -210,6 +214,15 @@ class ClienteListResponse(BaseSchema):
     attivo: bool
 
 
+class ClienteTypeahead(BaseSchema):
+    id: str
+    ragione_sociale: str
+    nome_alternativo: Optional[str] = None
+    codice_gestionale_esterno: Optional[str] = None
+    partita_iva: Optional[str] = None
+    attivo: bool
+
+
 # =============================================
 # AMBITO SCHEMAS
 # =============================================
@@ -286,6 +299,12 @@ class RichiestaTransizioneStato(BaseModel):
     motivazione: Optional[str] = None  # Per riapertura o note
 
 
+class RichiestaTransizioneBulk(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+    nuovo_stato: StatoRichiesta
+    motivazione: Optional[str] = None
+
+
 class RichiestaResponse(RichiestaBase, BaseSchema):
     id: str
     numero_richiesta: int
@@ -293,6 +312,7 @@ class RichiestaResponse(RichiestaBase, BaseSchema):
     origine: OrigineRichiesta
     creato_da_id: Optional[str]
     supervisore_id: Optional[str]
+    minuti_totali: int = 0
     created_at: datetime
     updated_at: datetime
 
@@ -333,6 +353,11 @@ class AttivitaTransizioneStato(BaseModel):
     nuovo_stato: StatoAttivita
 
 
+class AttivitaTransizioneBulk(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+    nuovo_stato: StatoAttivita
+
+
 class AttivitaAddebito(BaseModel):
     tipo_addebito: TipoAddebito
     contratto_cliente_id: Optional[str] = None
@@ -347,6 +372,7 @@ class AttivitaResponse(AttivitaBase, BaseSchema):
     risolutiva: bool
     tipo_addebito: Optional[TipoAddebito]
     ore_addebitate: Optional[float]
+    minuti_totali: int = 0
     created_at: datetime
     updated_at: datetime
 
@@ -378,6 +404,26 @@ class TimeEntryResponse(BaseSchema):
     created_at: datetime
 
 
+class MinutiAttivita(BaseSchema):
+    id: str
+    descrizione: str
+    stato: StatoAttivita
+    minuti_totali: int
+
+
+class RiepilogoMinutiRichiesta(BaseModel):
+    richiesta_id: str
+    minuti_totali: int
+    attivita: List[MinutiAttivita] = []
+
+
+class RiepilogoMinutiCliente(BaseModel):
+    cliente_id: str
+    ragione_sociale: str
+    richieste: int
+    minuti_totali: int
+
+
 # =============================================
 # CONTRATTO SCHEMAS
 # =============================================
@@ -466,6 +512,21 @@ class ContrattoClienteResponse(ContrattoClienteBase, BaseSchema):
     updated_at: datetime
 
 
+class UtilizzoContrattoResponse(BaseSchema):
+    id: str
+    contratto_cliente_id: str
+    attivita_id: Optional[str]
+    ore_scalate: float
+    data_utilizzo: date
+    note: Optional[str]
+    created_by_id: Optional[str]
+    created_at: datetime
+
+
+class RicalcoloOreRequest(BaseModel):
+    contratti_ids: Optional[List[str]] = None  # None = tutti i contratti monte ore
+
+
 # =============================================
 # SCHEDULE SCHEMAS
 # =============================================
@@ -520,5 +581,145 @@ class MessaggioResponse(MessaggioBase, BaseSchema):
     created_at: datetime
 
 
+# =============================================
+# BROGLIACCIO SCHEMAS
+# =============================================
+class BrogliaccioBase(BaseModel):
+    contenuto: str = Field(..., min_length=1)
+    tipo: str = Field("text", max_length=20)
+    media_url: Optional[str] = Field(None, max_length=500)
+    metadata_json: Optional[dict] = None
+
+
+class BrogliaccioCreate(BrogliaccioBase):
+    pass
+
+
+class BrogliaccioUpdate(BaseModel):
+    contenuto: Optional[str] = Field(None, min_length=1)
+    tipo: Optional[str] = Field(None, max_length=20)
+    media_url: Optional[str] = None
+    metadata_json: Optional[dict] = None
+    stato: Optional[str] = Field(None, max_length=20)
+
+
+class BrogliaccioResponse(BrogliaccioBase, BaseSchema):
+    id: str
+    utente_id: str
+    stato: str
+    versione: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class BrogliaccioModifiche(BaseModel):
+    versione: int  # da passare come da_versione alla richiesta successiva
+    completo: bool  # True: elenco completo, il client sostituisce il suo stato
+    voci: List[BrogliaccioResponse]
+    eliminati: List[str]
+
+
+class TipoOperazioneBrogliaccio(str, Enum):
+    create = "create"
+    update = "update"
+    delete = "delete"
+
+
+class BrogliaccioOperazione(BaseModel):
+    op: TipoOperazioneBrogliaccio
+    chiave: Optional[str] = Field(None, min_length=1, max_length=100)  # idempotenza: stesso esito ai retry
+    id: Optional[str] = None  # voce da aggiornare/eliminare
+    contenuto: Optional[str] = Field(None, min_length=1)
+    tipo: Optional[str] = Field(None, max_length=20)
+    media_url: Optional[str] = Field(None, max_length=500)
+    metadata_json: Optional[dict] = None
+    stato: Optional[str] = Field(None, max_length=20)
+
+
+class BrogliaccioBatch(BaseModel):
+    operazioni: List[BrogliaccioOperazione] = Field(..., min_length=1, max_length=500)
+
+
+class EsitoOperazioneBrogliaccio(BaseModel):
+    indice: int
+    op: TipoOperazioneBrogliaccio
+    chiave: Optional[str] = None
+    id: Optional[str] = None
+    ok: bool
+    ripetuta: bool = False  # chiave già applicata: esito originale
+    errore: Optional[str] = None
+
+
+class BrogliaccioBatchResponse(BaseModel):
+    versione: int
+    applicate: int
+    esiti: List[EsitoOperazioneBrogliaccio]
+
+
+# =============================================
+# TRANSIZIONI IN BLOCCO SCHEMAS
+# =============================================
+class EsitoTransizione(BaseModel):
+    id: str
+    ok: bool
+    stato_precedente: Optional[str] = None
+    errore: Optional[str] = None
+
+
+class TransizioneBulkResponse(BaseModel):
+    nuovo_stato: str
+    aggiornate: int
+    esiti: List[EsitoTransizione]
+
+
+# =============================================
+# FATTURAZIONE SCHEMAS
+# =============================================
+class FatturazioneTransizione(BaseModel):
+    stato_origine: StatoRichiesta  # validata -> da_fatturare, da_fatturare -> fatturata
+    cliente_id: Optional[str] = None
+    da: Optional[datetime] = None
+    a: Optional[datetime] = None
+    richieste_ids: Optional[List[str]] = None  # obbligatorio per da_fatturare -> fatturata
+
+
+class FatturazioneTransizioneResponse(BaseModel):
+    nuovo_stato: StatoRichiesta
+    totale: int
+    richieste_ids: List[str]
+
+
+# =============================================
+# CALENDARIO SCHEMAS
+# =============================================
+class EventoCalendario(BaseModel):
+    id: str
+    tipo: str  # richiesta | attivita
+    titolo: str
+    inizio: Optional[datetime]  # None: appuntamento rimosso (solo con updated_since)
+    fine: Optional[datetime]
+    stato: str
+    priorita: Optional[str]
+    richiesta_id: str
+    tecnico_id: Optional[str]
+
+
+class CalendarioResponse(BaseModel):
+    eventi: List[EventoCalendario]
+    eliminati: List[str] = []  # solo con updated_since: id degli eventi eliminati
+    aggiornato_al: datetime  # da passare come updated_since al refresh successivo
+
+
+# =============================================
+# RICERCA SCHEMAS
+# =============================================
+class RisultatoRicerca(BaseModel):
+    tipo: str  # cliente | richiesta | utente
+    id: str
+    titolo: str
+    sottotitolo: Optional[str] = None
+    rank: float
+
+
 # Forward references
 RichiestaDetailResponse.model_rebuild()
@@ -1,6 +1,26 @@
 """
 Services package
 """
-from .email import send_verification_email, send_password_reset_email
+from .email import (
+    send_verification_email,
+    send_password_reset_email,
+    send_notification_email,
+    send_chat_notification_email,
+)
+from .mail_queue import get_mail_queue
+from .chat_hub import get_chat_hub
+from .user_cache import get_user_cache, invalidate_user
+from .catalog_cache import get_catalog_cache, invalidate_catalog
 
-__all__ = ["send_verification_email", "send_password_reset_email"]
+__all__ = [
+    "send_verification_email",
+    "send_password_reset_email",
+    "send_notification_email",
+    "send_chat_notification_email",
+    "get_mail_queue",
+    "get_chat_hub",
+    "get_user_cache",
+    "invalidate_user",
+    "get_catalog_cache",
+    "invalidate_catalog",
+]
@@ -0,0 +1,224 @@
+"""
+Versioni e delta sync del brogliaccio
+
+Ogni modifica (creazione, aggiornamento, eliminazione) incrementa il
+contatore dell'utente con un upsert atomico (il lock di riga serializza le
+transazioni dello stesso utente, quindi le versioni diventano visibili in
+ordine) e marca la voce con la nuova versione. Le eliminazioni lasciano una
+tombstone. Il client chiede le modifiche dopo l'ultima versione vista e
+riceve solo le voci cambiate e gli id eliminati; le tombstone più vecchie
+di BROGLIACCIO_TOMBSTONE_GIORNI vengono rimosse e chi è rimasto indietro
+riceve l'elenco completo.
+
+Le operazioni batch (board offline) sono applicate in una transazione con
+un solo incremento di versione e un INSERT executemany per le nuove voci;
+l'esito di ogni operazione con chiave resta salvato e viene restituito
+uguale ai retry del client.
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import Brogliaccio, BrogliaccioEliminato, BrogliaccioIdempotenza, BrogliaccioVersione
+from ..schemas import BrogliaccioOperazione, TipoOperazioneBrogliaccio
+from .chat_hub import get_chat_hub
+
+settings = get_settings()
+
+# Campi della voce impostabili da un'operazione batch
+CAMPI_VOCE = {"contenuto", "tipo", "media_url", "metadata_json", "stato"}
+# Campi che non accettano null espliciti (NOT NULL o obbligatori in BrogliaccioResponse)
+CAMPI_NON_NULLI = ("contenuto", "tipo", "stato")
+
+
+class ChiaviInElaborazione(Exception):
+    """Chiavi di idempotenza già registrate da una richiesta concorrente"""
+
+
+def canale_brogliaccio(utente_id: str) -> str:
+    return f"brogliaccio:{utente_id}"
+
+
+def campi_nulli(valori: Dict[str, Any]) -> List[str]:
+    """Campi obbligatori impostati esplicitamente a null in un aggiornamento"""
+    return [campo for campo in CAMPI_NON_NULLI if campo in valori and valori[campo] is None]
+
+
+def _insert_versione(db: AsyncSession):
+    """INSERT con supporto ON CONFLICT per il dialetto della sessione"""
+    if db.bind.dialect.name == "postgresql":
+        return pg_insert(BrogliaccioVersione)
+    return sqlite_insert(BrogliaccioVersione)
+
+
+async def prossima_versione(db: AsyncSession, utente_id: str) -> int:
+    """Incrementa e ritorna la versione del brogliaccio dell'utente (nella transazione corrente)"""
+    stmt = _insert_versione(db).values(utente_id=utente_id, versione=1, versione_minima=0)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BrogliaccioVersione.utente_id],
+        set_={"versione": BrogliaccioVersione.versione + 1}
+    ).returning(BrogliaccioVersione.versione)
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def registra_eliminazioni(db: AsyncSession, utente_id: str, ids: List[str], versione: int) -> None:
+    """Tombstone per le voci eliminate; rimuove quelle dell'utente oltre la conservazione"""
+    if ids:
+        db.add_all(BrogliaccioEliminato(id=id_, utente_id=utente_id, versione=versione) for id_ in ids)
+    limite = datetime.utcnow() - timedelta(days=settings.BROGLIACCIO_TOMBSTONE_GIORNI)
+    rimosse = await db.execute(
+        delete(BrogliaccioEliminato)
+        .where(BrogliaccioEliminato.utente_id == utente_id, BrogliaccioEliminato.eliminato_il < limite)
+        .returning(BrogliaccioEliminato.versione)
+        .execution_options(synchronize_session=False)
+    )
+    versioni = rimosse.scalars().all()
+    if versioni:
+        # Le tombstone si rimuovono in ordine di età, quindi di versione
+        await db.execute(
+            update(BrogliaccioVersione)
+            .where(BrogliaccioVersione.utente_id == utente_id)
+            .values(versione_minima=max(versioni))
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def modifiche(db: AsyncSession, utente_id: str, da_versione: int) -> Dict[str, Any]:
+    """
+    Voci modificate ed id eliminati dopo `da_versione`. Con da_versione 0 o
+    precedente alle tombstone conservate ritorna l'elenco completo (completo=True).
+    """
+    riga = (await db.execute(
+        select(BrogliaccioVersione.versione, BrogliaccioVersione.versione_minima)
+        .where(BrogliaccioVersione.utente_id == utente_id)
+    )).first()
+    versione, versione_minima = riga if riga else (0, 0)
+
+    completo = da_versione <= 0 or da_versione < versione_minima or da_versione > versione
+    query = select(Brogliaccio).where(Brogliaccio.utente_id == utente_id)
+    eliminati: List[str] = []
+    if not completo:
+        query = query.where(Brogliaccio.versione > da_versione)
+        eliminati = list((await db.execute(
+            select(BrogliaccioEliminato.id).where(
+                BrogliaccioEliminato.utente_id == utente_id,
+                BrogliaccioEliminato.versione > da_versione
+            )
+        )).scalars().all())
+    voci = (await db.execute(query.order_by(Brogliaccio.versione, Brogliaccio.created_at))).scalars().all()
+    return {"versione": versione, "completo": completo, "voci": voci, "eliminati": eliminati}
+
+
+async def notifica_versione(utente_id: str, versione: int) -> None:
+    """Push ai client collegati: il client scarica poi le modifiche dopo la sua versione"""
+    await get_chat_hub().publish([canale_brogliaccio(utente_id)], {"tipo": "brogliaccio", "versione": versione})
+
+
+async def applica_batch(db: AsyncSession, utente_id: str, operazioni: List[BrogliaccioOperazione]) -> Dict[str, Any]:
+    """
+    Applica le operazioni in ordine nella transazione corrente (commit al
+    chiamante). Le operazioni non valide hanno esito con errore e non
+    bloccano le altre; quelle con chiave già vista ripetono l'esito salvato.
+    ChiaviInElaborazione se una richiesta concorrente ha registrato le stesse chiavi.
+    """
+    chiavi = {op.chiave for op in operazioni if op.chiave}
+    precedenti: Dict[str, Dict[str, Any]] = {}
+    if chiavi:
+        precedenti = dict((await db.execute(
+            select(BrogliaccioIdempotenza.chiave, BrogliaccioIdempotenza.esito).where(
+                BrogliaccioIdempotenza.utente_id == utente_id,
+                BrogliaccioIdempotenza.chiave.in_(chiavi)
+            )
+        )).all())
+
+    ids = {op.id for op in operazioni if op.id and op.op != TipoOperazioneBrogliaccio.create}
+    voci: Dict[str, Brogliaccio] = {}
+    if ids:
+        voci = {voce.id: voce for voce in (await db.execute(
+            select(Brogliaccio).where(Brogliaccio.utente_id == utente_id, Brogliaccio.id.in_(ids))
+        )).scalars()}
+
+    nuove: List[Dict[str, Any]] = []
+    aggiornate: Dict[str, Brogliaccio] = {}
+    eliminate: List[str] = []
+    nuove_chiavi: List[Dict[str, Any]] = []
+    esiti: List[Dict[str, Any]] = []
+    for indice, op in enumerate(operazioni):
+        if op.chiave in precedenti:
+            esiti.append({**precedenti[op.chiave], "indice": indice, "ripetuta": True})
+            continue
+
+        esito = {"indice": indice, "op": op.op.value, "chiave": op.chiave, "id": op.id, "ok": False, "errore": None}
+        valori = op.model_dump(include=CAMPI_VOCE, exclude_unset=True)
+        nulli = campi_nulli(valori)
+        if nulli and op.op != TipoOperazioneBrogliaccio.delete:
+            esito["errore"] = f"Campi obbligatori non annullabili: {', '.join(nulli)}"
+        elif op.op == TipoOperazioneBrogliaccio.create:
+            if not op.contenuto:
+                esito["errore"] = "Contenuto obbligatorio"
+            else:
+                esito["id"] = str(uuid.uuid4())
+                nuove.append({
+                    "tipo": "text", **valori,
+                    "id": esito["id"], "utente_id": utente_id, "stato": "draft"
+                })
+                esito["ok"] = True
+        elif op.id not in voci or op.id in eliminate:
+            esito["errore"] = "Voce non trovata"
+        elif op.op == TipoOperazioneBrogliaccio.update:
+            for key, value in valori.items():
+                setattr(voci[op.id], key, value)
+            aggiornate[op.id] = voci[op.id]
+            esito["ok"] = True
+        else:
+            eliminate.append(op.id)
+            aggiornate.pop(op.id, None)
+            esito["ok"] = True
+
+        esiti.append({**esito, "ripetuta": False})
+        if op.chiave:
+            precedenti[op.chiave] = esito
+            nuove_chiavi.append({"utente_id": utente_id, "chiave": op.chiave, "esito": esito})
+
+    applicate = sum(1 for esito in esiti if esito["ok"] and not esito["ripetuta"])
+    if applicate:
+        versione = await prossima_versione(db, utente_id)
+        if nuove:
+            # Un solo INSERT eseguito con executemany
+            await db.execute(insert(Brogliaccio), [{**voce, "versione": versione} for voce in nuove])
+        for voce in aggiornate.values():
+            voce.versione = versione
+        await db.flush()
+        if eliminate:
+            await db.execute(
+                delete(Brogliaccio)
+                .where(Brogliaccio.utente_id == utente_id, Brogliaccio.id.in_(eliminate))
+                .execution_options(synchronize_session=False)
+            )
+            await registra_eliminazioni(db, utente_id, eliminate, versione)
+    else:
+        versione = (await db.execute(
+            select(BrogliaccioVersione.versione).where(BrogliaccioVersione.utente_id == utente_id)
+        )).scalar() or 0
+
+    if nuove_chiavi:
+        try:
+            await db.execute(insert(BrogliaccioIdempotenza), nuove_chiavi)
+        except IntegrityError as exc:
+            raise ChiaviInElaborazione() from exc
+        # Stessa conservazione delle tombstone: oltre, un retry è comunque fuori sync
+        limite = datetime.utcnow() - timedelta(days=settings.BROGLIACCIO_TOMBSTONE_GIORNI)
+        await db.execute(
+            delete(BrogliaccioIdempotenza)
+            .where(BrogliaccioIdempotenza.utente_id == utente_id, BrogliaccioIdempotenza.created_at < limite)
+            .execution_options(synchronize_session=False)
+        )
+
+    return {"versione": versione, "applicate": applicate, "esiti": esiti}
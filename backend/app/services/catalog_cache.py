@@ -0,0 +1,169 @@
+"""
+Cache dei cataloghi di anagrafica (ambiti, contratti template)
+
+Ogni catalogo ha un numero di versione incrementato dagli endpoint di
+scrittura (invalidate_catalog dopo il commit). Le liste sono salvate già
+serializzate in JSON sotto la chiave (catalogo, versione, variante) insieme
+al loro ETag: una lettura avviata prima di una modifica finisce sotto la
+versione vecchia e non viene più servita. Backend in-process di default,
+Redis opzionale per condividere versioni e liste tra worker.
+"""
+import inspect
+import json
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from ..config import get_settings
+from ..utils.etag import make_etag, etag_matches
+
+settings = get_settings()
+
+# Cataloghi gestiti
+AMBITI = "ambiti"
+CONTRATTI_TEMPLATES = "contratti_templates"
+
+
+class MemoryCatalogCache:
+    """Versioni e liste nel processo (con più worker vale il TTL)"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._versioni: Dict[str, int] = {}
+        self._data: Dict[Tuple[str, int, str], tuple] = {}
+
+    async def versione(self, catalogo: str) -> int:
+        return self._versioni.get(catalogo, 0)
+
+    async def get(self, catalogo: str, versione: int, variante: str) -> Optional[Tuple[str, str]]:
+        item = self._data.get((catalogo, versione, variante))
+        if item is None:
+            return None
+        expires_at, etag, body = item
+        if expires_at < time.monotonic():
+            self._data.pop((catalogo, versione, variante), None)
+            return None
+        return etag, body
+
+    async def set(self, catalogo: str, versione: int, variante: str, etag: str, body: str) -> None:
+        if versione != self._versioni.get(catalogo, 0):
+            return
+        self._data[(catalogo, versione, variante)] = (time.monotonic() + self.ttl, etag, body)
+
+    async def invalidate(self, catalogo: str) -> None:
+        self._versioni[catalogo] = self._versioni.get(catalogo, 0) + 1
+        for key in [k for k in self._data if k[0] == catalogo]:
+            self._data.pop(key, None)
+
+
+class RedisCatalogCache:
+    """Versioni (INCR) e liste (SETEX) condivise su Redis"""
+
+    prefix = "catalog_cache:"
+
+    def __init__(self, url: str, ttl: int):
+        import redis.asyncio as redis
+
+        self.ttl = ttl
+        self._errors = redis.RedisError
+        self._client = redis.from_url(url)
+
+    async def versione(self, catalogo: str) -> Optional[int]:
+        try:
+            raw = await self._client.get(f"{self.prefix}versione:{catalogo}")
+        except self._errors as e:
+            print(f"[WARN] catalog cache Redis non disponibile: {e}")
+            return None
+        return int(raw) if raw else 0
+
+    async def get(self, catalogo: str, versione: int, variante: str) -> Optional[Tuple[str, str]]:
+        try:
+            raw = await self._client.get(f"{self.prefix}{catalogo}:{versione}:{variante}")
+        except self._errors as e:
+            print(f"[WARN] catalog cache Redis non disponibile: {e}")
+            return None
+        if not raw:
+            return None
+        item = json.loads(raw)
+        return item["etag"], item["body"]
+
+    async def set(self, catalogo: str, versione: int, variante: str, etag: str, body: str) -> None:
+        try:
+            await self._client.setex(
+                f"{self.prefix}{catalogo}:{versione}:{variante}",
+                self.ttl,
+                json.dumps({"etag": etag, "body": body})
+            )
+        except self._errors as e:
+            print(f"[WARN] catalog cache Redis non disponibile: {e}")
+
+    async def invalidate(self, catalogo: str) -> None:
+        # Le liste della versione precedente scadono da sole con il TTL
+        try:
+            await self._client.incr(f"{self.prefix}versione:{catalogo}")
+        except self._errors as e:
+            print(f"[WARN] catalog cache Redis non disponibile: {e}")
+
+
+@lru_cache()
+def get_catalog_cache():
+    """Singleton della cache cataloghi (backend da CATALOG_CACHE_BACKEND)"""
+    if settings.CATALOG_CACHE_BACKEND == "redis":
+        return RedisCatalogCache(settings.REDIS_URL, settings.CATALOG_CACHE_TTL_SECONDS)
+    return MemoryCatalogCache(settings.CATALOG_CACHE_TTL_SECONDS)
+
+
+async def invalidate_catalog(*cataloghi: str) -> None:
+    """Incrementa la versione dei cataloghi (da chiamare dopo il commit delle modifiche)"""
+    cache = get_catalog_cache()
+    for catalogo in cataloghi:
+        await cache.invalidate(catalogo)
+
+
+@lru_cache()
+def _adapter(schema) -> TypeAdapter:
+    return TypeAdapter(list[schema])
+
+
+def _cache_control() -> str:
+    if settings.CATALOG_CACHE_MAX_AGE_SECONDS > 0:
+        return f"private, max-age={settings.CATALOG_CACHE_MAX_AGE_SECONDS}"
+    return "private, no-cache"
+
+
+async def catalog_response(
+    request: Request,
+    catalogo: str,
+    variante: Any,
+    schema,
+    loader: Callable[[], Union[list, Awaitable[list]]]
+) -> Response:
+    """
+    Lista del catalogo come risposta JSON già serializzata, con ETag e
+    Cache-Control (304 se If-None-Match corrisponde). `loader` legge le righe
+    dal database solo se la versione corrente non è in cache.
+    """
+    cache = get_catalog_cache()
+    variante = str(variante)
+    versione = await cache.versione(catalogo)
+
+    item = await cache.get(catalogo, versione, variante) if versione is not None else None
+    if item is None:
+        righe = loader()
+        if inspect.isawaitable(righe):
+            righe = await righe
+        adapter = _adapter(schema)
+        body = adapter.dump_json(adapter.validate_python(righe, from_attributes=True)).decode()
+        etag = make_etag(catalogo, body)
+        if versione is not None:
+            await cache.set(catalogo, versione, variante, etag, body)
+    else:
+        etag, body = item
+
+    headers = {"ETag": etag, "Cache-Control": _cache_control()}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,157 @@
+"""
+Hub di distribuzione eventi chat per le connessioni WebSocket
+
+Ogni connessione si iscrive a uno o più canali ("richiesta:<id>",
+"utente:<id>") e riceve gli eventi pubblicati (nuovi messaggi, conferme
+di lettura). Backend in-process di default; con CHAT_PUSH_BACKEND=redis
+gli eventi passano da Redis pub/sub, così arrivano ai client collegati a
+qualsiasi worker.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from ..config import get_settings
+
+settings = get_settings()
+
+# Eventi in attesa per connessione: oltre, i più vecchi vengono scartati
+MAX_EVENTI_IN_CODA = 100
+
+
+def canale_richiesta(richiesta_id: str) -> str:
+    return f"richiesta:{richiesta_id}"
+
+
+def canale_utente(utente_id: str) -> str:
+    return f"utente:{utente_id}"
+
+
+class ChatHub:
+    """Fan-out in-process: canale -> code delle connessioni iscritte"""
+
+    def __init__(self):
+        self._iscritti: Dict[str, Set[asyncio.Queue]] = {}
+
+    @property
+    def connessioni(self) -> int:
+        return len({id(q) for code in self._iscritti.values() for q in code})
+
+    @asynccontextmanager
+    async def subscribe(self, canali: Iterable[str]) -> AsyncIterator[asyncio.Queue]:
+        """Iscrive una coda ai canali per la durata del blocco"""
+        coda: asyncio.Queue = asyncio.Queue(maxsize=MAX_EVENTI_IN_CODA)
+        canali = list(canali)
+        for canale in canali:
+            self._iscritti.setdefault(canale, set()).add(coda)
+        try:
+            yield coda
+        finally:
+            for canale in canali:
+                code = self._iscritti.get(canale)
+                if code is not None:
+                    code.discard(coda)
+                    if not code:
+                        del self._iscritti[canale]
+
+    async def publish(self, canali: Iterable[str], evento: Dict[str, Any]) -> None:
+        """Pubblica l'evento sui canali (una sola consegna per connessione)"""
+        consegnate = set()
+        for canale in canali:
+            for coda in list(self._iscritti.get(canale, ())):
+                if id(coda) in consegnate:
+                    continue
+                consegnate.add(id(coda))
+                if coda.full():
+                    # Client lento: perde l'evento più vecchio, non blocca gli altri
+                    coda.get_nowait()
+                coda.put_nowait(evento)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class RedisChatHub(ChatHub):
+    """Pubblica su Redis; un listener per worker consegna ai client locali"""
+
+    prefix = "chat:"
+
+    def __init__(self, url: str):
+        super().__init__()
+        import redis.asyncio as redis
+
+        self._errors = redis.RedisError
+        self._client = redis.from_url(url)
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, canali: Iterable[str], evento: Dict[str, Any]) -> None:
+        # Un solo messaggio Redis con tutti i canali: il listener deduplica
+        payload = json.dumps({"canali": list(canali), "evento": evento})
+        try:
+            await self._client.publish(self.prefix + "eventi", payload)
+        except self._errors as e:
+            print(f"[WARN] chat push Redis non disponibile, consegna solo locale: {e}")
+            await super().publish(canali, evento)
+
+    async def _ascolta(self) -> None:
+        while True:
+            try:
+                async with self._client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.prefix + "eventi")
+                    async for messaggio in pubsub.listen():
+                        if messaggio["type"] != "message":
+                            continue
+                        dati = json.loads(messaggio["data"])
+                        await ChatHub.publish(self, dati["canali"], dati["evento"])
+            except asyncio.CancelledError:
+                raise
+            except self._errors as e:
+                print(f"[WARN] chat push Redis disconnesso, nuovo tentativo tra 5s: {e}")
+                await asyncio.sleep(5)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._ascolta())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def inoltra_eventi(websocket: WebSocket, canali: List[str]) -> None:
+    """Accetta il WebSocket e inoltra al client gli eventi dei canali finché resta collegato"""
+    await websocket.accept()
+    async with get_chat_hub().subscribe(canali) as coda:
+        async def _invia():
+            while True:
+                await websocket.send_json(await coda.get())
+
+        invio = asyncio.create_task(_invia())
+        try:
+            # Il client non invia dati: la lettura serve a rilevare la disconnessione
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            invio.cancel()
+
+
+@lru_cache()
+def get_chat_hub() -> ChatHub:
+    """Singleton dell'hub chat (backend da CHAT_PUSH_BACKEND)"""
+    if settings.CHAT_PUSH_BACKEND == "redis":
+        return RedisChatHub(settings.REDIS_URL)
+    return ChatHub()
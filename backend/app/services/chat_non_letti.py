@@ -0,0 +1,60 @@
+"""
+Contatori dei messaggi chat non letti (tabella chat_non_letti)
+
+Una riga per (utente, richiesta): send_messaggio incrementa il contatore
+dei partecipanti diversi dall'autore, mark_read lo azzera per chi legge.
+/chat/non-letti legge solo le righe dell'utente invece di contare i
+messaggi di tutte le richieste.
+"""
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import ChatNonLetti
+
+
+def _insert(db: AsyncSession):
+    """INSERT con supporto ON CONFLICT per il dialetto della sessione"""
+    if db.bind.dialect.name == "postgresql":
+        return pg_insert(ChatNonLetti)
+    return sqlite_insert(ChatNonLetti)
+
+
+async def incrementa_non_letti(db: AsyncSession, richiesta_id: str, utenti_ids: Iterable[str]) -> None:
+    """+1 per ogni utente (upsert), nella transazione corrente"""
+    righe = [{"utente_id": uid, "richiesta_id": richiesta_id, "non_letti": 1} for uid in set(utenti_ids)]
+    if not righe:
+        return
+    stmt = _insert(db)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ChatNonLetti.utente_id, ChatNonLetti.richiesta_id],
+            set_={"non_letti": ChatNonLetti.non_letti + 1}
+        ),
+        righe
+    )
+
+
+async def azzera_non_letti(db: AsyncSession, utente_id: str, richiesta_id: str) -> None:
+    """Rimuove il contatore dell'utente per la richiesta (tutto letto)"""
+    await db.execute(
+        delete(ChatNonLetti).where(
+            ChatNonLetti.utente_id == utente_id,
+            ChatNonLetti.richiesta_id == richiesta_id
+        )
+    )
+
+
+async def get_non_letti(db: AsyncSession, utente_id: str) -> Tuple[int, Dict[str, int]]:
+    """Totale e dettaglio per richiesta dei non letti dell'utente"""
+    result = await db.execute(
+        select(ChatNonLetti.richiesta_id, ChatNonLetti.non_letti).where(
+            ChatNonLetti.utente_id == utente_id,
+            ChatNonLetti.non_letti > 0
+        )
+    )
+    per_richiesta = {richiesta_id: non_letti for richiesta_id, non_letti in result.all()}
+    return sum(per_richiesta.values()), per_richiesta
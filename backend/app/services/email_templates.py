@@ -0,0 +1,120 @@
+"""
+Template email (Jinja2) compilati una sola volta
+
+I template in app/templates/email estendono layout.html; le regole di
+email.css vengono trasformate in attributi style quando il sorgente viene
+caricato (molti client email ignorano <style>), quindi il rendering non
+ha costi legati al CSS. Tutti i template vengono compilati all'avvio e i
+rendering con lo stesso contesto (es. promemoria identici a molti
+destinatari) sono serviti da una cache LRU, tranne i template con token
+monouso (verifica email, reset password) che non devono restare in memoria.
+"""
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Hashable, List, Tuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template, select_autoescape
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates" / "email"
+CSS_FILE = "email.css"
+RENDER_CACHE_SIZE = 1024
+# Template con link contenenti token: sempre renderizzati, mai in cache
+TEMPLATE_NON_CACHE = frozenset({"verifica_email.html", "verifica_email.txt", "reset_password.html"})
+
+_CSS_RULE_RE = re.compile(r"([^{}]+)\{([^}]*)\}")
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_TAG_RE = re.compile(r"<([a-zA-Z][a-zA-Z0-9]*)(\s[^<>]*?)?(/?)>")
+_ATTR_RE = r'\s{name}="([^"]*)"'
+
+
+def parse_css(css: str) -> Dict[str, str]:
+    """Regole semplici 'selettore { dichiarazioni }' (tag o .classe) -> dichiarazioni"""
+    regole: Dict[str, str] = {}
+    for selettori, corpo in _CSS_RULE_RE.findall(_CSS_COMMENT_RE.sub("", css)):
+        dichiarazioni = "; ".join(d.strip() for d in corpo.split(";") if d.strip())
+        for selettore in selettori.split(","):
+            selettore = selettore.strip()
+            regole[selettore] = f"{regole[selettore]}; {dichiarazioni}" if selettore in regole else dichiarazioni
+    return regole
+
+
+def inline_css(html: str, regole: Dict[str, str]) -> str:
+    """Aggiunge a ogni tag lo style delle regole per tag e classi (lo style esistente vince)"""
+    def _sostituisci(match: re.Match) -> str:
+        tag, attributi, chiusura = match.group(1), match.group(2) or "", match.group(3)
+        stili: List[str] = []
+        if tag.lower() in regole:
+            stili.append(regole[tag.lower()])
+        classi = re.search(_ATTR_RE.format(name="class"), attributi)
+        if classi:
+            stili.extend(regole[f".{c}"] for c in classi.group(1).split() if f".{c}" in regole)
+        if not stili:
+            return match.group(0)
+        esistente = re.search(_ATTR_RE.format(name="style"), attributi)
+        if esistente:
+            stili.append(esistente.group(1).rstrip("; "))
+            attributi = attributi[:esistente.start()] + attributi[esistente.end():]
+        return f'<{tag}{attributi} style="{"; ".join(stili)}"{chiusura}>'
+
+    return _TAG_RE.sub(_sostituisci, html)
+
+
+class InlineCSSLoader(FileSystemLoader):
+    """Carica i template .html applicando email.css come stili inline"""
+
+    def __init__(self, searchpath: Path):
+        super().__init__(str(searchpath))
+        self.regole = parse_css((searchpath / CSS_FILE).read_text(encoding="utf-8"))
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if template.endswith(".html"):
+            source = inline_css(source, self.regole)
+        return source, filename, uptodate
+
+
+class EmailTemplates:
+    """Ambiente Jinja2 con tutti i template email precompilati"""
+
+    def __init__(self, template_dir: Path = TEMPLATE_DIR):
+        self.env = Environment(
+            loader=InlineCSSLoader(template_dir),
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self.templates: Dict[str, Template] = {
+            name: self.env.get_template(name)
+            for name in self.env.list_templates(extensions=["html", "txt"])
+        }
+        self._render_cached = lru_cache(maxsize=RENDER_CACHE_SIZE)(self._render)
+
+    def _render(self, name: str, context: Tuple[Tuple[str, Hashable], ...]) -> str:
+        return self.templates[name].render(dict(context))
+
+    def render(self, name: str, **context) -> str:
+        """Rendering del template `name`; contesti hashable passano dalla cache"""
+        if name not in self.templates:
+            raise KeyError(f"Template email non trovato: {name}")
+        chiave = tuple(sorted(context.items()))
+        if name in TEMPLATE_NON_CACHE:
+            return self._render(name, chiave)
+        try:
+            hash(chiave)
+        except TypeError:
+            return self._render(name, chiave)
+        return self._render_cached(name, chiave)
+
+
+@lru_cache()
+def get_email_templates() -> EmailTemplates:
+    """Singleton dei template email (compilati alla prima chiamata, all'avvio dell'app)"""
+    return EmailTemplates()
+
+
+def render_email(name: str, **context) -> str:
+    """Scorciatoia per get_email_templates().render()"""
+    return get_email_templates().render(name, **context)
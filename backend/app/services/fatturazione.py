@@ -0,0 +1,173 @@
+"""
+Export di fatturazione e passaggi di stato in blocco delle richieste
+
+L'export aggrega in un'unica query le attività delle richieste (per cliente,
+periodo, tipo addebito, contratto e fatturabilità) e la trasmette riga per
+riga in CSV o JSON lines leggendo il risultato con un cursore lato server:
+nessun elenco completo in memoria. Il periodo di competenza di una richiesta
+è il mese di validazione (o di creazione se non validata).
+
+Ogni riga riporta gli id delle richieste aggregate (richieste_ids): il
+passaggio a fatturata riceve esattamente quegli id, così le richieste
+entrate in da_fatturare dopo l'export non vengono fatturate senza essere
+state esportate.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import Select, and_, case, false, func, literal_column, select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import AsyncSessionLocal
+from ..models import Attivita, Cliente, Richiesta, StatoRichiesta, TipoAddebito, TipologiaAttivita
+
+FORMATI = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+COLONNE_EXPORT = (
+    "cliente_id", "ragione_sociale", "periodo", "tipo_addebito", "contratto_cliente_id",
+    "fatturabile", "richieste", "attivita", "minuti_totali", "ore_addebitate", "richieste_ids",
+)
+
+# Data di competenza della richiesta per il periodo di fatturazione
+DATA_COMPETENZA = func.coalesce(Richiesta.validata_il, Richiesta.created_at)
+
+# a_pagamento sempre, senza addebito secondo la tipologia, contratti/monte ore/inclusi no.
+# Solo costanti inline: l'espressione in SELECT e GROUP BY deve essere identica
+# anche su PostgreSQL con parametri posizionali.
+FATTURABILE = case(
+    (Attivita.tipo_addebito == literal_column(f"'{TipoAddebito.a_pagamento.value}'"), true()),
+    (Attivita.tipo_addebito.is_(None), func.coalesce(TipologiaAttivita.fatturabile, true())),
+    else_=false()
+)
+
+
+def periodo(dialect: str):
+    """Mese di competenza 'YYYY-MM' (formato inline: stessa espressione in SELECT e GROUP BY)"""
+    if dialect == "postgresql":
+        return func.to_char(DATA_COMPETENZA, literal_column("'YYYY-MM'"))
+    return func.strftime(literal_column("'%Y-%m'"), DATA_COMPETENZA)
+
+
+def elenco_richieste(dialect: str):
+    """Id distinti delle richieste del gruppo separati da virgola"""
+    if dialect == "postgresql":
+        return func.string_agg(func.distinct(Richiesta.id), literal_column("','"))
+    # SQLite: group_concat(DISTINCT ...) accetta solo il separatore di default ","
+    return func.group_concat(func.distinct(Richiesta.id))
+
+
+def filtro_richieste(
+    stato: StatoRichiesta,
+    cliente_id: Optional[str] = None,
+    da: Optional[datetime] = None,
+    a: Optional[datetime] = None,
+    richieste_ids: Optional[List[str]] = None
+) -> list:
+    """Condizioni sulle richieste comuni a export e passaggio di stato"""
+    condizioni = [Richiesta.stato == stato]
+    if cliente_id:
+        condizioni.append(Richiesta.cliente_id == cliente_id)
+    if da:
+        condizioni.append(DATA_COMPETENZA >= da)
+    if a:
+        condizioni.append(DATA_COMPETENZA < a)
+    if richieste_ids is not None:
+        condizioni.append(Richiesta.id.in_(richieste_ids))
+    return condizioni
+
+
+def query_export(dialect: str, condizioni: list, solo_fatturabili: bool = True) -> Select:
+    """Attività aggregate per cliente, periodo, tipo addebito, contratto e fatturabilità"""
+    mese = periodo(dialect).label("periodo")
+    fatturabile = FATTURABILE.label("fatturabile")
+    query = (
+        select(
+            Richiesta.cliente_id,
+            Cliente.ragione_sociale,
+            mese,
+            Attivita.tipo_addebito,
+            Attivita.contratto_cliente_id,
+            fatturabile,
+            func.count(func.distinct(Richiesta.id)).label("richieste"),
+            func.count(Attivita.id).label("attivita"),
+            func.coalesce(func.sum(Attivita.minuti_totali), 0).label("minuti_totali"),
+            func.coalesce(func.sum(Attivita.ore_addebitate), 0).label("ore_addebitate"),
+            elenco_richieste(dialect).label("richieste_ids"),
+        )
+        .select_from(Attivita)
+        .join(Richiesta, Richiesta.id == Attivita.richiesta_id)
+        .join(Cliente, Cliente.id == Richiesta.cliente_id)
+        .outerjoin(TipologiaAttivita, TipologiaAttivita.id == Attivita.tipologia_id)
+        .where(and_(*condizioni))
+        .group_by(
+            Richiesta.cliente_id, Cliente.ragione_sociale, mese,
+            Attivita.tipo_addebito, Attivita.contratto_cliente_id, fatturabile
+        )
+        .order_by(Cliente.ragione_sociale, Richiesta.cliente_id, mese)
+    )
+    if solo_fatturabili:
+        query = query.where(FATTURABILE)
+    return query
+
+
+def _valore(valore):
+    if hasattr(valore, "value"):  # enum
+        return valore.value
+    return valore
+
+
+def _riga(row) -> dict:
+    riga = {col: _valore(v) for col, v in zip(COLONNE_EXPORT, row)}
+    riga["fatturabile"] = bool(riga["fatturabile"])
+    riga["ore_addebitate"] = float(riga["ore_addebitate"] or 0)
+    riga["richieste_ids"] = sorted(riga["richieste_ids"].split(",")) if riga["richieste_ids"] else []
+    return riga
+
+
+async def stream_export(query: Select, formato: str, batch: int = 500) -> AsyncIterator[str]:
+    """
+    Righe dell'export nel formato richiesto. Usa una sessione propria: il
+    generatore gira mentre la risposta viene inviata, dopo la chiusura
+    della sessione della richiesta HTTP.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=batch))
+        if formato == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(COLONNE_EXPORT)
+            async for partition in result.partitions():
+                for row in partition:
+                    riga = _riga(row)
+                    riga["richieste_ids"] = ";".join(riga["richieste_ids"])
+                    writer.writerow(riga.values())
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            async for partition in result.partitions():
+                yield "".join(json.dumps(_riga(row), default=str) + "\n" for row in partition)
+
+
+async def transizione_in_blocco(
+    db: AsyncSession,
+    condizioni: list,
+    nuovo_stato: StatoRichiesta
+) -> List[str]:
+    """Un solo UPDATE sulle richieste che soddisfano le condizioni; ritorna gli id aggiornati"""
+    result = await db.execute(
+        update(Richiesta)
+        .where(*condizioni)
+        .values(stato=nuovo_stato, updated_at=datetime.utcnow())
+        .returning(Richiesta.id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(result.scalars().all())
@@ -0,0 +1,345 @@
+"""
+Import massivo dei clienti da CSV o XLSX
+
+Il file è letto in streaming (csv.reader / openpyxl in sola lettura) e
+processato a blocchi di IMPORT_CLIENTI_BLOCCO clienti: validazione con
+ClienteCreate, una sola query per blocco per i duplicati su email
+principale e partita IVA, INSERT executemany di clienti e sedi e commit.
+Se il database rifiuta il blocco, questo viene ripetuto riga per riga e
+solo le righe in errore vengono scartate. La memoria dipende dal blocco,
+non dalla dimensione del file; dopo ogni blocco viene emesso l'avanzamento.
+
+Formato: una riga per cliente con le colonne di ClienteCreate
+(email_secondarie e telefoni separati da ";") e le colonne sede_* per la
+sede; le righe con le sole colonne sede_* aggiungono una sede al cliente sopra.
+"""
+import asyncio
+import csv
+import io
+import json
+import re
+import time
+import uuid
+from itertools import chain
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import Cliente, SedeCliente
+from ..schemas import ClienteBase, ClienteCreate
+from .typeahead import get_clienti_typeahead
+
+try:
+    import openpyxl
+except ImportError:  # dipendenza opzionale (solo XLSX)
+    openpyxl = None
+
+settings = get_settings()
+
+FORMATI = ("csv", "xlsx")
+
+# Colonne del file per i campi del cliente e della sede
+COLONNE_CLIENTE = {campo: campo for campo in ClienteBase.model_fields}
+COLONNE_SEDE = {
+    "sede_nome": "nome_sede",
+    "sede_indirizzo": "indirizzo",
+    "sede_citta": "citta",
+    "sede_cap": "cap",
+    "sede_provincia": "provincia",
+    "sede_latitudine": "latitudine",
+    "sede_longitudine": "longitudine",
+    "sede_referente_nome": "referente_nome",
+    "sede_referente_telefono": "referente_telefono",
+    "sede_referente_email": "referente_email",
+    "sede_principale": "sede_principale",
+}
+CAMPI_LISTA = {"email_secondarie", "telefoni"}
+CAMPI_BOOL = {"gestione_interna", "sede_principale"}
+VERO = {"1", "true", "si", "sì", "x", "yes", "vero"}
+
+
+def _lunghezze(model) -> Dict[str, int]:
+    """Lunghezza massima delle colonne String del modello"""
+    return {c.name: c.type.length for c in model.__table__.columns if getattr(c.type, "length", None)}
+
+
+# Limiti delle colonne non coperti da ClienteCreate: controllati prima dell'INSERT
+LUNGHEZZE_CLIENTE = _lunghezze(Cliente)
+LUNGHEZZE_SEDE = _lunghezze(SedeCliente)
+# Righe con errore riportate nel riepilogo (il conteggio è sempre completo)
+ERRORI_MAX = 100
+
+
+def formato_file(nome_file: Optional[str]) -> str:
+    """Formato dall'estensione del file; ValueError se non supportato"""
+    formato = (nome_file or "").rsplit(".", 1)[-1].lower()
+    if formato not in FORMATI:
+        raise ValueError(f"Formato non supportato: usare {', '.join(FORMATI)}")
+    if formato == "xlsx" and openpyxl is None:
+        raise ValueError("Import XLSX non disponibile: installare openpyxl")
+    return formato
+
+
+def _cella(valore: Any) -> Optional[str]:
+    """Valore della cella come stringa (None se vuota); i numeri interi di Excel senza '.0'"""
+    if valore is None:
+        return None
+    if isinstance(valore, float) and valore.is_integer():
+        valore = int(valore)
+    testo = str(valore).strip()
+    return testo or None
+
+
+def _righe_csv(file: BinaryIO) -> Iterator[Dict[str, Optional[str]]]:
+    testo = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    prima = testo.readline()
+    # Separatore dall'intestazione: Excel in italiano salva con ";"
+    separatore = max(";,\t", key=prima.count)
+    reader = csv.reader(chain([prima], testo), delimiter=separatore)
+    intestazione = [_intestazione(h) for h in next(reader, [])]
+    for riga in reader:
+        yield dict(zip(intestazione, map(_cella, riga)))
+
+
+def _righe_xlsx(file: BinaryIO) -> Iterator[Dict[str, Optional[str]]]:
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        righe = workbook.active.iter_rows(values_only=True)
+        intestazione = [_intestazione(h) for h in next(righe, ())]
+        for riga in righe:
+            yield dict(zip(intestazione, map(_cella, riga)))
+    finally:
+        workbook.close()
+
+
+def _intestazione(valore: Any) -> str:
+    return re.sub(r"\s+", "_", str(valore or "").strip().lower())
+
+
+def leggi_righe(file: BinaryIO, formato: str) -> Iterator[Dict[str, Optional[str]]]:
+    """Righe del file come dict colonna -> valore, una alla volta"""
+    if formato == "xlsx":
+        return _righe_xlsx(file)
+    return _righe_csv(file)
+
+
+def _valori(riga: Dict[str, Optional[str]], colonne: Dict[str, str]) -> Dict[str, Any]:
+    """Campi non vuoti della riga, con liste e booleani convertiti"""
+    valori = {}
+    for colonna, campo in colonne.items():
+        valore = riga.get(colonna)
+        if valore is None:
+            continue
+        if campo in CAMPI_LISTA:
+            valore = [v.strip() for v in re.split(r"[;,]", valore) if v.strip()]
+        elif campo in CAMPI_BOOL:
+            valore = valore.lower() in VERO
+        valori[campo] = valore
+    return valori
+
+
+def _clienti(righe: Iterator[Dict[str, Optional[str]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(numero riga, dati cliente con sedi): le righe con sole colonne sede_* sono sedi del cliente sopra"""
+    corrente: Optional[Tuple[int, Dict[str, Any]]] = None
+    for numero, riga in enumerate(righe, start=2):  # riga 1 = intestazione
+        cliente = _valori(riga, COLONNE_CLIENTE)
+        sede = _valori(riga, COLONNE_SEDE)
+        if not cliente and not sede:
+            continue
+        if cliente or corrente is None:
+            if corrente:
+                yield corrente
+            corrente = (numero, {**cliente, "sedi": [sede] if sede else []})
+        else:
+            corrente[1]["sedi"].append(sede)
+    if corrente:
+        yield corrente
+
+
+def _errore(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors(include_url=False)
+    )
+
+
+def _troppo_lunghi(cliente: ClienteCreate) -> List[str]:
+    """Campi oltre la lunghezza della colonna (su PostgreSQL farebbero fallire l'INSERT)"""
+    def controlla(oggetto, lunghezze: Dict[str, int], prefisso: str = "") -> List[str]:
+        return [
+            f"{prefisso}{campo}: massimo {massimo} caratteri"
+            for campo, massimo in lunghezze.items()
+            if isinstance(getattr(oggetto, campo, None), str) and len(getattr(oggetto, campo)) > massimo
+        ]
+
+    errori = controlla(cliente, LUNGHEZZE_CLIENTE)
+    for i, sede in enumerate(cliente.sedi or []):
+        errori.extend(controlla(sede, LUNGHEZZE_SEDE, f"sedi.{i}."))
+    return errori
+
+
+def _prossimo_blocco(
+    clienti: Iterator[Tuple[int, Dict[str, Any]]],
+    dimensione: int,
+    stato: Dict[str, Any]
+) -> Optional[List[Tuple[int, ClienteCreate]]]:
+    """Legge e valida fino a `dimensione` clienti; None a file finito"""
+    validi = []
+    letti = 0
+    for numero, dati in clienti:
+        letti += 1
+        stato["righe"] = numero
+        try:
+            cliente = ClienteCreate.model_validate(dati)
+        except ValidationError as exc:
+            stato["scartati"] += 1
+            _segnala(stato, numero, _errore(exc))
+        else:
+            troppo_lunghi = _troppo_lunghi(cliente)
+            if troppo_lunghi:
+                stato["scartati"] += 1
+                _segnala(stato, numero, "; ".join(troppo_lunghi))
+            else:
+                validi.append((numero, cliente))
+        if letti >= dimensione:
+            break
+    return validi if letti else None
+
+
+def _segnala(stato: Dict[str, Any], numero: int, errore: str) -> None:
+    if len(stato["errori"]) < ERRORI_MAX:
+        stato["errori"].append({"riga": numero, "errore": errore})
+
+
+async def _inserisci_per_riga(db, righe: List[Tuple[int, Dict[str, Any], List[Dict[str, Any]]]], stato: Dict[str, Any]) -> None:
+    """
+    Dopo un errore sul blocco: un SAVEPOINT per cliente, così le righe non
+    valide per il database (chiave esterna, vincoli) vengono scartate e
+    riportate negli errori senza perdere le altre.
+    """
+    for numero, cliente, sedi in righe:
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(Cliente), [cliente])
+                if sedi:
+                    await db.execute(insert(SedeCliente), sedi)
+        except SQLAlchemyError as exc:
+            stato["scartati"] += 1
+            _segnala(stato, numero, f"Errore database: {getattr(exc, 'orig', exc)}")
+            continue
+        stato["importati"] += 1
+        stato["sedi"] += len(sedi)
+    await db.commit()
+
+
+def _avanzamento(stato: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in stato.items() if k != "errori"}
+
+
+async def importa_clienti(
+    righe: Iterator[Dict[str, Optional[str]]],
+    blocco: Optional[int] = None,
+    session_factory=AsyncSessionLocal
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Importa i clienti a blocchi con commit per blocco. Emette l'avanzamento
+    dopo ogni blocco e un riepilogo finale (completato, errori, durata_ms).
+    Un blocco rifiutato dal database è ripetuto riga per riga (SAVEPOINT):
+    le righe in errore finiscono in errori e l'import prosegue.
+    """
+    blocco = blocco or settings.IMPORT_CLIENTI_BLOCCO
+    clienti = _clienti(righe)
+    stato: Dict[str, Any] = {"righe": 0, "importati": 0, "sedi": 0, "duplicati": 0, "scartati": 0, "errori": []}
+    errore = None
+    inizio = time.perf_counter()
+
+    async with session_factory() as db:
+        while True:
+            try:
+                # Lettura e validazione fuori dall'event loop
+                validi = await asyncio.to_thread(_prossimo_blocco, clienti, blocco, stato)
+            except Exception as exc:  # file corrotto, codifica errata, ...
+                errore = f"File non leggibile: {exc}"
+                break
+            if validi is None:
+                break
+
+            email = {c.email_principale for _, c in validi}
+            partite_iva = {c.partita_iva for _, c in validi if c.partita_iva}
+            esistenti = await db.execute(
+                select(Cliente.email_principale, Cliente.partita_iva).where(
+                    or_(Cliente.email_principale.in_(email), Cliente.partita_iva.in_(partite_iva))
+                )
+            )
+            email_usate, partite_iva_usate = set(), set()
+            for email_principale, partita_iva in esistenti:
+                email_usate.add(email_principale)
+                partite_iva_usate.add(partita_iva)
+
+            righe_blocco = []
+            for numero, cliente in validi:
+                if cliente.email_principale in email_usate:
+                    stato["duplicati"] += 1
+                    _segnala(stato, numero, "Email già in uso")
+                    continue
+                if cliente.partita_iva and cliente.partita_iva in partite_iva_usate:
+                    stato["duplicati"] += 1
+                    _segnala(stato, numero, "Partita IVA già presente")
+                    continue
+                # Duplicati anche tra righe dello stesso file
+                email_usate.add(cliente.email_principale)
+                if cliente.partita_iva:
+                    partite_iva_usate.add(cliente.partita_iva)
+
+                cliente_id = str(uuid.uuid4())
+                righe_blocco.append((
+                    numero,
+                    {"id": cliente_id, **cliente.model_dump(exclude={"sedi"})},
+                    [{"cliente_id": cliente_id, **sede.model_dump()} for sede in cliente.sedi or []],
+                ))
+
+            nuovi_clienti = [dati for _, dati, _ in righe_blocco]
+            nuove_sedi = [sede for _, _, sedi in righe_blocco for sede in sedi]
+            try:
+                if nuovi_clienti:
+                    await db.execute(insert(Cliente), nuovi_clienti)
+                if nuove_sedi:
+                    await db.execute(insert(SedeCliente), nuove_sedi)
+                await db.commit()
+            except SQLAlchemyError as exc:
+                await db.rollback()
+                print(f"[WARN] Import clienti: blocco fino alla riga {stato['righe']} rifiutato ({exc.__class__.__name__}), inserimento riga per riga")
+                try:
+                    await _inserisci_per_riga(db, righe_blocco, stato)
+                except SQLAlchemyError as exc:
+                    await db.rollback()
+                    errore = f"Errore database al blocco fino alla riga {stato['righe']}: {exc.__class__.__name__}"
+                    print(f"[ERROR] Import clienti: {exc}")
+                    break
+            else:
+                stato["importati"] += len(nuovi_clienti)
+                stato["sedi"] += len(nuove_sedi)
+            yield _avanzamento(stato)
+
+    if stato["importati"]:
+        # Indice ricostruito alla prossima ricerca (più rapido di un inserimento alla volta)
+        get_clienti_typeahead().invalida()
+
+    durata_ms = round((time.perf_counter() - inizio) * 1000)
+    print(
+        f"[{'ERROR' if errore else 'OK'}] Import clienti: {stato['importati']} importati, "
+        f"{stato['duplicati']} duplicati, {stato['scartati']} scartati in {durata_ms} ms"
+    )
+    yield {**stato, "completato": errore is None, "errore": errore, "durata_ms": durata_ms}
+
+
+async def stream_import(file: BinaryIO, formato: str) -> AsyncIterator[str]:
+    """Avanzamento dell'import in JSON lines; chiude il file al termine"""
+    try:
+        async for avanzamento in importa_clienti(leggi_righe(file, formato)):
+            yield json.dumps(avanzamento) + "\n"
+    finally:
+        file.close()
@@ -0,0 +1,194 @@
+"""
+Coda di invio email con worker in background
+
+Gli endpoint accodano i messaggi (operazione immediata) e un unico worker li
+invia riusando una connessione SMTP autenticata persistente: STARTTLS e login
+avvengono una sola volta, non per ogni email. Il dialogo SMTP (bloccante con
+smtplib) gira in un thread, quindi l'event loop non viene mai fermato.
+I messaggi vengono inviati a lotti; gli errori temporanei vengono ritentati
+con backoff esponenziale, quelli definitivi (destinatario rifiutato) scartati.
+"""
+import asyncio
+import smtplib
+from dataclasses import dataclass
+from email.message import Message
+from functools import lru_cache
+from typing import List, Optional
+
+from ..config import get_settings
+
+settings = get_settings()
+
+# Errori per cui riprovare ha senso (connessione, risposte 4xx)
+ERRORI_TEMPORANEI = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+
+@dataclass
+class EmailInCoda:
+    msg: Message
+    tentativi: int = 0
+
+
+def _is_temporaneo(e: Exception) -> bool:
+    # Destinatari rifiutati al RCPT: temporaneo solo se tutti i codici sono 4xx
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return bool(e.recipients) and all(400 <= codice < 500 for codice, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    return isinstance(e, ERRORI_TEMPORANEI)
+
+
+class SMTPConnection:
+    """Connessione SMTP riutilizzabile (usata solo dal thread del worker)"""
+
+    def __init__(self):
+        self._server: Optional[smtplib.SMTP] = None
+
+    def _connect(self) -> smtplib.SMTP:
+        # Porta 465 usa SSL diretto (SMTP_SSL), le altre STARTTLS se abilitato
+        if settings.SMTP_PORT == 465:
+            server = smtplib.SMTP_SSL(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        else:
+            server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+            if settings.SMTP_STARTTLS:
+                server.starttls()
+        if settings.SMTP_USER and settings.SMTP_PASSWORD:
+            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        return server
+
+    def send(self, msg: Message) -> None:
+        """Invia un messaggio, riconnettendo una volta se il server ha chiuso"""
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._server = self._connect()
+            self._server.send_message(msg)
+
+    def close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                self._server.close()
+            self._server = None
+
+
+class MailQueue:
+    """Coda asyncio con un worker che invia a lotti su connessione persistente"""
+
+    def __init__(self, connection: Optional[SMTPConnection] = None):
+        self.connection = connection or SMTPConnection()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._retry_tasks: set = set()
+        self.inviati = 0
+        self.falliti = 0
+
+    @property
+    def in_coda(self) -> int:
+        return (self._queue.qsize() if self._queue else 0) + len(self._retry_tasks)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._task = asyncio.create_task(self._worker())
+
+    def enqueue(self, msg: Message) -> None:
+        """Accoda un messaggio (avvia il worker se non è ancora attivo)"""
+        self.start()
+        self._queue.put_nowait(EmailInCoda(msg))
+
+    async def _prendi_lotto(self) -> List[EmailInCoda]:
+        """Attende il primo messaggio, poi raccoglie quelli già pronti fino a SMTP_BATCH_SIZE"""
+        try:
+            lotto = [await asyncio.wait_for(self._queue.get(), timeout=settings.SMTP_IDLE_SECONDS)]
+        except asyncio.TimeoutError:
+            return []
+        while len(lotto) < settings.SMTP_BATCH_SIZE and not self._queue.empty():
+            lotto.append(self._queue.get_nowait())
+        return lotto
+
+    def _invia_lotto(self, lotto: List[EmailInCoda]) -> List[tuple]:
+        """Eseguito nel thread: ritorna gli errori (email, eccezione)"""
+        errori = []
+        for email in lotto:
+            try:
+                self.connection.send(email.msg)
+            except Exception as e:
+                errori.append((email, e))
+                if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)):
+                    # Stato della connessione incerto: la prossima send riconnette
+                    self.connection.close()
+        return errori
+
+    async def _worker(self) -> None:
+        while True:
+            lotto = await self._prendi_lotto()
+            if not lotto:
+                # Nessun messaggio da un po': chiude la connessione inattiva
+                await asyncio.to_thread(self.connection.close)
+                continue
+            errori = await asyncio.to_thread(self._invia_lotto, lotto)
+            self.inviati += len(lotto) - len(errori)
+            for email, e in errori:
+                self._gestisci_errore(email, e)
+            for _ in lotto:
+                self._queue.task_done()
+
+    def _gestisci_errore(self, email: EmailInCoda, e: Exception) -> None:
+        destinatari = email.msg["To"]
+        email.tentativi += 1
+        if not _is_temporaneo(e) or email.tentativi > settings.SMTP_MAX_RETRIES:
+            self.falliti += 1
+            print(f"[ERROR] Email a {destinatari} scartata dopo {email.tentativi} tentativi: {type(e).__name__}: {e}")
+            return
+        attesa = settings.SMTP_RETRY_BACKOFF_SECONDS * 2 ** (email.tentativi - 1)
+        print(f"[WARN] Invio email a {destinatari} fallito ({type(e).__name__}), nuovo tentativo tra {attesa}s")
+        task = asyncio.create_task(self._riaccoda(email, attesa))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _riaccoda(self, email: EmailInCoda, attesa: float) -> None:
+        await asyncio.sleep(attesa)
+        self._queue.put_nowait(email)
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attende lo svuotamento della coda (ritentativi compresi); False se scade il timeout"""
+        async def _attendi():
+            # join() copre anche il lotto in invio (task_done dopo l'invio)
+            await self._queue.join()
+            while self._retry_tasks:
+                # wait() e non gather(): allo scadere del timeout i ritentativi non vengono cancellati
+                await asyncio.wait(set(self._retry_tasks))
+                await self._queue.join()
+        if self._queue is None:
+            return True
+        try:
+            await asyncio.wait_for(_attendi(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Invia i messaggi rimasti (entro il timeout), poi ferma il worker e chiude la connessione"""
+        if self._task is None:
+            return
+        if not await self.flush(timeout):
+            # Contati prima di cancellare i ritentativi (che escono da _retry_tasks)
+            non_inviati = self.in_coda
+            self.falliti += non_inviati
+            print(f"[WARN] Coda email: {non_inviati} messaggi non inviati allo spegnimento")
+        for task in [self._task, *self._retry_tasks]:
+            task.cancel()
+        await asyncio.gather(self._task, *self._retry_tasks, return_exceptions=True)
+        self._task = None
+        self._queue = None
+        await asyncio.to_thread(self.connection.close)
+
+
+@lru_cache()
+def get_mail_queue() -> MailQueue:
+    """Singleton della coda email"""
+    return MailQueue()
@@ -0,0 +1,239 @@
+"""
+Registro del monte ore dei contratti cliente (tabella utilizzi_contratto)
+
+Ogni variazione è una riga di UtilizzoContratto (negativa per gli storni) e
+ore_utilizzate viene aggiornato nella stessa transazione con un UPDATE
+atomico (ore_utilizzate = ore_utilizzate + n ... RETURNING): il lock di riga
+serializza gli addebiti concorrenti sullo stesso contratto, lo stato passa
+a esaurito (o torna attivo dopo uno storno) nello stesso statement e solo la
+transazione che attraversa la soglia genera l'alert. Sostituisce il trigger
+PostgreSQL calcola_ore_residue, così vale anche su SQLite.
+
+soglia_alert_ore è la percentuale di ore residue sotto cui avvisare gli admin.
+"""
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import Update, and_, case, func, literal, not_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import (
+    Attivita, ContrattoCliente, UtilizzoContratto, Utente,
+    StatoContratto, TipoAddebito, TipoContratto, UserRole,
+)
+from .email import send_notification_email
+
+CENTESIMI = Decimal("0.01")
+
+
+@dataclass
+class EsitoUtilizzo:
+    contratto_cliente_id: str
+    ore_scalate: Decimal
+    ore_utilizzate: Decimal
+    ore_totali: Optional[int]
+    stato: StatoContratto
+    alert: Optional[str] = None  # "soglia" | "esaurito"
+
+    @property
+    def ore_residue(self) -> Optional[Decimal]:
+        if self.ore_totali is None:
+            return None
+        return Decimal(self.ore_totali) - self.ore_utilizzate
+
+
+def _stato(valore: StatoContratto):
+    return literal(valore, ContrattoCliente.__table__.c.stato.type)
+
+
+def _nuovo_stato(ore_utilizzate):
+    """CASE che porta lo stato a esaurito (o di nuovo attivo) in base alle ore"""
+    esaurito = and_(ContrattoCliente.ore_totali.isnot(None), ore_utilizzate >= ContrattoCliente.ore_totali)
+    return case(
+        (and_(ContrattoCliente.stato == StatoContratto.attivo, esaurito), _stato(StatoContratto.esaurito)),
+        (and_(ContrattoCliente.stato == StatoContratto.esaurito, not_(esaurito)), _stato(StatoContratto.attivo)),
+        else_=ContrattoCliente.stato
+    )
+
+
+def _soglia_attraversata(ore_totali: Optional[int], soglia: Optional[int], prima: Decimal, dopo: Decimal) -> Optional[str]:
+    """Tipo di alert se le ore residue hanno appena superato in discesa una soglia"""
+    if not ore_totali:
+        return None
+    residue_prima = Decimal(ore_totali) - prima
+    residue_dopo = Decimal(ore_totali) - dopo
+    if residue_prima > 0 >= residue_dopo:
+        return "esaurito"
+    soglia_ore = Decimal(ore_totali) * Decimal(soglia or 0) / 100
+    if residue_prima > soglia_ore >= residue_dopo:
+        return "soglia"
+    return None
+
+
+async def registra_utilizzo(
+    db: AsyncSession,
+    contratto_cliente_id: str,
+    ore,
+    attivita_id: Optional[str] = None,
+    voce_contratto_cliente_id: Optional[str] = None,
+    data_utilizzo: Optional[date] = None,
+    note: Optional[str] = None,
+    utente_id: Optional[str] = None
+) -> EsitoUtilizzo:
+    """
+    Scala `ore` (negative = storno) dal contratto monte ore e registra
+    l'utilizzo, nella transazione corrente. ValueError se il contratto
+    non esiste o non è monte ore.
+    """
+    ore = Decimal(str(ore)).quantize(CENTESIMI)
+    ore_utilizzate = func.coalesce(ContrattoCliente.ore_utilizzate, 0) + ore
+    result = await db.execute(
+        update(ContrattoCliente)
+        .where(
+            ContrattoCliente.id == contratto_cliente_id,
+            ContrattoCliente.tipo == TipoContratto.monte_ore
+        )
+        .values(ore_utilizzate=ore_utilizzate, stato=_nuovo_stato(ore_utilizzate))
+        .returning(
+            ContrattoCliente.ore_totali,
+            ContrattoCliente.ore_utilizzate,
+            ContrattoCliente.soglia_alert_ore,
+            ContrattoCliente.stato
+        )
+        .execution_options(synchronize_session=False)
+    )
+    contratto = result.one_or_none()
+    if contratto is None:
+        raise ValueError("Contratto monte ore non trovato")
+
+    db.add(UtilizzoContratto(
+        contratto_cliente_id=contratto_cliente_id,
+        attivita_id=attivita_id,
+        voce_contratto_cliente_id=voce_contratto_cliente_id,
+        ore_scalate=ore,
+        data_utilizzo=data_utilizzo or date.today(),
+        note=note,
+        created_by_id=utente_id
+    ))
+
+    dopo = Decimal(str(contratto.ore_utilizzate)).quantize(CENTESIMI)
+    alert = None
+    if ore > 0:
+        alert = _soglia_attraversata(contratto.ore_totali, contratto.soglia_alert_ore, dopo - ore, dopo)
+    return EsitoUtilizzo(
+        contratto_cliente_id=contratto_cliente_id,
+        ore_scalate=ore,
+        ore_utilizzate=dopo,
+        ore_totali=contratto.ore_totali,
+        stato=StatoContratto(contratto.stato),
+        alert=alert
+    )
+
+
+async def allinea_addebito_attivita(
+    db: AsyncSession,
+    attivita: Attivita,
+    utente_id: Optional[str] = None
+) -> List[EsitoUtilizzo]:
+    """
+    Porta il registro in linea con l'addebito dell'attività: registra la
+    differenza tra le ore addebitate e quelle già scalate, con storno sul
+    contratto precedente se l'addebito è stato spostato o rimosso.
+    """
+    attese: Dict[str, Decimal] = {}
+    if attivita.tipo_addebito == TipoAddebito.monte_ore and attivita.contratto_cliente_id and attivita.ore_addebitate:
+        attese[attivita.contratto_cliente_id] = Decimal(str(attivita.ore_addebitate)).quantize(CENTESIMI)
+
+    result = await db.execute(
+        select(UtilizzoContratto.contratto_cliente_id, func.sum(UtilizzoContratto.ore_scalate))
+        .where(UtilizzoContratto.attivita_id == attivita.id)
+        .group_by(UtilizzoContratto.contratto_cliente_id)
+    )
+    registrate = {cid: Decimal(str(ore or 0)).quantize(CENTESIMI) for cid, ore in result.all()}
+
+    esiti = []
+    # Ordine fisso dei contratti: lock di riga sempre nello stesso ordine
+    for contratto_id in sorted(set(attese) | set(registrate)):
+        delta = attese.get(contratto_id, Decimal(0)) - registrate.get(contratto_id, Decimal(0))
+        if delta:
+            esiti.append(await registra_utilizzo(
+                db, contratto_id, delta,
+                attivita_id=attivita.id,
+                voce_contratto_cliente_id=attivita.voce_contratto_id,
+                note=None if delta > 0 else "Storno addebito",
+                utente_id=utente_id
+            ))
+    return esiti
+
+
+async def ricarica_monte_ore(db: AsyncSession, contratto_cliente_id: str, ore_aggiuntive: int) -> Optional[int]:
+    """Aumenta ore_totali atomicamente (riattiva se non più esaurito). Ritorna il nuovo totale"""
+    ore_totali = func.coalesce(ContrattoCliente.ore_totali, 0) + ore_aggiuntive
+    esaurito = func.coalesce(ContrattoCliente.ore_utilizzate, 0) >= ore_totali
+    result = await db.execute(
+        update(ContrattoCliente)
+        .where(
+            ContrattoCliente.id == contratto_cliente_id,
+            ContrattoCliente.tipo == TipoContratto.monte_ore
+        )
+        .values(
+            ore_totali=ore_totali,
+            stato=case(
+                (and_(ContrattoCliente.stato == StatoContratto.esaurito, not_(esaurito)), _stato(StatoContratto.attivo)),
+                else_=ContrattoCliente.stato
+            )
+        )
+        .returning(ContrattoCliente.ore_totali)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none()
+
+
+def ricalcolo_ore_utilizzate(contratti_ids: Optional[List[str]] = None) -> List[Update]:
+    """
+    UPDATE che ricalcolano dal registro ore_utilizzate e poi lo stato
+    (esaurito/attivo) di tutti i contratti monte ore, o solo di quelli indicati
+    """
+    somma = (
+        select(func.coalesce(func.sum(UtilizzoContratto.ore_scalate), 0))
+        .where(UtilizzoContratto.contratto_cliente_id == ContrattoCliente.id)
+        .scalar_subquery()
+    )
+    statements = [
+        update(ContrattoCliente).values(ore_utilizzate=somma),
+        update(ContrattoCliente).values(stato=_nuovo_stato(ContrattoCliente.ore_utilizzate)),
+    ]
+    for i, stmt in enumerate(statements):
+        stmt = stmt.where(ContrattoCliente.tipo == TipoContratto.monte_ore)
+        if contratti_ids is not None:
+            stmt = stmt.where(ContrattoCliente.id.in_(contratti_ids))
+        statements[i] = stmt.execution_options(synchronize_session=False)
+    return statements
+
+
+async def invia_alert_monte_ore(db: AsyncSession, esiti: List[EsitoUtilizzo]) -> None:
+    """Email agli admin per i contratti che hanno superato la soglia (dopo il commit)"""
+    esiti = [e for e in esiti if e.alert]
+    if not esiti:
+        return
+    result = await db.execute(
+        select(Utente.email).where(Utente.ruolo == UserRole.admin, Utente.attivo == True)
+    )
+    destinatari = list(result.scalars().all())
+    if not destinatari:
+        return
+
+    for esito in esiti:
+        contratto = await db.get(ContrattoCliente, esito.contratto_cliente_id)
+        nome = (contratto.nome_contratto_custom if contratto else None) or esito.contratto_cliente_id
+        if esito.alert == "esaurito":
+            oggetto = f"Monte ore esaurito: {nome}"
+        else:
+            oggetto = f"Monte ore in esaurimento: {nome}"
+        messaggio = (
+            f"Contratto {nome}: utilizzate {esito.ore_utilizzate} ore su {esito.ore_totali}, "
+            f"residue {esito.ore_residue}."
+        )
+        await send_notification_email(destinatari, oggetto, messaggio)
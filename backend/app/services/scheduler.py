@@ -0,0 +1,399 @@
+"""
+Motore di esecuzione degli Schedule (pianificazioni automatiche)
+
+Mantiene in memoria un min-heap (prossimo_trigger, schedule_id) degli schedule
+attivi e dorme fino al prossimo in scadenza, senza polling: i router lo
+risvegliano con notify() quando uno schedule viene creato/modificato.
+Ogni esecuzione "reclama" la riga con un UPDATE condizionato su
+prossimo_trigger, così più worker API possono eseguire il motore senza
+doppie esecuzioni.
+"""
+import asyncio
+import calendar
+import heapq
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import (
+    Schedule, Richiesta, ContrattoCliente,
+    FrequenzaSchedule, TipoAzioneSchedule, TipoEntitaSchedule,
+    StatoRichiesta, OrigineRichiesta,
+)
+from .email import send_notification_email
+
+settings = get_settings()
+
+# Mesi da aggiungere per le frequenze mensili
+MESI_FREQUENZA = {
+    FrequenzaSchedule.mensile: 1,
+    FrequenzaSchedule.bimestrale: 2,
+    FrequenzaSchedule.trimestrale: 3,
+    FrequenzaSchedule.semestrale: 6,
+    FrequenzaSchedule.annuale: 12,
+}
+
+GIORNI_FREQUENZA = {
+    FrequenzaSchedule.giornaliera: 1,
+    FrequenzaSchedule.settimanale: 7,
+}
+
+class ConfigurazioneNonValida(ValueError):
+    """Azione non eseguibile con la configurazione attuale: ripetere non serve"""
+
+
+# "45", "ogni 45 giorni", "2 settimane", "3 mesi", "1 anno"
+INTERVALLO_CUSTOM_RE = re.compile(r"(\d+)\s*(giorn|settiman|mes|ann)?", re.IGNORECASE)
+
+
+def normalizza_trigger(data: Optional[datetime]) -> Optional[datetime]:
+    """Converte date con timezone in UTC naive (come il resto del database)"""
+    if data is not None and data.tzinfo is not None:
+        return data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data
+
+
+def aggiungi_mesi(data: datetime, mesi: int) -> datetime:
+    """Aggiunge mesi mantenendo il giorno (limitato alla fine del mese)"""
+    mese = data.month - 1 + mesi
+    anno = data.year + mese // 12
+    mese = mese % 12 + 1
+    giorno = min(data.day, calendar.monthrange(anno, mese)[1])
+    return data.replace(year=anno, month=mese, day=giorno)
+
+
+def avanza(data: datetime, frequenza: FrequenzaSchedule, intervallo_custom: Optional[str]) -> Optional[datetime]:
+    """Data successiva secondo frequenza; None se l'intervallo custom non è valido"""
+    frequenza = FrequenzaSchedule(frequenza)
+    if frequenza in GIORNI_FREQUENZA:
+        return data + timedelta(days=GIORNI_FREQUENZA[frequenza])
+    if frequenza in MESI_FREQUENZA:
+        return aggiungi_mesi(data, MESI_FREQUENZA[frequenza])
+
+    match = INTERVALLO_CUSTOM_RE.search(intervallo_custom or "")
+    if not match or int(match.group(1)) <= 0:
+        return None
+    quantita = int(match.group(1))
+    unita = (match.group(2) or "giorn").lower()
+    if unita == "settiman":
+        return data + timedelta(weeks=quantita)
+    if unita == "mes":
+        return aggiungi_mesi(data, quantita)
+    if unita == "ann":
+        return aggiungi_mesi(data, 12 * quantita)
+    return data + timedelta(days=quantita)
+
+
+def calcola_prossimo_trigger(
+    schedule: Schedule,
+    now: datetime
+) -> Optional[datetime]:
+    """
+    Prossimo trigger dopo `now` partendo da quello corrente, per mantenere
+    la cadenza. Dopo un fermo prolungato le esecuzioni perse non vengono
+    recuperate una per una: si salta direttamente alla prima data futura.
+    """
+    prossimo = schedule.prossimo_trigger or now
+    while prossimo <= now:
+        try:
+            prossimo = avanza(prossimo, schedule.frequenza, schedule.intervallo_custom)
+        except (ValueError, OverflowError) as e:
+            # Frequenza sconosciuta o data fuori intervallo (es. "99999 anni")
+            raise ConfigurazioneNonValida(f"frequenza o intervallo_custom non validi: {e}")
+        if prossimo is None:
+            return None
+    return prossimo
+
+
+def valida_frequenza(frequenza: str, intervallo_custom: Optional[str]) -> None:
+    """Controllo alla creazione/modifica: il motore deve poter calcolare il trigger successivo"""
+    try:
+        successivo = avanza(datetime.utcnow(), frequenza, intervallo_custom)
+    except (ValueError, OverflowError):
+        successivo = None
+    if successivo is None:
+        raise ConfigurazioneNonValida(
+            f"Frequenza non valida: {frequenza}"
+            + (f" (intervallo_custom: {intervallo_custom})" if intervallo_custom else "")
+        )
+
+
+# =============================================
+# AZIONI
+# =============================================
+async def _cliente_da_entita(db: AsyncSession, schedule: Schedule) -> Optional[str]:
+    """Ricava il cliente dall'entità di riferimento (contratto cliente)"""
+    if schedule.tipo_entita == TipoEntitaSchedule.contratto and schedule.id_entita_riferimento:
+        contratto = await db.get(ContrattoCliente, schedule.id_entita_riferimento)
+        if contratto:
+            return contratto.cliente_id
+    return None
+
+
+async def _crea_richiesta(
+    db: AsyncSession,
+    schedule: Schedule,
+    stato: StatoRichiesta,
+    priorita_default: str
+) -> dict:
+    config = schedule.configurazione_azione or {}
+    cliente_id = config.get("cliente_id") or await _cliente_da_entita(db, schedule)
+    if not cliente_id:
+        raise ConfigurazioneNonValida("configurazione_azione.cliente_id mancante")
+
+    richiesta = Richiesta(
+        cliente_id=cliente_id,
+        sede_id=config.get("sede_id"),
+        ambito_id=config.get("ambito_id"),
+        descrizione=config.get("descrizione") or schedule.nome_descrittivo,
+        priorita=config.get("priorita", priorita_default),
+        origine=OrigineRichiesta.schedulatore,
+        stato=stato,
+        scadenza_validazione=datetime.now().date() + timedelta(days=7)
+    )
+    db.add(richiesta)
+    await db.flush()
+    return {"richiesta_id": richiesta.id}
+
+
+async def esegui_azione(db: AsyncSession, schedule: Schedule) -> dict:
+    """Esegue l'azione dello schedule nella transazione corrente"""
+    try:
+        azione = TipoAzioneSchedule(schedule.tipo_azione)
+    except ValueError:
+        raise ConfigurazioneNonValida(f"tipo_azione non valido: {schedule.tipo_azione}")
+    config = schedule.configurazione_azione or {}
+
+    if azione == TipoAzioneSchedule.crea_richiesta:
+        return await _crea_richiesta(db, schedule, StatoRichiesta.da_gestire, "normale")
+
+    if azione == TipoAzioneSchedule.genera_alert:
+        # Gli alert entrano come richieste da verificare (come il monitoraggio)
+        return await _crea_richiesta(db, schedule, StatoRichiesta.da_verificare, "alta")
+
+    if azione == TipoAzioneSchedule.invia_notifica:
+        destinatari = config.get("destinatari") or []
+        if not destinatari:
+            raise ConfigurazioneNonValida("configurazione_azione.destinatari mancante")
+        await send_notification_email(
+            destinatari,
+            config.get("oggetto") or schedule.nome_descrittivo,
+            config.get("messaggio") or f"Promemoria: {schedule.nome_descrittivo}"
+        )
+        return {"destinatari": destinatari}
+
+    # custom: nessuna azione predefinita, resta solo la traccia del trigger
+    return {}
+
+
+async def claim_schedule(
+    db: AsyncSession,
+    schedule_id: str,
+    trigger_atteso: datetime,
+    prossimo_trigger: Optional[datetime],
+    now: datetime
+) -> bool:
+    """
+    Reclama l'esecuzione: aggiorna la riga solo se prossimo_trigger è ancora
+    quello letto. Se un altro worker l'ha già eseguita l'UPDATE non trova righe.
+    """
+    result = await db.execute(
+        update(Schedule)
+        .where(
+            Schedule.id == schedule_id,
+            Schedule.attivo == True,
+            Schedule.prossimo_trigger == trigger_atteso
+        )
+        .values(ultimo_trigger=now, prossimo_trigger=prossimo_trigger)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def esegui_schedule(db: AsyncSession, schedule: Schedule, now: datetime) -> Optional[dict]:
+    """
+    Reclama ed esegue uno schedule scaduto in un'unica transazione.
+    Ritorna None se un altro worker l'ha già eseguito.
+    """
+    trigger_atteso = schedule.prossimo_trigger
+    prossimo = calcola_prossimo_trigger(schedule, now)
+    if not await claim_schedule(db, schedule.id, trigger_atteso, prossimo, now):
+        await db.rollback()
+        return None
+    risultato = await esegui_azione(db, schedule)
+    await db.commit()
+    schedule.ultimo_trigger = now
+    schedule.prossimo_trigger = prossimo
+    return risultato
+
+
+async def rinvia_schedule(
+    db: AsyncSession,
+    schedule_id: str,
+    trigger_atteso: datetime,
+    prossimo_trigger: Optional[datetime]
+) -> None:
+    """Passa alla prossima occorrenza senza eseguire l'azione (configurazione non valida)"""
+    await db.execute(
+        update(Schedule)
+        .where(Schedule.id == schedule_id, Schedule.prossimo_trigger == trigger_atteso)
+        .values(prossimo_trigger=prossimo_trigger)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+# =============================================
+# MOTORE
+# =============================================
+class ScheduleEngine:
+    """Loop di esecuzione basato su min-heap di prossimo_trigger"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self._heap: List[Tuple[datetime, str]] = []
+        # Trigger corrente per id: le voci dell'heap non allineate sono obsolete
+        self._triggers: Dict[str, datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.eseguiti = 0
+
+    @property
+    def in_coda(self) -> int:
+        return len(self._triggers)
+
+    def _push(self, schedule_id: str, trigger: Optional[datetime]) -> None:
+        if trigger is None:
+            self._triggers.pop(schedule_id, None)
+            return
+        self._triggers[schedule_id] = trigger
+        heapq.heappush(self._heap, (trigger, schedule_id))
+
+    async def load(self) -> None:
+        """Ricostruisce l'heap dagli schedule attivi (solo id e trigger)"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Schedule.prossimo_trigger, Schedule.id).where(
+                    Schedule.attivo == True,
+                    Schedule.prossimo_trigger.is_not(None)
+                )
+            )
+            righe = result.all()
+        self._triggers = {schedule_id: trigger for trigger, schedule_id in righe}
+        self._heap = [(trigger, schedule_id) for trigger, schedule_id in righe]
+        heapq.heapify(self._heap)
+
+    def notify(self, schedule_id: str, prossimo_trigger: Optional[datetime], attivo: bool = True) -> None:
+        """Da chiamare dopo create/update/toggle/delete di uno schedule"""
+        self._push(schedule_id, prossimo_trigger if attivo else None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _prossimo(self) -> Optional[datetime]:
+        """Trigger più vicino, scartando le voci obsolete in testa all'heap"""
+        while self._heap:
+            trigger, schedule_id = self._heap[0]
+            if self._triggers.get(schedule_id) == trigger:
+                return trigger
+            heapq.heappop(self._heap)
+        return None
+
+    async def run_due(self, now: Optional[datetime] = None) -> int:
+        """Esegue tutti gli schedule scaduti, ritorna quanti ne ha eseguiti"""
+        now = now or datetime.utcnow()
+        eseguiti = 0
+        while (trigger := self._prossimo()) is not None and trigger <= now:
+            _, schedule_id = heapq.heappop(self._heap)
+            del self._triggers[schedule_id]
+            async with self.session_factory() as db:
+                schedule = await db.get(Schedule, schedule_id)
+                if schedule is None or not schedule.attivo or schedule.prossimo_trigger is None:
+                    continue
+                if schedule.prossimo_trigger > now:
+                    # Modificato altrove: riprogramma con il valore attuale
+                    self._push(schedule_id, schedule.prossimo_trigger)
+                    continue
+                # Letti prima: dopo il rollback l'istanza è scaduta
+                trigger_atteso = schedule.prossimo_trigger
+                # None se la frequenza non permette di calcolarlo: lo schedule si ferma
+                prossimo = None
+                try:
+                    prossimo = calcola_prossimo_trigger(schedule, now)
+                    risultato = await esegui_schedule(db, schedule, now)
+                except ConfigurazioneNonValida as e:
+                    # Errore permanente: niente retry, si riprova alla prossima occorrenza
+                    await db.rollback()
+                    print(f"[ERROR] Schedule {schedule_id} non eseguito, configurazione non valida: {e}")
+                    await rinvia_schedule(db, schedule_id, trigger_atteso, prossimo)
+                    self._push(schedule_id, prossimo)
+                    continue
+                except Exception as e:
+                    await db.rollback()
+                    print(f"[ERROR] Schedule {schedule_id} fallito: {type(e).__name__}: {e}")
+                    self._push(schedule_id, now + timedelta(seconds=settings.SCHEDULER_RETRY_SECONDS))
+                    continue
+                if risultato is None:
+                    # Eseguito da un altro worker: rileggi il nuovo trigger
+                    await db.refresh(schedule)
+                else:
+                    eseguiti += 1
+                if schedule.attivo:
+                    self._push(schedule_id, schedule.prossimo_trigger)
+        self.eseguiti += eseguiti
+        return eseguiti
+
+    async def _run(self) -> None:
+        resync_at = datetime.utcnow() + timedelta(seconds=settings.SCHEDULER_RESYNC_SECONDS)
+        while True:
+            now = datetime.utcnow()
+            if now >= resync_at:
+                # Riallinea con le modifiche fatte da altri worker
+                await self.load()
+                resync_at = now + timedelta(seconds=settings.SCHEDULER_RESYNC_SECONDS)
+            await self.run_due(now)
+
+            prossimo = self._prossimo()
+            risveglio = min(prossimo, resync_at) if prossimo else resync_at
+            attesa = max((risveglio - datetime.utcnow()).total_seconds(), 0)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=attesa)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self._run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Scheduler: {type(e).__name__}: {e}")
+                await asyncio.sleep(settings.SCHEDULER_RETRY_SECONDS)
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        await self.load()
+        self._task = asyncio.create_task(self._run_forever())
+        print(f"[OK] Scheduler avviato ({self.in_coda} schedule attivi)")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+@lru_cache()
+def get_scheduler() -> ScheduleEngine:
+    """Singleton del motore schedule"""
+    return ScheduleEngine()
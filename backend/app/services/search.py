@@ -0,0 +1,138 @@
+"""
+Ricerca full-text su clienti, richieste e utenti
+
+Usa gli indici definiti in models/search_index: tsvector/pg_trgm su
+PostgreSQL, FTS5 su SQLite. Ogni parola cercata vale come prefisso
+("ros" trova "Rossi") e tutte devono essere presenti. Il rank è
+"più alto = migliore" su entrambi i database; nell'endpoint unificato
+viene normalizzato per entità rispetto al primo risultato.
+"""
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import Select, column, false, func, literal_column, or_, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Cliente, SedeCliente, Richiesta, Utente, UserRole
+from ..models.search_index import (
+    TS_ITALIAN, TS_SIMPLE, tabella_chiavi,
+    cliente_tsvector, sede_tsvector, richiesta_tsvector, utente_tsvector,
+)
+
+TIPI = ("cliente", "richiesta", "utente")
+
+# (modello, tabella FTS5, pesi bm25 per colonna, tsvector PostgreSQL)
+ENTITA = {
+    "cliente": (Cliente, "clienti_fts", (10.0, 8.0, 8.0, 3.0, 1.0), cliente_tsvector),
+    "richiesta": (Richiesta, "richieste_fts", (1.0,), richiesta_tsvector),
+    "utente": (Utente, "utenti_fts", (5.0, 5.0, 2.0), utente_tsvector),
+}
+
+
+def termini_ricerca(testo: str) -> List[str]:
+    """Parole del testo (lettere/cifre), minuscole: sicure per MATCH e to_tsquery"""
+    return re.findall(r"\w+", (testo or "").lower())
+
+
+def query_ricerca(dialect: str, tipo: str, testo: str, *colonne, con_rank: bool = False) -> Select:
+    """
+    SELECT di `colonne` dell'entità `tipo` che corrispondono al testo.
+    Con con_rank aggiunge la colonna "rank" (più alto = più rilevante).
+    """
+    model, fts, pesi, tsvector = ENTITA[tipo]
+    termini = termini_ricerca(testo)
+    if not termini:
+        return select(*colonne, *([literal_column("0").label("rank")] if con_rank else [])).where(false())
+
+    if dialect == "postgresql":
+        config = TS_ITALIAN if tipo == "richiesta" else TS_SIMPLE
+        tsquery = func.to_tsquery(config, " & ".join(f"{t}:*" for t in termini))
+        condizione = tsvector().op("@@")(tsquery)
+        rank = func.ts_rank(tsvector(), tsquery)
+        if tipo == "cliente":
+            # Sottostringa sulla ragione sociale (indice trigram) e città delle sedi
+            condizione = or_(
+                condizione,
+                Cliente.ragione_sociale.ilike(f"%{testo.strip()}%"),
+                Cliente.id.in_(select(SedeCliente.cliente_id).where(sede_tsvector().op("@@")(tsquery))),
+            )
+            rank = rank + func.similarity(Cliente.ragione_sociale, testo)
+        query = select(*colonne).select_from(model).where(condizione)
+    else:
+        tabella_fts = table(fts, column("rowid"))
+        chiavi = table(tabella_chiavi(fts), column("rowid"), column("id"))
+        match = " ".join(f'"{t}"*' for t in termini)
+        query = (
+            select(*colonne)
+            .select_from(model)
+            .join(chiavi, chiavi.c.id == model.id)
+            .join(tabella_fts, tabella_fts.c.rowid == chiavi.c.rowid)
+            .where(literal_column(fts).op("MATCH")(match))
+        )
+        # bm25 è negativo (più basso = migliore)
+        rank = -func.bm25(literal_column(fts), *pesi)
+
+    if con_rank:
+        query = query.add_columns(rank.label("rank"))
+    return query
+
+
+def _risultato(tipo: str, row) -> Dict[str, Any]:
+    if tipo == "cliente":
+        titolo, sottotitolo = row.ragione_sociale, row.partita_iva or row.email_principale
+    elif tipo == "richiesta":
+        numero = f"#{row.numero_richiesta} " if row.numero_richiesta else ""
+        titolo, sottotitolo = f"{numero}{row.descrizione[:120]}", row.stato.value if row.stato else None
+    else:
+        titolo, sottotitolo = f"{row.nome} {row.cognome}", row.email
+    return {"tipo": tipo, "id": row.id, "titolo": titolo, "sottotitolo": sottotitolo, "rank": float(row.rank)}
+
+
+COLONNE = {
+    "cliente": (Cliente.id, Cliente.ragione_sociale, Cliente.partita_iva, Cliente.email_principale),
+    "richiesta": (Richiesta.id, Richiesta.numero_richiesta, Richiesta.descrizione, Richiesta.stato),
+    "utente": (Utente.id, Utente.nome, Utente.cognome, Utente.email),
+}
+
+
+def tipi_visibili(user: Utente) -> Sequence[str]:
+    """Il cliente cerca solo nelle sue richieste, gli utenti solo admin/supervisore"""
+    if user.ruolo == UserRole.cliente:
+        return ("richiesta",)
+    if user.ruolo == UserRole.tecnico:
+        return ("cliente", "richiesta")
+    return TIPI
+
+
+async def cerca(
+    db: AsyncSession,
+    testo: str,
+    user: Utente,
+    tipi: Optional[Sequence[str]] = None,
+    skip: int = 0,
+    limit: int = 20
+) -> List[Dict[str, Any]]:
+    """
+    Risultati di tutte le entità ordinati per rank, paginati con skip/limit.
+    A parità di rank l'ordine è quello di TIPI (clienti, richieste, utenti).
+    """
+    dialect = db.bind.dialect.name
+    consentiti = tipi_visibili(user)
+    tipi = [t for t in (tipi or TIPI) if t in consentiti]
+
+    risultati: List[Dict[str, Any]] = []
+    for tipo in tipi:
+        query = query_ricerca(dialect, tipo, testo, *COLONNE[tipo], con_rank=True)
+        if tipo == "richiesta" and user.ruolo == UserRole.cliente:
+            query = query.where(Richiesta.creato_da_id == user.id)
+        # Servono le prime skip+limit di ogni entità per ordinare l'unione
+        result = await db.execute(query.order_by(literal_column("rank").desc()).limit(skip + limit))
+        righe = [_risultato(tipo, row) for row in result.all()]
+        # I punteggi di entità diverse non sono confrontabili: normalizza sul migliore (0..1]
+        massimo = max((r["rank"] for r in righe), default=0)
+        for r in righe:
+            r["rank"] = r["rank"] / massimo if massimo > 0 else 1.0
+        risultati.extend(righe)
+
+    risultati.sort(key=lambda r: r["rank"], reverse=True)
+    return risultati[skip:skip + limit]
@@ -0,0 +1,56 @@
+"""
+Totali del tempo lavorato (colonne minuti_totali di attivita e richieste)
+
+Il checkout incrementa con UPDATE atomici (minuti_totali = minuti_totali + n)
+i totali dell'attività e della sua richiesta, nella stessa transazione che
+chiude il time entry: report e fatturazione leggono le colonne invece di
+sommare time_entries. ricalcolo_minuti_totali riallinea i totali ai time
+entry (migrazione o correzione di dati modificati a mano).
+"""
+from typing import List
+
+from sqlalchemy import Update, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Attivita, Richiesta, TimeEntry
+
+
+async def aggiungi_minuti(db: AsyncSession, attivita_id: str, minuti: int) -> None:
+    """Somma i minuti all'attività e alla sua richiesta, nella transazione corrente"""
+    if not minuti:
+        return
+    await db.execute(
+        update(Attivita)
+        .where(Attivita.id == attivita_id)
+        .values(minuti_totali=Attivita.minuti_totali + minuti)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(Richiesta)
+        .where(Richiesta.id == select(Attivita.richiesta_id).where(Attivita.id == attivita_id).scalar_subquery())
+        .values(minuti_totali=Richiesta.minuti_totali + minuti)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def ricalcolo_minuti_totali() -> List[Update]:
+    """UPDATE che ricalcolano i totali dai time entry (prima attività, poi richieste)"""
+    minuti_attivita = (
+        select(func.coalesce(func.sum(TimeEntry.durata_minuti), 0))
+        .where(TimeEntry.attivita_id == Attivita.id)
+        .scalar_subquery()
+    )
+    minuti_richiesta = (
+        select(func.coalesce(func.sum(Attivita.minuti_totali), 0))
+        .where(Attivita.richiesta_id == Richiesta.id)
+        .scalar_subquery()
+    )
+    # updated_at invariato: il ricalcolo non è una modifica dell'utente
+    return [
+        update(Attivita)
+        .values(minuti_totali=minuti_attivita, updated_at=Attivita.updated_at)
+        .execution_options(synchronize_session=False),
+        update(Richiesta)
+        .values(minuti_totali=minuti_richiesta, updated_at=Richiesta.updated_at)
+        .execution_options(synchronize_session=False),
+    ]
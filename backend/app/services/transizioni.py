@@ -0,0 +1,63 @@
+"""
+Transizioni di stato in blocco (richieste e attività)
+
+Una SELECT carica lo stato corrente di tutti gli id, le transizioni sono
+validate in memoria contro la tabella del router e applicate con un UPDATE
+per stato di origine (WHERE stato = origine ... RETURNING id): una riga
+cambiata nel frattempo da un'altra richiesta non viene toccata e risulta
+come errore nell'esito.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def applica_transizioni(
+    db: AsyncSession,
+    model,
+    ids: Sequence[str],
+    nuovo_stato,
+    transizioni: Mapping,
+    valori: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Porta `ids` a `nuovo_stato` nella transazione corrente (commit al chiamante).
+    Ritorna un esito per id, nell'ordine ricevuto:
+    {"id", "ok", "stato_precedente", "errore"}.
+    """
+    ids = list(dict.fromkeys(ids))
+    result = await db.execute(select(model.id, model.stato).where(model.id.in_(ids)))
+    stati = dict(result.all())
+
+    esiti: Dict[str, Dict[str, Any]] = {}
+    per_origine = defaultdict(list)
+    for id_ in ids:
+        stato = stati.get(id_)
+        if stato is None:
+            esiti[id_] = {"id": id_, "ok": False, "stato_precedente": None, "errore": "Non trovato"}
+        elif nuovo_stato not in transizioni.get(stato, []):
+            esiti[id_] = {
+                "id": id_, "ok": False, "stato_precedente": stato,
+                "errore": f"Transizione non valida da {stato.value} a {nuovo_stato.value}"
+            }
+        else:
+            per_origine[stato].append(id_)
+
+    for origine, gruppo in per_origine.items():
+        result = await db.execute(
+            update(model)
+            .where(model.id.in_(gruppo), model.stato == origine)
+            .values(stato=nuovo_stato, **(valori or {}))
+            .returning(model.id)
+            .execution_options(synchronize_session=False)
+        )
+        aggiornati = set(result.scalars().all())
+        for id_ in gruppo:
+            esiti[id_] = {
+                "id": id_, "ok": id_ in aggiornati, "stato_precedente": origine,
+                "errore": None if id_ in aggiornati else "Stato modificato nel frattempo"
+            }
+
+    return [esiti[id_] for id_ in ids]
@@ -0,0 +1,180 @@
+"""
+Indice in memoria per il completamento dei clienti (typeahead)
+
+Array ordinato di chiavi normalizzate (minuscole, senza accenti né
+punteggiatura) con ricerca per prefisso via bisect: ragione sociale e alias
+sono indicizzati da ogni parola ("rossi" trova "Mario Rossi Srl"), codice
+gestionale, partita IVA e codice fiscale come codice compatto. Costruito alla
+prima richiesta, aggiornato dagli endpoint clienti e riallineato ogni
+TYPEAHEAD_SYNC_SECONDS con i clienti modificati (updated_at) da altri worker.
+"""
+import asyncio
+import re
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import Cliente
+
+settings = get_settings()
+
+# Campi indicizzati: (colonna, per parola, priorità nel ranking)
+CAMPI = (
+    ("ragione_sociale", True, 0),
+    ("nome_alternativo", True, 1),
+    ("codice_gestionale_esterno", False, 2),
+    ("partita_iva", False, 2),
+    ("codice_fiscale", False, 3),
+)
+COLONNE = ("id", "ragione_sociale", "nome_alternativo", "codice_gestionale_esterno", "partita_iva", "codice_fiscale", "attivo")
+# Corrispondenze esaminate per richiesta (ranking sui primi candidati)
+SCANSIONE_MAX = 200
+
+
+def normalizza(testo: Optional[str]) -> str:
+    """Minuscolo, senza accenti, solo lettere/cifre separate da uno spazio"""
+    testo = unicodedata.normalize("NFKD", testo or "")
+    testo = "".join(c for c in testo if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", testo))
+
+
+def _chiavi(valori: Dict[str, Any]) -> List[Tuple[str, int, int]]:
+    """(chiave, priorità campo, posizione parola) per un cliente"""
+    chiavi = []
+    for campo, per_parola, priorita in CAMPI:
+        testo = normalizza(valori.get(campo))
+        if not testo:
+            continue
+        if per_parola:
+            parole = testo.split(" ")
+            chiavi.extend((" ".join(parole[i:]), priorita, i) for i in range(len(parole)))
+        else:
+            compatto = testo.replace(" ", "")
+            chiavi.append((compatto, priorita, 0))
+            if campo == "partita_iva" and compatto.startswith("it") and len(compatto) > 2:
+                chiavi.append((compatto[2:], priorita, 0))
+    return chiavi
+
+
+class ClientiTypeahead:
+    """Indice per prefisso dei clienti"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self._voci: List[Tuple[str, str, int, int]] = []  # (chiave, cliente_id, priorità, posizione)
+        self._chiavi: Dict[str, List[Tuple[str, str, int, int]]] = {}
+        self._clienti: Dict[str, Dict[str, Any]] = {}
+        self._nomi: Dict[str, str] = {}  # ragione sociale normalizzata (spareggio nel ranking)
+        self._lock = asyncio.Lock()
+        self._pronto = False
+        self._sincronizzato_al: Optional[datetime] = None
+        self._ultimo_sync = 0.0
+
+    def __len__(self) -> int:
+        return len(self._clienti)
+
+    def _registra(self, cliente) -> List[Tuple[str, str, int, int]]:
+        valori = {col: (cliente.get(col) if isinstance(cliente, dict) else getattr(cliente, col)) for col in COLONNE}
+        voci = [(chiave, valori["id"], priorita, posizione) for chiave, priorita, posizione in _chiavi(valori)]
+        self._chiavi[valori["id"]] = voci
+        self._clienti[valori["id"]] = valori
+        self._nomi[valori["id"]] = normalizza(valori["ragione_sociale"])
+        return voci
+
+    def ricostruisci(self, clienti) -> None:
+        """Ricostruisce l'indice da zero (un solo ordinamento)"""
+        self._chiavi, self._clienti, self._nomi = {}, {}, {}
+        voci = []
+        for cliente in clienti:
+            voci.extend(self._registra(cliente))
+        voci.sort()
+        self._voci = voci
+
+    def aggiorna(self, cliente) -> None:
+        """Inserisce o aggiorna un cliente (istanza ORM o dict con COLONNE)"""
+        self.rimuovi(cliente["id"] if isinstance(cliente, dict) else cliente.id)
+        for voce in self._registra(cliente):
+            insort(self._voci, voce)
+
+    def rimuovi(self, cliente_id: str) -> None:
+        for voce in self._chiavi.pop(cliente_id, []):
+            i = bisect_left(self._voci, voce)
+            if i < len(self._voci) and self._voci[i] == voce:
+                del self._voci[i]
+        self._clienti.pop(cliente_id, None)
+        self._nomi.pop(cliente_id, None)
+
+    def cerca(self, testo: str, limit: int = 5, attivo: Optional[bool] = True) -> List[Dict[str, Any]]:
+        """Primi `limit` clienti con una chiave che inizia per il testo normalizzato"""
+        prefisso = normalizza(testo)
+        if not prefisso:
+            return []
+        prefisso_compatto = prefisso.replace(" ", "")
+
+        migliori: Dict[str, tuple] = {}
+        for p in {prefisso, prefisso_compatto}:
+            i = bisect_left(self._voci, (p,))
+            esaminate = 0
+            while i < len(self._voci) and esaminate < SCANSIONE_MAX:
+                chiave, cliente_id, priorita, posizione = self._voci[i]
+                if not chiave.startswith(p):
+                    break
+                i += 1
+                cliente = self._clienti[cliente_id]
+                if attivo is not None and bool(cliente["attivo"]) != attivo:
+                    continue
+                esaminate += 1
+                rank = (chiave != p, priorita, posizione, len(chiave), self._nomi[cliente_id])
+                if cliente_id not in migliori or rank < migliori[cliente_id]:
+                    migliori[cliente_id] = rank
+
+        ordinati = sorted(migliori, key=migliori.get)[:limit]
+        return [self._clienti[cliente_id] for cliente_id in ordinati]
+
+    async def _carica(self, da: Optional[datetime] = None) -> None:
+        query = select(*(getattr(Cliente, col) for col in COLONNE))
+        if da is not None:
+            query = query.where(Cliente.updated_at >= da)
+        # Letto prima della query: le modifiche concorrenti arrivano al giro successivo
+        inizio = datetime.utcnow()
+        async with self.session_factory() as db:
+            righe = (await db.execute(query)).all()
+        if da is None:
+            self.ricostruisci(dict(zip(COLONNE, riga)) for riga in righe)
+        else:
+            for riga in righe:
+                self.aggiorna(dict(zip(COLONNE, riga)))
+        self._sincronizzato_al = inizio
+        self._ultimo_sync = time.monotonic()
+
+    def invalida(self) -> None:
+        """Ricostruzione completa alla prossima richiesta (dopo import massivi)"""
+        self._pronto = False
+
+    async def pronto(self) -> "ClientiTypeahead":
+        """Costruisce l'indice se serve e lo riallinea con i clienti modificati altrove"""
+        scaduto = time.monotonic() - self._ultimo_sync > settings.TYPEAHEAD_SYNC_SECONDS
+        if self._pronto and not scaduto:
+            return self
+        async with self._lock:
+            if not self._pronto:
+                inizio = time.perf_counter()
+                await self._carica()
+                self._pronto = True
+                print(f"[OK] Indice typeahead clienti: {len(self)} clienti in {(time.perf_counter() - inizio) * 1000:.0f} ms")
+            elif time.monotonic() - self._ultimo_sync > settings.TYPEAHEAD_SYNC_SECONDS:
+                await self._carica(self._sincronizzato_al)
+        return self
+
+
+@lru_cache()
+def get_clienti_typeahead() -> ClientiTypeahead:
+    """Singleton dell'indice typeahead clienti"""
+    return ClientiTypeahead()
@@ -0,0 +1,136 @@
+"""
+Cache degli utenti autenticati usata da get_current_user.
+Memorizza uno snapshot (senza password) per id utente con TTL:
+backend in-process di default, Redis opzionale per condividerlo tra worker.
+"""
+import enum
+import json
+import time
+from datetime import datetime, date
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Date, DateTime, Enum as SQLEnum
+
+from ..config import get_settings
+from ..models import Utente
+
+settings = get_settings()
+
+# Colonne mai salvate in cache
+CAMPI_ESCLUSI = {"password_hash"}
+
+
+def snapshot_from_user(user: Utente) -> Dict[str, Any]:
+    """Converte un Utente in un dizionario serializzabile JSON"""
+    snapshot = {}
+    for column in Utente.__table__.columns:
+        if column.key in CAMPI_ESCLUSI or "token" in column.key:
+            continue
+        value = getattr(user, column.key)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif isinstance(value, enum.Enum):
+            value = value.value
+        snapshot[column.key] = value
+    return snapshot
+
+
+def user_from_snapshot(snapshot: Dict[str, Any]) -> Utente:
+    """Ricostruisce un Utente (non legato a sessioni) dallo snapshot"""
+    values = {}
+    for column in Utente.__table__.columns:
+        if column.key not in snapshot:
+            continue
+        value = snapshot[column.key]
+        if value is not None:
+            if isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif isinstance(column.type, Date):
+                value = date.fromisoformat(value)
+            elif isinstance(column.type, SQLEnum) and column.type.enum_class:
+                value = column.type.enum_class(value)
+        values[column.key] = value
+    return Utente(**values)
+
+
+class MemoryUserCache:
+    """Cache in-process con scadenza per chiave"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._data: Dict[str, tuple] = {}
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        item = self._data.get(user_id)
+        if item is None:
+            return None
+        expires_at, snapshot = item
+        if expires_at < time.monotonic():
+            self._data.pop(user_id, None)
+            return None
+        return snapshot
+
+    async def set(self, user_id: str, snapshot: Dict[str, Any]) -> None:
+        self._data[user_id] = (time.monotonic() + self.ttl, snapshot)
+
+    async def invalidate(self, user_id: str) -> None:
+        self._data.pop(user_id, None)
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+
+class RedisUserCache:
+    """Cache condivisa su Redis (chiavi con SETEX)"""
+
+    prefix = "user_cache:"
+
+    def __init__(self, url: str, ttl: int):
+        import redis.asyncio as redis
+
+        self.ttl = ttl
+        self._errors = redis.RedisError
+        self._client = redis.from_url(url)
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self._client.get(self.prefix + user_id)
+        except self._errors as e:
+            print(f"[WARN] user cache Redis non disponibile: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    async def set(self, user_id: str, snapshot: Dict[str, Any]) -> None:
+        try:
+            await self._client.setex(self.prefix + user_id, self.ttl, json.dumps(snapshot))
+        except self._errors as e:
+            print(f"[WARN] user cache Redis non disponibile: {e}")
+
+    async def invalidate(self, user_id: str) -> None:
+        try:
+            await self._client.delete(self.prefix + user_id)
+        except self._errors as e:
+            print(f"[WARN] user cache Redis non disponibile: {e}")
+
+    async def clear(self) -> None:
+        try:
+            async for key in self._client.scan_iter(match=self.prefix + "*"):
+                await self._client.delete(key)
+        except self._errors as e:
+            print(f"[WARN] user cache Redis non disponibile: {e}")
+
+
+@lru_cache()
+def get_user_cache():
+    """Singleton della cache utenti (backend da USER_CACHE_BACKEND)"""
+    if settings.USER_CACHE_BACKEND == "redis":
+        return RedisUserCache(settings.REDIS_URL, settings.USER_CACHE_TTL_SECONDS)
+    return MemoryUserCache(settings.USER_CACHE_TTL_SECONDS)
+
+
+async def invalidate_user(*user_ids: str) -> None:
+    """Rimuove gli utenti dalla cache (da chiamare dopo modifiche a ruolo/stato)"""
+    cache = get_user_cache()
+    for user_id in user_ids:
+        await cache.invalidate(user_id)
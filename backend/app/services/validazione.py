@@ -0,0 +1,155 @@
+"""
+Validazione automatica delle richieste risolte oltre scadenza_validazione
+
+Job periodico nel processo API: a lotti di VALIDAZIONE_AUTOMATICA_BATCH_SIZE
+porta a validata le richieste risolte con scadenza passata, con un UPDATE
+per lotto (WHERE id IN (SELECT ... LIMIT n), indice su stato e
+scadenza_validazione) e un commit per lotto, così le transazioni restano
+brevi. Con più worker gli UPDATE ricontrollano lo stato: ogni richiesta
+viene validata una volta sola.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Deque, Optional
+
+from sqlalchemy import select, update
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import Richiesta, StatoRichiesta
+
+settings = get_settings()
+
+
+def scadenza_validazione(oggi: Optional[date] = None) -> date:
+    """Scadenza per la validazione di una richiesta appena risolta"""
+    return (oggi or date.today()) + timedelta(days=settings.VALIDAZIONE_AUTOMATICA_GIORNI)
+
+
+@dataclass
+class MetricheValidazione:
+    esecuzioni: int = 0
+    validate_totali: int = 0
+    lotti_totali: int = 0
+    errori: int = 0
+    ultima_esecuzione: Optional[datetime] = None
+    ultima_validate: int = 0
+    ultima_durata_ms: float = 0.0
+    # Durata degli ultimi lotti (ms), per individuare lotti lenti
+    durate_lotti_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=100))
+
+    def as_dict(self) -> dict:
+        durate = list(self.durate_lotti_ms)
+        return {
+            "esecuzioni": self.esecuzioni,
+            "validate_totali": self.validate_totali,
+            "lotti_totali": self.lotti_totali,
+            "errori": self.errori,
+            "ultima_esecuzione": self.ultima_esecuzione,
+            "ultima_validate": self.ultima_validate,
+            "ultima_durata_ms": round(self.ultima_durata_ms, 2),
+            "lotto_medio_ms": round(sum(durate) / len(durate), 2) if durate else None,
+            "lotto_max_ms": round(max(durate), 2) if durate else None,
+        }
+
+
+class ValidazioneAutomatica:
+    """Sweeper delle richieste risolte scadute"""
+
+    def __init__(self, session_factory=AsyncSessionLocal, batch_size: Optional[int] = None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.VALIDAZIONE_AUTOMATICA_BATCH_SIZE
+        self.metriche = MetricheValidazione()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _valida_lotto(self, oggi: date, now: datetime) -> int:
+        scadute = (
+            select(Richiesta.id)
+            .where(
+                Richiesta.stato == StatoRichiesta.risolta,
+                Richiesta.scadenza_validazione < oggi
+            )
+            .order_by(Richiesta.scadenza_validazione)
+            .limit(self.batch_size)
+        )
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(Richiesta)
+                .where(Richiesta.id.in_(scadute), Richiesta.stato == StatoRichiesta.risolta)
+                .values(
+                    stato=StatoRichiesta.validata,
+                    validata_automaticamente=True,
+                    validata_il=now,
+                    validata_da_id=None
+                )
+                .returning(Richiesta.id)
+                .execution_options(synchronize_session=False)
+            )
+            validate = len(result.scalars().all())
+            await db.commit()
+        return validate
+
+    async def esegui(self, oggi: Optional[date] = None) -> int:
+        """Valida tutte le richieste scadute, un lotto alla volta. Ritorna quante"""
+        async with self._lock:
+            oggi = oggi or date.today()
+            inizio = time.perf_counter()
+            totale = 0
+            try:
+                while True:
+                    inizio_lotto = time.perf_counter()
+                    validate = await self._valida_lotto(oggi, datetime.utcnow())
+                    if validate == 0:
+                        break
+                    self.metriche.durate_lotti_ms.append((time.perf_counter() - inizio_lotto) * 1000)
+                    self.metriche.lotti_totali += 1
+                    totale += validate
+                    if validate < self.batch_size:
+                        break
+            finally:
+                self.metriche.esecuzioni += 1
+                self.metriche.validate_totali += totale
+                self.metriche.ultima_esecuzione = datetime.utcnow()
+                self.metriche.ultima_validate = totale
+                self.metriche.ultima_durata_ms = (time.perf_counter() - inizio) * 1000
+            if totale:
+                print(
+                    f"[OK] Validazione automatica: {totale} richieste "
+                    f"in {self.metriche.ultima_durata_ms:.0f} ms"
+                )
+            return totale
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.esegui()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metriche.errori += 1
+                print(f"[ERROR] Validazione automatica: {type(e).__name__}: {e}")
+            await asyncio.sleep(settings.VALIDAZIONE_AUTOMATICA_INTERVAL_SECONDS)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run_forever())
+        print(f"[OK] Validazione automatica avviata (ogni {settings.VALIDAZIONE_AUTOMATICA_INTERVAL_SECONDS}s)")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+@lru_cache()
+def get_validazione_automatica() -> ValidazioneAutomatica:
+    """Singleton dello sweeper di validazione"""
+    return ValidazioneAutomatica()
@@ -3,6 +3,7 @@ from .auth import (
     get_password_hash,
     create_access_token,
     decode_token,
+    get_user_from_token,
     get_current_user,
     get_current_active_user,
     require_roles,
@@ -10,3 +11,23 @@ from .auth import (
     require_supervisore,
     require_tecnico,
 )
+from .pagination import (
+    NEXT_CURSOR_HEADER,
+    encode_cursor,
+    decode_cursor,
+    keyset_order,
+    keyset_filter,
+    set_next_cursor,
+)
+from .etag import (
+    make_etag,
+    rows_etag,
+    etag_matches,
+    not_modified,
+)
+from .compression import CompressionMiddleware
+from .serialization import (
+    colonne_risposta,
+    righe_dict,
+    json_response,
+)
@@ -8,12 +8,13 @@ from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import get_settings
-from ..database import get_db
+from ..database import get_async_db
 from ..models import Utente, UserRole
 from ..schemas import TokenData
+from ..services.user_cache import get_user_cache, snapshot_from_user, user_from_snapshot
 
 settings = get_settings()
 
@@ -62,22 +63,45 @@ def decode_token(token: str) -> Optional[TokenData]:
         return None
 
 
+async def get_user_from_token(token: str, db: AsyncSession) -> Optional[Utente]:
+    """
+    Utente del token (cache snapshot, poi database), None se token non valido
+    o utente inesistente. Usata anche dove non c'è l'header Authorization
+    (es. WebSocket con token in query string).
+    """
+    token_data = decode_token(token)
+    if token_data is None:
+        return None
+    
+    cache = get_user_cache()
+    snapshot = await cache.get(token_data.user_id)
+    if snapshot is None:
+        db_user = await db.get(Utente, token_data.user_id)
+        if db_user is None:
+            return None
+        snapshot = snapshot_from_user(db_user)
+        await cache.set(db_user.id, snapshot)
+    
+    return user_from_snapshot(snapshot)
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Utente:
-    """Dependency per ottenere l'utente corrente dal token"""
+    """
+    Dependency per ottenere l'utente corrente dal token.
+    L'utente viene letto dalla cache (snapshot per id) e solo in caso di miss
+    dal database: l'oggetto restituito non è legato alla sessione, per
+    modificarlo ricaricarlo con la sessione dell'endpoint.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenziali non valide",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token_data = decode_token(token)
-    if token_data is None:
-        raise credentials_exception
-    
-    user = db.query(Utente).filter(Utente.id == token_data.user_id).first()
+    user = await get_user_from_token(token, db)
     if user is None:
         raise credentials_exception
     if not user.attivo:
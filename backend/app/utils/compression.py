@@ -0,0 +1,165 @@
+"""
+Middleware ASGI di compressione delle risposte (brotli o gzip)
+
+Sceglie la codifica da Accept-Encoding (brotli solo se il modulo `brotli` è
+installato), comprime solo sopra COMPRESSION_MINIMUM_SIZE e supporta le
+risposte in streaming (export) comprimendo chunk per chunk. Le risposte già
+codificate o con contenuto già compresso passano invariate.
+"""
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # dipendenza opzionale
+    brotli = None
+
+# Content-Type da non comprimere
+TIPI_COMPRESSI = (
+    "image/", "video/", "audio/",
+    "application/zip", "application/gzip", "application/x-7z-compressed",
+    "application/vnd.openxmlformats-officedocument.",
+)
+
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Sync flush: ogni chunk dello streaming arriva subito al client
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.compress(data) + self._obj.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.process(data) + self._obj.finish()
+
+
+def _codifiche_accettate(header: str) -> set:
+    """Codifiche di Accept-Encoding con q > 0"""
+    codifiche = set()
+    for parte in header.split(","):
+        nome, _, parametri = parte.strip().partition(";")
+        parametri = parametri.replace(" ", "")
+        if parametri.startswith("q=") and parametri[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if nome:
+            codifiche.add(nome.lower())
+    return codifiche
+
+
+class CompressionMiddleware:
+    """Comprime le risposte HTTP sopra la soglia (brotli se disponibile, altrimenti gzip)"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        brotli_enabled: bool = True
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.brotli_enabled = brotli_enabled and brotli is not None
+
+    def _codifica(self, scope: Scope) -> Optional[str]:
+        accettate = _codifiche_accettate(Headers(scope=scope).get("accept-encoding", ""))
+        if self.brotli_enabled and "br" in accettate:
+            return "br"
+        if "gzip" in accettate:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        codifica = self._codifica(scope) if scope["type"] == "http" else None
+        if codifica is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, codifica, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, codifica: str, send: Send):
+        self.middleware = middleware
+        self.codifica = codifica
+        self._send = send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor = None
+
+    def _nuovo_compressore(self):
+        if self.codifica == "br":
+            return _BrotliCompressor(self.middleware.brotli_quality)
+        return _GzipCompressor(self.middleware.gzip_level)
+
+    def _headers_compressi(self) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.codifica
+        headers.add_vary_header("Accept-Encoding")
+        return headers
+
+    async def send(self, message: Message) -> None:
+        tipo = message["type"]
+        if tipo == "http.response.start":
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 304)
+                or content_type.startswith(TIPI_COMPRESSI)
+            )
+            return
+        if tipo != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self._send(self.initial_message)
+            await self._send(message)
+            return
+
+        if not self.started:
+            self.started = True
+            if len(body) < self.middleware.minimum_size and not more_body:
+                await self._send(self.initial_message)
+                await self._send(message)
+                return
+
+            self.compressor = self._nuovo_compressore()
+            headers = self._headers_compressi()
+            if more_body:
+                del headers["Content-Length"]
+                body = self.compressor.chunk(body)
+            else:
+                body = self.compressor.finish(body)
+                headers["Content-Length"] = str(len(body))
+            await self._send(self.initial_message)
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        body = self.compressor.chunk(body) if more_body else self.compressor.finish(body)
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
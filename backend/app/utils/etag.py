@@ -0,0 +1,36 @@
+"""
+Utilities per ETag e richieste condizionali (If-None-Match -> 304)
+"""
+import hashlib
+from typing import Any, Iterable
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag debole calcolato dalle parti (id, versioni, date di modifica...)"""
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def rows_etag(rows: Iterable[Any], *parts: Any) -> str:
+    """ETag debole di una lista di righe da id e updated_at (più parti extra, es. cursore)"""
+    return make_etag(*parts, [(row.id, row.updated_at) for row in rows])
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True se If-None-Match contiene l'ETag (confronto debole) o '*'"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    valore = etag.removeprefix("W/")
+    for candidato in header.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == valore:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    """Risposta 304 con l'ETag corrente"""
+    return Response(status_code=304, headers={"ETag": etag})
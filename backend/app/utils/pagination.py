@@ -0,0 +1,54 @@
+"""
+Utilities per paginazione keyset (cursor) sulle liste ordinate per data
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+
+# Header con il cursore della pagina successiva
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: str) -> str:
+    """Codifica (valore ordinamento, id) in un cursore opaco"""
+    payload = [sort_value.isoformat() if sort_value else None, row_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    """Decodifica il cursore, 400 se non valido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(sort_value) if sort_value else None), str(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+
+def keyset_order(sort_column, id_column) -> List[Any]:
+    """Ordinamento stabile (data DESC, NULL in fondo, id DESC) usato dal cursore"""
+    return [sort_column.desc().nulls_last(), id_column.desc()]
+
+
+def keyset_filter(sort_column, id_column, cursor: str):
+    """Condizione WHERE per le righe successive al cursore nell'ordine keyset_order"""
+    sort_value, row_id = decode_cursor(cursor)
+    if sort_value is None:
+        # Siamo già nella coda dei NULL: proseguiamo solo per id
+        return and_(sort_column.is_(None), id_column < row_id)
+    return or_(
+        sort_column < sort_value,
+        and_(sort_column == sort_value, id_column < row_id),
+        sort_column.is_(None),
+    )
+
+
+def set_next_cursor(response: Response, rows: List[Any], limit: int, sort_attr: str) -> None:
+    """Imposta l'header X-Next-Cursor se la pagina è piena"""
+    if len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, sort_attr), last.id)
@@ -0,0 +1,48 @@
+"""
+Conteggio delle query SQL eseguite, per verificare il budget degli endpoint
+"""
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import event
+
+from ..database import engine, async_engine
+
+
+class QueryCounter:
+    """
+    Conta le query eseguite su engine sync e async mentre è attivo.
+    Usare con: with QueryCounter() as counter: ...; counter.count
+    """
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self._engines = (engine, async_engine.sync_engine)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self) -> "QueryCounter":
+        for target in self._engines:
+            event.listen(target, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for target in self._engines:
+            event.remove(target, "before_cursor_execute", self._on_execute)
+
+
+@contextmanager
+def assert_max_queries(budget: int, label: str = ""):
+    """Solleva AssertionError se il blocco esegue più di `budget` query"""
+    with QueryCounter() as counter:
+        yield counter
+    if counter.count > budget:
+        dettaglio = "\n".join(f"  {i + 1}. {s.splitlines()[0]}" for i, s in enumerate(counter.statements))
+        raise AssertionError(
+            f"{label or 'Blocco'}: {counter.count} query eseguite, budget {budget}\n{dettaglio}"
+        )
@@ -0,0 +1,40 @@
+"""
+Percorso veloce per le liste: colonne -> dict -> orjson
+
+Gli endpoint di lista selezionano solo le colonne dello schema di risposta
+(nessuna istanza ORM, nessun identity map) e restituiscono direttamente una
+ORJSONResponse, saltando la validazione Pydantic della risposta. Lo schema
+resta come response_model per la documentazione OpenAPI: tutti i suoi campi
+devono essere colonne del modello (verificato all'import).
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Column, Numeric
+
+
+def colonne_risposta(model, schema) -> Tuple[Column, ...]:
+    """Colonne del modello nell'ordine dei campi dello schema"""
+    colonne = model.__table__.c
+    mancanti = [campo for campo in schema.model_fields if campo not in colonne]
+    if mancanti:
+        raise ValueError(f"{schema.__name__}: campi non presenti in {model.__name__}: {mancanti}")
+    return tuple(colonne[campo] for campo in schema.model_fields)
+
+
+def righe_dict(rows: Sequence[Any], colonne: Tuple[Column, ...]) -> List[Dict[str, Any]]:
+    """Righe (tuple di colonne) come dict serializzabili da orjson (Decimal -> float)"""
+    chiavi = [colonna.key for colonna in colonne]
+    decimali = [colonna.key for colonna in colonne if isinstance(colonna.type, Numeric) and colonna.type.asdecimal]
+    items = [dict(zip(chiavi, row)) for row in rows]
+    for item in items:
+        for chiave in decimali:
+            if item[chiave] is not None:
+                item[chiave] = float(item[chiave])
+    return items
+
+
+def json_response(content: Any, response: Response) -> ORJSONResponse:
+    """ORJSONResponse con gli header già impostati sulla Response dell'endpoint (cursore, ETag)"""
+    return ORJSONResponse(content, headers=dict(response.headers))
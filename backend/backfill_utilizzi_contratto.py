@@ -0,0 +1,79 @@
+"""
+Allinea il registro monte ore (utilizzi_contratto) agli addebiti esistenti
+Uso: python backfill_utilizzi_contratto.py
+
+Per ogni attività addebitata a monte ore registra la differenza tra
+ore_addebitate e le ore già scalate, poi ricalcola ore_utilizzate e stato
+di tutti i contratti monte ore in un solo passaggio. Su PostgreSQL rimuove il
+vecchio trigger calcola_ore_residue (ora se ne occupa l'applicazione).
+Gli indici del registro su database esistenti: python add_missing_indexes.py
+Rieseguibile.
+"""
+import os
+import sys
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, select, text
+
+from app.database import SessionLocal, engine
+from app.models import Attivita, TipoAddebito, UtilizzoContratto
+from app.services.monte_ore import CENTESIMI, ricalcolo_ore_utilizzate
+
+
+def migrate():
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    db = SessionLocal()
+    try:
+        if engine.dialect.name == "postgresql":
+            db.execute(text("DROP TRIGGER IF EXISTS trigger_calcola_ore_residue ON utilizzi_contratto"))
+            db.execute(text("DROP FUNCTION IF EXISTS calcola_ore_residue()"))
+
+        registrate = {
+            (attivita_id, contratto_id): Decimal(str(ore or 0)).quantize(CENTESIMI)
+            for attivita_id, contratto_id, ore in db.execute(
+                select(UtilizzoContratto.attivita_id, UtilizzoContratto.contratto_cliente_id,
+                       func.sum(UtilizzoContratto.ore_scalate))
+                .where(UtilizzoContratto.attivita_id.isnot(None))
+                .group_by(UtilizzoContratto.attivita_id, UtilizzoContratto.contratto_cliente_id)
+            )
+        }
+        addebiti = db.execute(
+            select(Attivita.id, Attivita.contratto_cliente_id, Attivita.voce_contratto_id, Attivita.ore_addebitate)
+            .where(
+                Attivita.tipo_addebito == TipoAddebito.monte_ore,
+                Attivita.contratto_cliente_id.isnot(None),
+                Attivita.ore_addebitate.isnot(None)
+            )
+        ).all()
+
+        nuovi = []
+        for attivita_id, contratto_id, voce_id, ore in addebiti:
+            delta = Decimal(str(ore)).quantize(CENTESIMI) - registrate.get((attivita_id, contratto_id), Decimal(0))
+            if delta:
+                nuovi.append(UtilizzoContratto(
+                    contratto_cliente_id=contratto_id,
+                    attivita_id=attivita_id,
+                    voce_contratto_cliente_id=voce_id,
+                    ore_scalate=delta,
+                    data_utilizzo=date.today(),
+                    note="Allineamento registro monte ore"
+                ))
+        db.add_all(nuovi)
+        db.flush()
+
+        ricalcolati = [db.execute(stmt).rowcount for stmt in ricalcolo_ore_utilizzate()][0]
+        db.commit()
+        print(f"✅ Utilizzi registrati: {len(nuovi)}, contratti ricalcolati: {ricalcolati}")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        db.rollback()
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
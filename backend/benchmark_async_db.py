@@ -0,0 +1,140 @@
+"""
+Benchmark latenza: sessione sync dentro endpoint async vs sessione async
+Uso: python benchmark_async_db.py [--clients 12] [--requests 400] [--query-ms 20]
+
+Avvia due endpoint identici (lista richieste) su un database SQLite temporaneo:
+- /sync  usa get_db (query bloccante dentro async def, come i router originali)
+- /async usa get_async_db (aiosqlite, l'event loop resta libero)
+Ogni query ha una latenza artificiale (--query-ms) per simulare un DB remoto.
+Stampa p50/p95/p99 con N client concorrenti.
+
+Nota: con più client della dimensione del pool (5 + 10 overflow) la modalità
+sync si blocca fino al pool timeout: l'event loop resta fermo in attesa di una
+connessione che può essere rilasciata solo dall'event loop stesso.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("ASYNC_DATABASE_URL", "")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import event, func, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import Base, engine, async_engine, SessionLocal, get_db, get_async_db  # noqa: E402
+from app.models import Cliente, Richiesta  # noqa: E402
+
+QUERY_MS = 20
+
+
+def _register_sleep(dbapi_connection, connection_record):
+    """Funzione SQL sleep_ms(n) per simulare latenza di rete/DB"""
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+        return 1
+    dbapi_connection.create_function("sleep_ms", 1, sleep_ms)
+
+
+event.listen(engine, "connect", _register_sleep)
+event.listen(async_engine.sync_engine, "connect", _register_sleep)
+
+
+def _lista_query():
+    return (
+        select(Richiesta)
+        .where(select(func.sleep_ms(QUERY_MS)).scalar_subquery() == 1)
+        .order_by(Richiesta.created_at.desc())
+        .limit(50)
+    )
+
+
+app = FastAPI()
+
+
+@app.get("/sync")
+async def lista_sync(db: Session = Depends(get_db)):
+    return len(db.execute(_lista_query()).scalars().all())
+
+
+@app.get("/async")
+async def lista_async(db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(_lista_query())
+    return len(result.scalars().all())
+
+
+def seed(n: int = 500) -> None:
+    """Crea tabelle e richieste di esempio"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    cliente = Cliente(ragione_sociale="Benchmark Srl", email_principale="bench@example.com")
+    db.add(cliente)
+    db.flush()
+    db.add_all([
+        Richiesta(cliente_id=cliente.id, descrizione=f"Richiesta {i}", numero_richiesta=i)
+        for i in range(n)
+    ])
+    db.commit()
+    db.close()
+
+
+async def run(path: str, clients: int, requests: int) -> list:
+    """Esegue `requests` chiamate con `clients` client concorrenti, ritorna latenze in ms"""
+    latenze = []
+    coda = asyncio.Queue()
+    for _ in range(requests):
+        coda.put_nowait(None)
+
+    async def client(http: httpx.AsyncClient):
+        while not coda.empty():
+            coda.get_nowait()
+            start = time.perf_counter()
+            response = await http.get(path)
+            latenze.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        await asyncio.gather(*(client(http) for _ in range(clients)))
+    return latenze
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[k]
+
+
+def main():
+    global QUERY_MS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=12)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--query-ms", type=int, default=20)
+    args = parser.parse_args()
+    QUERY_MS = args.query_ms
+
+    seed()
+    print(f"Client concorrenti: {args.clients}, richieste: {args.requests}, latenza query: {QUERY_MS} ms\n")
+    print(f"{'modalità':<8} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>8}")
+    for nome, path in (("sync", "/sync"), ("async", "/async")):
+        start = time.perf_counter()
+        latenze = asyncio.run(run(path, args.clients, args.requests))
+        durata = time.perf_counter() - start
+        print(
+            f"{nome:<8} {statistics.median(latenze):>7.1f}ms {percentile(latenze, 95):>7.1f}ms "
+            f"{percentile(latenze, 99):>7.1f}ms {len(latenze) / durata:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark rendering email: template precompilati vs costruzione a ogni invio
+Uso: python benchmark_email_templates.py [--emails 20000]
+
+Misura email/s per:
+- creazione dell'ambiente Jinja2 a ogni email (equivalente a non avere cache)
+- template precompilati con contesti tutti diversi (es. link personali)
+- template precompilati con contesto ripetuto (promemoria identici, cache render)
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.email_templates import EmailTemplates  # noqa: E402
+
+
+def misura(nome: str, n: int, fn) -> None:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    durata = time.perf_counter() - start
+    print(f"{nome:<32} {n / durata:>10.0f} email/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=20000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    templates = EmailTemplates()
+    print(f"Compilazione {len(templates.templates)} template: {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    misura(
+        "senza precompilazione", max(args.emails // 100, 10),
+        lambda i: EmailTemplates().render("verifica_email.html", nome=f"Utente {i}", verification_url=f"http://x/{i}")
+    )
+    misura(
+        "precompilati, contesti unici", args.emails,
+        lambda i: templates.render("verifica_email.html", nome=f"Utente {i}", verification_url=f"http://x/{i}")
+    )
+    misura(
+        "precompilati, contesto ripetuto", args.emails,
+        lambda i: templates.render("notifica.txt", messaggio="Promemoria: scadenza contratto a fine mese")
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark serializzazione liste: ORM + Pydantic + json vs colonne + orjson
+Uso: python benchmark_list_serialization.py [--rows 500] [--rounds 20]
+
+Su un database SQLite temporaneo con --rows richieste misura righe/s per:
+- ORM + response_model + json stdlib (percorso FastAPI originale)
+- ORM + response_model + orjson (solo default_response_class)
+- colonne + dict + orjson (percorso veloce delle liste, utils/serialization)
+La query è inclusa nella misura: conta anche la creazione delle istanze ORM.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("ASYNC_DATABASE_URL", "")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import orjson  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app.database import Base, engine, SessionLocal, AsyncSessionLocal  # noqa: E402
+from app.models import Cliente, Richiesta  # noqa: E402
+from app.schemas import RichiestaResponse  # noqa: E402
+from app.utils import colonne_risposta, righe_dict  # noqa: E402
+
+COLONNE = colonne_risposta(Richiesta, RichiestaResponse)
+ADAPTER = TypeAdapter(list[RichiestaResponse])
+
+
+def popola(n: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    cliente = Cliente(ragione_sociale="Benchmark Srl", email_principale="bench@example.com")
+    db.add(cliente)
+    db.flush()
+    now = datetime.utcnow()
+    db.add_all(
+        Richiesta(
+            cliente_id=cliente.id,
+            numero_richiesta=i + 1,
+            descrizione=f"Richiesta di prova {i} con una descrizione di lunghezza realistica",
+            created_at=now - timedelta(minutes=i),
+        )
+        for i in range(n)
+    )
+    db.commit()
+    db.close()
+
+
+async def orm_json(limit: int) -> bytes:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(Richiesta).limit(limit))).scalars().all()
+    return json.dumps(ADAPTER.dump_python(ADAPTER.validate_python(rows, from_attributes=True), mode="json")).encode()
+
+
+async def orm_orjson(limit: int) -> bytes:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(Richiesta).limit(limit))).scalars().all()
+    return orjson.dumps(ADAPTER.dump_python(ADAPTER.validate_python(rows, from_attributes=True), mode="json"))
+
+
+async def colonne_orjson(limit: int) -> bytes:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(*COLONNE).limit(limit))).all()
+    return orjson.dumps(righe_dict(rows, COLONNE))
+
+
+async def misura(nome: str, fn, rows: int, rounds: int) -> float:
+    await fn(rows)  # warm-up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await fn(rows)
+    durata = time.perf_counter() - start
+    righe_s = rows * rounds / durata
+    print(f"{nome:<32} {righe_s:>10.0f} righe/s  {durata / rounds * 1000:>7.1f} ms/pagina")
+    return righe_s
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    popola(args.rows)
+    print(f"Pagina di {args.rows} RichiestaResponse, {args.rounds} ripetizioni\n")
+
+    base = await misura("ORM + Pydantic + json", orm_json, args.rows, args.rounds)
+    await misura("ORM + Pydantic + orjson", orm_orjson, args.rows, args.rounds)
+    veloce = await misura("colonne + orjson", colonne_orjson, args.rows, args.rounds)
+    print(f"\nPercorso veloce: {veloce / base:.1f}x")
+
+    identici = json.loads(await orm_json(args.rows)) == json.loads(await colonne_orjson(args.rows))
+    print("✅ Output identico" if identici else "❌ Output diverso tra i due percorsi")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
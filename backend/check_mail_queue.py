@@ -0,0 +1,155 @@
+"""
+Verifica la coda email contro un server SMTP locale (aiosmtpd)
+Uso: python check_mail_queue.py [--messages 200]
+
+Avvia un server SMTP di prova su una porta libera e controlla che:
+- l'accodamento non blocchi l'event loop (tempo di enqueue)
+- i messaggi viaggino su una sola connessione persistente (un solo EHLO)
+- un errore temporaneo (421) venga ritentato e uno definitivo (550) scartato,
+  sia su DATA sia su RCPT (destinatario rifiutato)
+- allo spegnimento i messaggi ancora in attesa di ritentativo siano contati
+  tra i falliti
+Esce con codice 1 se un controllo fallisce.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+from email.mime.text import MIMEText
+
+
+def _porta_libera() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+PORT = _porta_libera()
+os.environ.update(
+    SMTP_HOST="127.0.0.1", SMTP_PORT=str(PORT), SMTP_STARTTLS="false",
+    SMTP_USER="", SMTP_PASSWORD="", SMTP_RETRY_BACKOFF_SECONDS="0.1",
+)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiosmtpd.controller import Controller  # noqa: E402
+
+from app.services.mail_queue import MailQueue  # noqa: E402
+
+
+class ServerProva:
+    """Handler aiosmtpd: conta connessioni, salva messaggi, simula errori"""
+
+    def __init__(self):
+        self.messaggi = []
+        self.ehlo = 0
+        self.risposte_errore = []
+        self.rcpt_rifiutati = {}  # destinatario -> risposta al RCPT
+        self.rcpt_tentativi = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        self.rcpt_tentativi[address] = self.rcpt_tentativi.get(address, 0) + 1
+        if address in self.rcpt_rifiutati:
+            return self.rcpt_rifiutati[address]
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.ehlo += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.risposte_errore:
+            return self.risposte_errore.pop(0)
+        self.messaggi.append(envelope)
+        return "250 OK"
+
+
+def _messaggio(destinatario: str) -> MIMEText:
+    msg = MIMEText("Messaggio di prova")
+    msg["Subject"] = "Prova coda email"
+    msg["From"] = "noreply@example.com"
+    msg["To"] = destinatario
+    return msg
+
+
+async def verifica(n: int, server: ServerProva) -> int:
+    errori = 0
+    coda = MailQueue()
+
+    start = time.perf_counter()
+    for i in range(n):
+        coda.enqueue(_messaggio(f"utente{i}@example.com"))
+    enqueue_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    await coda.flush(timeout=60)
+    invio_s = time.perf_counter() - start
+    print(f"Accodati {n} messaggi in {enqueue_ms:.1f} ms, inviati in {invio_s:.2f}s")
+    if len(server.messaggi) != n:
+        errori += 1
+        print(f"FAIL  ricevuti {len(server.messaggi)}/{n} messaggi")
+    if server.ehlo != 1:
+        errori += 1
+        print(f"FAIL  {server.ehlo} connessioni SMTP, attesa 1")
+    else:
+        print("OK    connessione SMTP persistente (1 EHLO)")
+
+    server.messaggi.clear()
+    server.risposte_errore = ["421 Riprova piu tardi", "550 Utente inesistente"]
+    coda.enqueue(_messaggio("temporaneo@example.com"))
+    coda.enqueue(_messaggio("definitivo@example.com"))
+    await coda.flush(timeout=10)
+    ricevuti = [m.rcpt_tos[0] for m in server.messaggi]
+    if ricevuti == ["temporaneo@example.com"] and coda.falliti == 1:
+        print("OK    421 ritentato, 550 scartato")
+    else:
+        errori += 1
+        print(f"FAIL  ricevuti {ricevuti}, falliti {coda.falliti}")
+
+    server.messaggi.clear()
+    server.rcpt_rifiutati = {"rcpt550@example.com": "550 Utente inesistente"}
+    falliti = coda.falliti
+    coda.enqueue(_messaggio("rcpt550@example.com"))
+    coda.enqueue(_messaggio("dopo@example.com"))
+    await coda.flush(timeout=10)
+    ricevuti = [m.rcpt_tos[0] for m in server.messaggi]
+    tentativi = server.rcpt_tentativi.get("rcpt550@example.com")
+    if ricevuti == ["dopo@example.com"] and coda.falliti == falliti + 1 and tentativi == 1:
+        print("OK    550 al RCPT scartato senza ritentativi")
+    else:
+        errori += 1
+        print(f"FAIL  ricevuti {ricevuti}, falliti {coda.falliti - falliti}, tentativi RCPT {tentativi}")
+
+    # Spegnimento con un messaggio in backoff (0.1 + 0.2 + 0.4 ... s): timeout prima del nuovo invio
+    server.risposte_errore = ["421 Riprova piu tardi"] * 6
+    falliti = coda.falliti
+    coda.enqueue(_messaggio("backoff@example.com"))
+    await asyncio.sleep(0.2)
+    await coda.stop(timeout=0.5)
+    if coda.falliti == falliti + 1:
+        print("OK    messaggio in backoff contato tra i falliti allo spegnimento")
+    else:
+        errori += 1
+        print(f"FAIL  falliti allo spegnimento {coda.falliti - falliti}, atteso 1")
+    return errori
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    server = ServerProva()
+    controller = Controller(server, hostname="127.0.0.1", port=PORT)
+    controller.start()
+    try:
+        errori = asyncio.run(verifica(args.messages, server))
+    finally:
+        controller.stop()
+    sys.exit(1 if errori else 0)
+
+
+if __name__ == "__main__":
+    main()
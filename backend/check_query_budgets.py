@@ -0,0 +1,95 @@
+"""
+Verifica che gli endpoint di dettaglio restino nel loro budget di query
+Uso: python check_query_budgets.py
+
+Crea un database SQLite temporaneo con dati di esempio (richiesta con molte
+attività, cliente con molte sedi, contratto con molte voci) e chiama gli
+endpoint contando le query SQL: esce con codice 1 se un budget è superato,
+ad esempio per un N+1 introdotto da una relazione non caricata.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "query_budgets.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import (  # noqa: E402
+    Utente, UserRole, Cliente, SedeCliente, Richiesta, Attivita, TimeEntry,
+    MessaggioChat, Contratto, VoceContratto, TipoContratto,
+)
+from app.utils import get_password_hash, create_access_token  # noqa: E402
+from app.utils.query_counter import assert_max_queries  # noqa: E402
+
+N = 25  # righe figlie per relazione: con un N+1 il conteggio esplode
+
+
+def seed() -> dict:
+    """Inserisce dati di esempio e ritorna gli id da interrogare"""
+    db = SessionLocal()
+    admin = Utente(
+        email="budget@example.com", password_hash=get_password_hash("password"),
+        nome="Budget", cognome="Check", ruolo=UserRole.admin
+    )
+    db.add(admin)
+    db.flush()
+    cliente = Cliente(ragione_sociale="Budget Srl", email_principale="cliente@example.com")
+    cliente.sedi = [SedeCliente(nome_sede=f"Sede {i}", indirizzo=f"Via {i}") for i in range(N)]
+    richiesta = Richiesta(cliente=cliente, descrizione="Richiesta budget", numero_richiesta=1)
+    richiesta.attivita = [
+        Attivita(descrizione=f"Attività {i}", time_entries=[TimeEntry(inizio=datetime.utcnow())])
+        for i in range(N)
+    ]
+    richiesta.messaggi = [MessaggioChat(messaggio=f"Messaggio {i}", autore_id=admin.id) for i in range(N)]
+    contratto = Contratto(nome_contratto="Budget", tipo=TipoContratto.monte_ore)
+    contratto.voci = [VoceContratto(nome_voce=f"Voce {i}") for i in range(N)]
+    db.add_all([cliente, richiesta, contratto])
+    db.commit()
+    ids = {
+        "admin": admin.id, "cliente": cliente.id,
+        "richiesta": richiesta.id, "contratto": contratto.id,
+    }
+    db.close()
+    return ids
+
+
+def main():
+    failures = 0
+    with TestClient(app) as client:
+        ids = seed()
+        token = create_access_token({"sub": ids["admin"], "email": "budget@example.com", "ruolo": "admin"})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # (endpoint, budget query) - utente autenticato già in cache
+        budgets = [
+            (f"/api/richieste/{ids['richiesta']}", 2),
+            (f"/api/clienti/{ids['cliente']}", 2),
+            (f"/api/contratti/templates/{ids['contratto']}", 2),
+            ("/api/contratti/templates", 2),
+            (f"/api/chat/richiesta/{ids['richiesta']}", 2),
+            ("/api/richieste/", 1),
+            ("/api/attivita/", 1),
+        ]
+        client.get("/api/auth/me", headers=headers)  # popola la cache utenti
+
+        for path, budget in budgets:
+            try:
+                with assert_max_queries(budget, path) as counter:
+                    response = client.get(path, headers=headers)
+                response.raise_for_status()
+                print(f"OK    {path:<55} {counter.count}/{budget} query")
+            except AssertionError as e:
+                failures += 1
+                print(f"FAIL  {e}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
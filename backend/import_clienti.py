@@ -0,0 +1,60 @@
+"""
+Import massivo di clienti e sedi da CSV o XLSX
+Uso: python import_clienti.py clienti.csv [--blocco 1000]
+
+Stesso percorso di POST /api/clienti/import: lettura in streaming,
+validazione con ClienteCreate, duplicati (email principale, partita IVA)
+scartati con una query per blocco, INSERT executemany e commit per blocco.
+Formato delle colonne: docstring di app/services/import_clienti.py.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import async_engine  # noqa: E402
+from app.services.import_clienti import formato_file, importa_clienti, leggi_righe  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file")
+    parser.add_argument("--blocco", type=int, default=None, help="Clienti per blocco (default IMPORT_CLIENTI_BLOCCO)")
+    args = parser.parse_args()
+
+    try:
+        formato = formato_file(args.file)
+    except ValueError as exc:
+        print(f"❌ {exc}")
+        sys.exit(1)
+
+    print(f"Database: {async_engine.url.render_as_string(hide_password=True)}")
+    riepilogo = {}
+    with open(args.file, "rb") as file:
+        async for avanzamento in importa_clienti(leggi_righe(file, formato), args.blocco):
+            if "completato" in avanzamento:
+                riepilogo = avanzamento
+                continue
+            print(
+                f"  riga {avanzamento['righe']}: {avanzamento['importati']} importati, "
+                f"{avanzamento['duplicati']} duplicati, {avanzamento['scartati']} scartati"
+            )
+    await async_engine.dispose()
+
+    for errore in riepilogo["errori"]:
+        print(f"  riga {errore['riga']}: {errore['errore']}")
+    durata = riepilogo["durata_ms"] / 1000
+    print(
+        f"{'✅' if riepilogo['completato'] else '❌'} {riepilogo['importati']} clienti e {riepilogo['sedi']} sedi "
+        f"importati in {durata:.1f}s ({riepilogo['importati'] / max(durata, 0.001):.0f} clienti/s), "
+        f"{riepilogo['duplicati']} duplicati, {riepilogo['scartati']} scartati"
+    )
+    if riepilogo["errore"]:
+        print(f"❌ {riepilogo['errore']}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
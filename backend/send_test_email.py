@@ -8,6 +8,10 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.email_templates import render_email  # noqa: E402
+
 # Carica configurazione da .env
 env_path = Path(__file__).parent / ".env"
 config = {}
@@ -30,84 +34,10 @@ EMAIL_FROM = config.get("EMAIL_FROM", "noreply@example.com")
 def send_test_email(to_email: str):
     """Invia email di test"""
     
-    # Template HTML
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                color: #333;
-            }}
-            .container {{
-                max-width: 600px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            .header {{
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                padding: 30px;
-                text-align: center;
-                border-radius: 10px 10px 0 0;
-            }}
-            .content {{
-                background: #f9f9f9;
-                padding: 30px;
-                border-radius: 0 0 10px 10px;
-            }}
-            .info {{
-                background: #fff;
-                padding: 15px;
-                border-radius: 5px;
-                margin: 15px 0;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>Test Email - Ticket Platform</h1>
-            </div>
-            <div class="content">
-                <h2>Email di Test Inviata con Successo!</h2>
-                <p>Questa è un'email di test per verificare la configurazione SMTP.</p>
-                
-                <div class="info">
-                    <h3>Configurazione SMTP:</h3>
-                    <ul>
-                        <li><strong>Host:</strong> {SMTP_HOST}</li>
-                        <li><strong>Porta:</strong> {SMTP_PORT}</li>
-                        <li><strong>User:</strong> {SMTP_USER or '(nessuno)'}</li>
-                        <li><strong>From:</strong> {EMAIL_FROM}</li>
-                        <li><strong>To:</strong> {to_email}</li>
-                    </ul>
-                </div>
-                
-                <p>Se ricevi questa email, la configurazione SMTP è corretta!</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    # Versione testo
-    text = f"""
-    Test Email - Ticket Platform
-    
-    Email di test inviata con successo!
-    
-    Configurazione SMTP:
-    - Host: {SMTP_HOST}
-    - Porta: {SMTP_PORT}
-    - User: {SMTP_USER or '(nessuno)'}
-    - From: {EMAIL_FROM}
-    - To: {to_email}
-    
-    Se ricevi questa email, la configurazione SMTP è corretta!
-    """
+    # Corpo dai template email dell'app (stesso layout delle email reali)
+    context = dict(host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, email_from=EMAIL_FROM, to_email=to_email)
+    html = render_email("test_email.html", **context)
+    text = render_email("test_email.txt", **context)
     
     # Crea messaggio
     msg = MIMEMultipart('alternative')
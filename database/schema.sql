@@ -5,6 +5,7 @@
 
 -- Estensioni necessarie
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- =============================================
 -- TABELLA: UTENTI
@@ -32,6 +33,8 @@ CREATE TABLE clienti (
     ragione_sociale VARCHAR(255) NOT NULL,
     partita_iva VARCHAR(20),
     codice_fiscale VARCHAR(20),
+    nome_alternativo VARCHAR(255), -- Alias / nome commerciale
+    codice_gestionale_esterno VARCHAR(50), -- Codice nel gestionale contabile
     email_principale VARCHAR(255) NOT NULL,
     email_secondarie TEXT[], -- Array di email
     telefoni TEXT[], -- Array di telefoni
@@ -143,6 +146,8 @@ CREATE TABLE richieste (
     validata_da_id UUID REFERENCES utenti(id),
     validata_il TIMESTAMP,
     scadenza_validazione DATE,
+    -- Tempo lavorato (somma dei minuti delle attività, aggiornata al checkout)
+    minuti_totali INTEGER NOT NULL DEFAULT 0,
     -- Campi riapertura
     riaperta_il TIMESTAMP,
     motivazione_riapertura TEXT,
@@ -186,6 +191,8 @@ CREATE TABLE attivita (
     ore_addebitate DECIMAL(5, 2),
     -- Allegati (paths relativi o URLs)
     allegati TEXT[],
+    -- Tempo lavorato (somma di time_entries.durata_minuti, aggiornata al checkout)
+    minuti_totali INTEGER NOT NULL DEFAULT 0,
     -- Metadata
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -391,6 +398,63 @@ CREATE TABLE messaggi_chat (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Contatori messaggi non letti per utente e richiesta
+CREATE TABLE chat_non_letti (
+    utente_id UUID REFERENCES utenti(id) ON DELETE CASCADE,
+    richiesta_id UUID REFERENCES richieste(id) ON DELETE CASCADE,
+    non_letti INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (utente_id, richiesta_id)
+);
+
+-- Brogliaccio: note rapide dell'utente con versione per il delta sync
+CREATE TABLE brogliaccio (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    utente_id UUID NOT NULL REFERENCES utenti(id) ON DELETE CASCADE,
+    contenuto TEXT NOT NULL,
+    tipo VARCHAR(20) DEFAULT 'text',
+    media_url VARCHAR(500),
+    metadata_json JSONB,
+    stato VARCHAR(20) DEFAULT 'draft',
+    versione INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tombstone delle voci eliminate (propagate ai client con il delta sync)
+CREATE TABLE brogliaccio_eliminati (
+    id UUID PRIMARY KEY,
+    utente_id UUID NOT NULL REFERENCES utenti(id) ON DELETE CASCADE,
+    versione INTEGER NOT NULL,
+    eliminato_il TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Contatore delle modifiche al brogliaccio per utente
+CREATE TABLE brogliaccio_versioni (
+    utente_id UUID PRIMARY KEY REFERENCES utenti(id) ON DELETE CASCADE,
+    versione INTEGER NOT NULL DEFAULT 0,
+    versione_minima INTEGER NOT NULL DEFAULT 0
+);
+
+-- Esiti delle operazioni batch del brogliaccio per chiave di idempotenza
+CREATE TABLE brogliaccio_idempotenza (
+    utente_id UUID NOT NULL REFERENCES utenti(id) ON DELETE CASCADE,
+    chiave VARCHAR(100) NOT NULL,
+    esito JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (utente_id, chiave)
+);
+
+-- Tombstone degli eventi del calendario eliminati (refresh con updated_since)
+CREATE TABLE calendario_eliminati (
+    id UUID PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL,
+    creato_da_id UUID,
+    supervisore_id UUID,
+    ambito_id UUID,
+    eliminato_il TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- =============================================
 -- INDICI PER PERFORMANCE
 -- =============================================
@@ -404,6 +468,39 @@ CREATE INDEX idx_contratti_clienti_stato ON contratti_clienti(stato);
 CREATE INDEX idx_time_entries_attivita ON time_entries(attivita_id);
 CREATE INDEX idx_schedules_prossimo_trigger ON schedules(prossimo_trigger);
 CREATE INDEX idx_messaggi_richiesta ON messaggi_chat(richiesta_id);
+CREATE INDEX ix_clienti_nome_alternativo ON clienti(nome_alternativo);
+CREATE INDEX ix_clienti_codice_gestionale_esterno ON clienti(codice_gestionale_esterno);
+-- Paginazione keyset (ORDER BY data DESC NULLS LAST, id DESC)
+CREATE INDEX idx_richieste_created_at_id ON richieste(created_at DESC NULLS LAST, id DESC);
+CREATE INDEX idx_attivita_data_prevista_id ON attivita(data_prevista DESC NULLS LAST, id DESC);
+CREATE INDEX idx_contratti_clienti_created_at_id ON contratti_clienti(created_at DESC NULLS LAST, id DESC);
+-- Calendario (finestra su data_appuntamento/data_prevista, refresh con updated_since)
+CREATE INDEX idx_richieste_data_appuntamento ON richieste(data_appuntamento);
+CREATE INDEX idx_richieste_updated_at ON richieste(updated_at);
+CREATE INDEX idx_attivita_updated_at ON attivita(updated_at);
+CREATE INDEX idx_calendario_eliminati_eliminato_il ON calendario_eliminati(eliminato_il);
+-- Cronologia chat (since_id / before)
+CREATE INDEX idx_messaggi_richiesta_created_at ON messaggi_chat(richiesta_id, created_at, id);
+-- Brogliaccio: modifiche dopo una versione (delta sync)
+CREATE INDEX idx_brogliaccio_utente_versione ON brogliaccio(utente_id, versione);
+CREATE INDEX idx_brogliaccio_eliminati_utente_versione ON brogliaccio_eliminati(utente_id, versione);
+-- Clienti: duplicati per email e partita IVA (creazione e import)
+CREATE INDEX idx_clienti_email_principale ON clienti(email_principale);
+CREATE INDEX idx_clienti_partita_iva ON clienti(partita_iva);
+CREATE INDEX idx_sedi_clienti_cliente ON sedi_clienti(cliente_id);
+-- Validazione automatica (risolte con scadenza passata)
+CREATE INDEX idx_richieste_stato_scadenza_validazione ON richieste(stato, scadenza_validazione);
+-- Registro monte ore (ricalcolo per contratto, storni per attività)
+CREATE INDEX idx_utilizzi_contratto_contratto ON utilizzi_contratto(contratto_cliente_id, created_at);
+CREATE INDEX idx_utilizzi_contratto_attivita ON utilizzi_contratto(attivita_id);
+-- Un solo timer aperto per tecnico e attività (check-in atomico)
+CREATE UNIQUE INDEX uq_time_entries_aperti ON time_entries(tecnico_id, attivita_id) WHERE fine IS NULL;
+-- Ricerca full-text (/api/search): stesse espressioni di models/search_index.py
+CREATE INDEX idx_clienti_fts ON clienti USING gin (to_tsvector('simple'::regconfig, (((((coalesce(ragione_sociale, '') || ' ') || coalesce(partita_iva, '')) || ' ') || coalesce(codice_fiscale, '')) || ' ') || coalesce(email_principale, '')));
+CREATE INDEX idx_clienti_ragione_sociale_trgm ON clienti USING gin (ragione_sociale gin_trgm_ops);
+CREATE INDEX idx_sedi_clienti_citta_fts ON sedi_clienti USING gin (to_tsvector('simple'::regconfig, coalesce(citta, '')));
+CREATE INDEX idx_richieste_fts ON richieste USING gin (to_tsvector('italian'::regconfig, coalesce(descrizione, '')));
+CREATE INDEX idx_utenti_fts ON utenti USING gin (to_tsvector('simple'::regconfig, (((coalesce(nome, '') || ' ') || coalesce(cognome, '')) || ' ') || coalesce(email, '')));
 
 -- =============================================
 -- TRIGGER: Updated_at automatico
@@ -427,32 +524,7 @@ CREATE TRIGGER update_contratti_updated_at BEFORE UPDATE ON contratti FOR EACH R
 CREATE TRIGGER update_contratti_clienti_updated_at BEFORE UPDATE ON contratti_clienti FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
 -- =============================================
--- TRIGGER: Calcolo ore_residue contratti
+-- Monte ore: ore_utilizzate e stato 'esaurito' sono aggiornati
+-- dall'applicazione insieme a utilizzi_contratto (app/services/monte_ore.py),
+-- con lo stesso comportamento su PostgreSQL e SQLite.
 -- =============================================
-CREATE OR REPLACE FUNCTION calcola_ore_residue()
-RETURNS TRIGGER AS $$
-BEGIN
-    -- Aggiorna ore_utilizzate nel contratto cliente
-    UPDATE contratti_clienti
-    SET ore_utilizzate = (
-        SELECT COALESCE(SUM(ore_scalate), 0)
-        FROM utilizzi_contratto
-        WHERE contratto_cliente_id = NEW.contratto_cliente_id
-    )
-    WHERE id = NEW.contratto_cliente_id;
-    
-    -- Verifica se esaurito
-    UPDATE contratti_clienti
-    SET stato = 'esaurito'
-    WHERE id = NEW.contratto_cliente_id
-    AND tipo = 'monte_ore'
-    AND ore_totali IS NOT NULL
-    AND ore_utilizzate >= ore_totali;
-    
-    RETURN NEW;
-END;
-$$ language 'plpgsql';
-
-CREATE TRIGGER trigger_calcola_ore_residue 
-AFTER INSERT ON utilizzi_contratto 
-FOR EACH ROW EXECUTE FUNCTION calcola_ore_residue();